@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Times the Mitsuba exporter on synthetic scenes, without Maya.
+
+The exporter runs against the in-memory maya.cmds stand-in from the fakemaya
+directory. The plugin is initialized as in Maya, so every node type gets the
+attributes and defaults of its initializer. Results are written as JSON so that
+runs from different commits can be compared with --compare.
+
+Usage
+-----
+    python benchmarkExport.py --meshes 200 --materials 20 --depth 3 \\
+        --lights 4 --frames 10 --output results.json
+    python benchmarkExport.py --compare results.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+pluginsDir = os.path.join(benchmarkDir, '..', 'plug-ins')
+
+sys.path.insert(0, os.path.join(benchmarkDir, 'fakemaya'))
+sys.path.append(pluginsDir)
+sys.path.append(os.path.join(pluginsDir, 'mitsuba', 'renderer'))
+sys.path.append(os.path.join(pluginsDir, 'mitsuba', 'util'))
+
+from maya import cmds
+
+import scenes
+
+__all__ = ['initializePlugin',
+           'timeFunction',
+           'runBenchmarks',
+           'compareResults']
+
+
+class quiet(object):
+    """
+    Discards what the exporter prints while it's being timed.
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, excType, excValue, traceback):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def initializePlugin():
+    with quiet():
+        import MitsubaForMaya
+        MitsubaForMaya.initializePlugin(None)
+
+
+def timeFunction(function, repeat=3, setup=None):
+    """
+    Runs *function* *repeat* times and returns its wall clock times and the
+    maya.cmds calls made by the last run.
+    """
+
+    times = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        cmds.callCounts.clear()
+        with quiet():
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+
+    times.sort()
+    return {
+        'runs' : times,
+        'min' : times[0],
+        'median' : times[len(times)//2],
+        'mean' : sum(times)/len(times),
+        'cmdsCalls' : sum(cmds.callCounts.values()),
+        'cmdsCallsByCommand' : dict(cmds.callCounts),
+    }
+
+
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=benchmarkDir, stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(sceneParameters, repeat=3, renderDir=None):
+    # The module the plugin registered its material types with
+    from mitsuba.renderer import MitsubaRendererIO
+
+    renderSettings = scenes.createScene(**sceneParameters)
+    frames = sceneParameters.get('frames', 1)
+
+    removeRenderDir = renderDir is None
+    if removeRenderDir:
+        renderDir = tempfile.mkdtemp(prefix='mitsubaBenchmark')
+    outFileName = os.path.join(renderDir, 'benchmark.xml')
+
+    results = {}
+    try:
+        cmds.currentTime(1)
+
+        results['getRenderableGeometry'] = timeFunction(
+            MitsubaRendererIO.getRenderableGeometry, repeat)
+
+        geoms = MitsubaRendererIO.getRenderableGeometry()
+        results['writeMaterials'] = timeFunction(
+            lambda: MitsubaRendererIO.writeMaterials(geoms), repeat)
+
+        with quiet():
+            (sceneElement, geometryFiles) = MitsubaRendererIO.getSceneElement(renderDir, renderSettings)
+        results['writeElementText'] = timeFunction(
+            lambda: MitsubaRendererIO.writeElementText(sceneElement), repeat)
+
+        # One export per frame of the frame range
+        def writeSceneFrames():
+            for frame in range(1, frames + 1):
+                cmds.currentTime(frame)
+                MitsubaRendererIO.writeScene(outFileName, renderDir, renderSettings)
+        results['writeScene'] = timeFunction(writeSceneFrames, repeat)
+        results['writeScene']['frames'] = frames
+        results['writeScene']['bytesWritten'] = sum(
+            os.path.getsize(os.path.join(renderDir, x)) for x in os.listdir(renderDir))
+
+        # Per-stage breakdown of the export of the first frame
+        from mitsuba.renderer import MitsubaRendererStatistics
+        statistics = MitsubaRendererStatistics.ExportStatistics()
+        statistics.countCommands(cmds)
+        try:
+            with quiet():
+                cmds.currentTime(1)
+                MitsubaRendererIO.writeScene(outFileName, renderDir, renderSettings, statistics)
+        finally:
+            statistics.restoreCommands()
+        results['writeScene']['stages'] = statistics.toDict()['stages']
+    finally:
+        if removeRenderDir:
+            shutil.rmtree(renderDir, ignore_errors=True)
+
+    return results
+
+
+def compareResults(previous, current):
+    print( "%-24s %12s %12s %8s" % ("Benchmark", "Previous", "Current", "Ratio") )
+    for name in sorted(current['results']):
+        currentTime = current['results'][name]['median']
+        if name in previous.get('results', {}):
+            previousTime = previous['results'][name]['median']
+            ratio = currentTime/previousTime if previousTime else float('inf')
+            print( "%-24s %11.4fs %11.4fs %7.2fx" % (name, previousTime, currentTime, ratio) )
+        else:
+            print( "%-24s %12s %11.4fs %8s" % (name, "-", currentTime, "-") )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the Mitsuba exporter on a synthetic scene.')
+    parser.add_argument('--meshes', type=int, default=100)
+    parser.add_argument('--materials', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=2,
+        help='depth of the blend and mixture material trees')
+    parser.add_argument('--lights', type=int, default=3)
+    parser.add_argument('--resolution', type=int, default=16,
+        help='each mesh is a grid of resolution x resolution quads')
+    parser.add_argument('--frames', type=int, default=1)
+    parser.add_argument('--untextured', action='store_true')
+    parser.add_argument('--deforming', action='store_true')
+    parser.add_argument('--instancers', type=int, default=1,
+        help='particle instancers, each placing one of the meshes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file for the results. Printed if not specified')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    args = parser.parse_args()
+
+    sceneParameters = {
+        'meshes' : args.meshes,
+        'materials' : args.materials,
+        'depth' : args.depth,
+        'lights' : args.lights,
+        'resolution' : args.resolution,
+        'frames' : args.frames,
+        'textured' : not args.untextured,
+        'deforming' : args.deforming,
+        'instancers' : args.instancers,
+    }
+
+    # Reuse the scene of the previous run so the numbers are comparable
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        sceneParameters = previous['scene']
+
+    initializePlugin()
+
+    results = {
+        'commit' : getCommit(),
+        'date' : datetime.datetime.now().isoformat(),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'repeat' : args.repeat,
+        'scene' : sceneParameters,
+        'results' : runBenchmarks(sceneParameters, args.repeat),
+    }
+
+    resultsText = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(resultsText)
+    elif not previous:
+        print( resultsText )
+
+    if previous:
+        compareResults(previous, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Times the streaming binary mesh writer on a synthetic grid mesh and reports
+its peak memory use, without Maya.
+
+The grid is generated and written one batch of rows at a time, the way the
+exporter hands batches of polygons to the writer, so peak memory should stay
+flat as the triangle count grows.
+
+A smaller grid is also exported the way the exporter writes meshes, reading
+it polygon by polygon through the fake maya.OpenMaya mesh iterator, once to
+its own file and twice to an archive, where the second frame splices in the
+first frame's uvs and triangles.
+
+Usage
+-----
+    python benchmarkMeshWriter.py --triangles 20000000
+    python benchmarkMeshWriter.py --triangles 2000000 --batch-rows 16
+    python benchmarkMeshWriter.py --triangles 0 --export-triangles 1000000
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+pluginsDir = os.path.join(benchmarkDir, '..', 'plug-ins')
+
+sys.path.insert(0, os.path.join(benchmarkDir, 'fakemaya'))
+sys.path.append(pluginsDir)
+sys.path.append(os.path.join(pluginsDir, 'mitsuba', 'renderer'))
+sys.path.append(os.path.join(pluginsDir, 'mitsuba', 'util'))
+
+from maya import cmds
+
+import MitsubaRendererMesh
+import scenes
+
+__all__ = ['getPeakMemory',
+           'writeGrid',
+           'runBenchmark',
+           'runExportBenchmark']
+
+
+def getPeakMemory():
+    """
+    Returns the peak resident memory of this process, in bytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak*1024
+
+
+def writeGrid(filename, resolution, batchRows=64, uvs=True):
+    """
+    Writes a grid of *resolution* x *resolution* quads, split into triangles,
+    with positions, normals and uvs generated *batchRows* rows at a time.
+    """
+
+    rowVertices = resolution + 1
+    vertexCount = rowVertices*rowVertices
+    triangleCount = 2*resolution*resolution
+
+    def rowBatches(rows):
+        for start in range(0, rows, batchRows):
+            yield range(start, min(rows, start + batchRows))
+
+    scale = 1.0/resolution
+    with MitsubaRendererMesh.SerializedMeshWriter(filename, vertexCount, triangleCount,
+        normals=True, uvs=uvs, name='grid') as writer:
+        for rows in rowBatches(rowVertices):
+            values = []
+            for j in rows:
+                z = j*scale - 0.5
+                for i in range(rowVertices):
+                    values.extend((i*scale - 0.5, 0.0, z))
+            writer.addPositions(values)
+
+        for rows in rowBatches(rowVertices):
+            writer.addNormals((0.0, 1.0, 0.0)*(len(rows)*rowVertices))
+
+        if uvs:
+            for rows in rowBatches(rowVertices):
+                values = []
+                for j in rows:
+                    v = 1.0 - j*scale
+                    for i in range(rowVertices):
+                        values.extend((i*scale, v))
+                writer.addUVs(values)
+
+        for rows in rowBatches(resolution):
+            indices = []
+            for j in rows:
+                for i in range(resolution):
+                    corner = j*rowVertices + i
+                    indices.extend((corner, corner + 1, corner + rowVertices + 1,
+                                    corner, corner + rowVertices + 1, corner + rowVertices))
+            writer.addTriangles(indices)
+
+    return (vertexCount, triangleCount)
+
+
+def runBenchmark(triangles, batchRows=64, uvs=True, outputDir=None):
+    resolution = max(1, int(math.ceil(math.sqrt(triangles/2.0))))
+
+    removeOutputDir = outputDir is None
+    if removeOutputDir:
+        outputDir = tempfile.mkdtemp(prefix='mitsubaMeshBenchmark')
+    filename = os.path.join(outputDir, 'grid.serialized')
+
+    try:
+        peakMemoryStart = getPeakMemory()
+        start = time.time()
+        (vertexCount, triangleCount) = writeGrid(filename, resolution, batchRows, uvs)
+        seconds = time.time() - start
+        peakMemory = getPeakMemory()
+
+        header = MitsubaRendererMesh.readSerializedHeader(filename)
+        if header[2:] != (vertexCount, triangleCount):
+            raise ValueError("Unexpected counts in the written header : %s" % str(header))
+
+        return {
+            'vertices' : vertexCount,
+            'triangles' : triangleCount,
+            'batchRows' : batchRows,
+            'seconds' : seconds,
+            'trianglesPerSecond' : triangleCount/seconds if seconds else None,
+            'bytesWritten' : os.path.getsize(filename),
+            'peakMemory' : peakMemory,
+            'peakMemoryGrowth' : peakMemory - peakMemoryStart,
+        }
+    finally:
+        if removeOutputDir:
+            shutil.rmtree(outputDir, ignore_errors=True)
+
+
+def runExportBenchmark(triangles, uvs=True, outputDir=None):
+    """
+    Exports a grid mesh of about *triangles* triangles from the fake scene with
+    the exporter's serialized mesh functions, which read it through the fake
+    maya.OpenMaya mesh iterator.
+    """
+
+    import MitsubaRendererIO
+
+    resolution = max(1, int(math.ceil(math.sqrt(triangles/2.0))))
+
+    cmds.resetScene()
+    shadingEngine = cmds.createNode('shadingEngine', name='gridSG')
+    geom = cmds.ls(scenes.createMesh('grid', resolution, shadingEngine, (0.0, 0.0, 0.0)), long=True)[0]
+
+    removeOutputDir = outputDir is None
+    if removeOutputDir:
+        outputDir = tempfile.mkdtemp(prefix='mitsubaMeshBenchmark')
+
+    try:
+        results = {
+            'triangles' : 2*resolution*resolution,
+        }
+
+        peakMemoryStart = getPeakMemory()
+        start = time.time()
+        filename = MitsubaRendererIO.exportGeometrySerialized(geom, outputDir, uvs)
+        seconds = time.time() - start
+        peakMemory = getPeakMemory()
+        results.update({
+            'seconds' : seconds,
+            'trianglesPerSecond' : results['triangles']/seconds if seconds else None,
+            'bytesWritten' : os.path.getsize(filename),
+            'peakMemory' : peakMemory,
+            'peakMemoryGrowth' : peakMemory - peakMemoryStart,
+        })
+
+        # The second frame has the first frame's topology
+        archive = MitsubaRendererMesh.SerializedArchive(os.path.join(outputDir, 'grid.archive.serialized'))
+        for frame in ['archiveFirstFrameSeconds', 'archiveSplicedFrameSeconds']:
+            start = time.time()
+            MitsubaRendererIO.exportGeometryToArchive(geom, archive, uvs)
+            results[frame] = time.time() - start
+
+        return results
+    finally:
+        if removeOutputDir:
+            shutil.rmtree(outputDir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the streaming binary mesh writer.')
+    parser.add_argument('--triangles', type=int, default=20000000)
+    parser.add_argument('--batch-rows', type=int, default=64,
+        help='grid rows generated and written per batch')
+    parser.add_argument('--export-triangles', type=int, default=200000,
+        help='triangles of the grid exported through the fake OpenMaya mesh iterator, 0 to skip it')
+    parser.add_argument('--no-uvs', action='store_true')
+    parser.add_argument('--output', help='JSON file for the results. Printed if not specified')
+    args = parser.parse_args()
+
+    results = {
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+    }
+    if args.triangles > 0:
+        results['results'] = runBenchmark(args.triangles, args.batch_rows, not args.no_uvs)
+    if args.export_triangles > 0:
+        results['export'] = runExportBenchmark(args.export_triangles, not args.no_uvs)
+
+    resultsText = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(resultsText)
+    else:
+        print( resultsText )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""
+Stand-in for maya.OpenMaya. Attribute function sets record the attributes
+created by the plugin's node initializers so that nodes created with the fake
+maya.cmds get the same attributes and default values as in Maya. Selection
+lists and DAG paths name the nodes of the fake scene, and the mesh iterator
+and function set read the geometry of its meshes.
+"""
+
+import math
+
+from maya import cmds
+
+kSuccess = 0
+kUnknownParameter = 1
+
+
+class MTypeId(object):
+    def __init__(self, id=0):
+        self.id = id
+
+
+class MFloatVector(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class MObject(object):
+    """
+    An attribute definition when created by an attribute function set.
+    """
+
+    def __init__(self, longName=None, shortName=None, default=None, fields=None):
+        self.longName = longName
+        self.shortName = shortName
+        self.default = default
+        self.fields = fields
+
+
+class MFnData(object):
+    kString = 'string'
+
+
+class MFnNumericData(object):
+    kBoolean = 'bool'
+    kInt = 'int'
+    kFloat = 'float'
+    kDouble = 'double'
+    k2Float = 'float2'
+    k3Float = 'float3'
+    k3Int = 'int3'
+
+    # Default values of compound types
+    compoundDefaults = {
+        'float2' : (0.0, 0.0),
+        'float3' : (0.0, 0.0, 0.0),
+        'int3' : (0, 0, 0),
+    }
+
+
+class MFnStringData(object):
+    def create(self, value=""):
+        return value
+
+
+class MFnAttribute(object):
+    def __init__(self):
+        self.attribute = None
+
+    def setDefault(self, *values):
+        if len(values) == 1:
+            self.attribute.default = values[0]
+        else:
+            self.attribute.default = tuple(values)
+
+    # Flags don't change what the exporter reads
+    def _setFlag(self, value=True):
+        pass
+
+    setKeyable = _setFlag
+    setStorable = _setFlag
+    setReadable = _setFlag
+    setWritable = _setFlag
+    setHidden = _setFlag
+    setUsedAsColor = _setFlag
+    setConnectable = _setFlag
+    setInternal = _setFlag
+    setArray = _setFlag
+    setMin = _setFlag
+    setMax = _setFlag
+    setSoftMin = _setFlag
+    setSoftMax = _setFlag
+
+
+class MFnNumericAttribute(MFnAttribute):
+    def create(self, longName, shortName, dataType=MFnNumericData.kFloat, default=None):
+        if default is None:
+            default = MFnNumericData.compoundDefaults.get(dataType, 0)
+        self.attribute = MObject(longName, shortName, default)
+        return self.attribute
+
+    def createColor(self, longName, shortName):
+        self.attribute = MObject(longName, shortName, (0.0, 0.0, 0.0))
+        return self.attribute
+
+    def createPoint(self, longName, shortName):
+        return self.createColor(longName, shortName)
+
+
+class MFnTypedAttribute(MFnAttribute):
+    def create(self, longName, shortName, dataType=MFnData.kString, default=None):
+        if default is None:
+            default = ""
+        self.attribute = MObject(longName, shortName, default)
+        return self.attribute
+
+
+class MFnEnumAttribute(MFnAttribute):
+    def create(self, longName, shortName, default=0):
+        self.attribute = MObject(longName, shortName, default, fields={})
+        return self.attribute
+
+    def addField(self, name, index):
+        self.attribute.fields[index] = name
+
+
+class MFnMessageAttribute(MFnAttribute):
+    def create(self, longName, shortName):
+        self.attribute = MObject(longName, shortName, None)
+        return self.attribute
+
+
+#
+# Arrays, selections and DAG paths
+#
+class _MArray(object):
+    """
+    Array filled in place by the API calls that take it as an argument.
+    """
+
+    def __init__(self, values=None):
+        self._values = list(values or [])
+
+    def length(self):
+        return len(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def append(self, value):
+        self._values.append(value)
+
+    def clear(self):
+        del self._values[:]
+
+
+class MIntArray(_MArray):
+    pass
+
+
+class MFloatArray(_MArray):
+    pass
+
+
+class MPointArray(_MArray):
+    pass
+
+
+class MVectorArray(_MArray):
+    pass
+
+
+class MDagPathArray(_MArray):
+    pass
+
+
+class MMatrixArray(_MArray):
+    pass
+
+
+class MDagPath(object):
+    def __init__(self, path=None):
+        self._path = path
+
+    def fullPathName(self):
+        return self._path
+
+    def partialPathName(self):
+        return self._path.split('|')[-1]
+
+
+class MSelectionList(object):
+    def __init__(self):
+        self._paths = []
+
+    def add(self, name):
+        self._paths.append(cmds.ls(name, long=True)[0])
+
+    def length(self):
+        return len(self._paths)
+
+    def getDagPath(self, index, dagPath):
+        dagPath._path = self._paths[index]
+
+
+class MScriptUtil(object):
+    """
+    Pointers are lists holding a single value.
+    """
+
+    def asIntPtr(self):
+        return [0]
+
+    @staticmethod
+    def getInt(pointer):
+        return pointer[0]
+
+
+#
+# Meshes
+#
+class MSpace(object):
+    kObject = 'object'
+    kWorld = 'world'
+
+
+class MPoint(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.w = w
+
+
+class MVector(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class _MeshGeometry(object):
+    """
+    The points, faces and per-vertex uvs of a fake mesh at the current time,
+    with each face's first vertex.
+    """
+
+    def __init__(self, dagPath):
+        node = cmds._getNode(dagPath.fullPathName())
+        geometry = node.geometry
+        self.points = cmds._evaluate(geometry['points'])
+        self.faceCounts = geometry['faceCounts']
+        self.faceVertices = geometry['faceVertices']
+        self.uvs = geometry['uvs']
+        self.matrix = cmds._worldMatrix(node)
+
+        self.faceStarts = []
+        start = 0
+        for faceCount in self.faceCounts:
+            self.faceStarts.append(start)
+            start += faceCount
+
+    def getFaceVertices(self, face):
+        start = self.faceStarts[face]
+        return self.faceVertices[start:start + self.faceCounts[face]]
+
+    def getPoint(self, vertex, space):
+        point = self.points[vertex]
+        if space == MSpace.kWorld:
+            point = cmds._transformPoint(self.matrix, point)
+        return point
+
+    # Triangle fans from each face's first vertex
+    def getTriangles(self, face):
+        vertices = self.getFaceVertices(face)
+        triangles = []
+        for i in range(1, len(vertices) - 1):
+            triangles.extend((vertices[0], vertices[i], vertices[i + 1]))
+        return triangles
+
+    # Newell's normal of the face, shared by its vertices
+    def getNormal(self, face, space):
+        points = [self.getPoint(x, space) for x in self.getFaceVertices(face)]
+        normal = [0.0, 0.0, 0.0]
+        for (current, following) in zip(points, points[1:] + points[:1]):
+            normal[0] += (current[1] - following[1])*(current[2] + following[2])
+            normal[1] += (current[2] - following[2])*(current[0] + following[0])
+            normal[2] += (current[0] - following[0])*(current[1] + following[1])
+        length = math.sqrt(sum([x*x for x in normal])) or 1.0
+        return MVector(*[x/length for x in normal])
+
+
+class MItMeshPolygon(object):
+    def __init__(self, dagPath):
+        self._mesh = _MeshGeometry(dagPath)
+        self._face = 0
+
+    def isDone(self):
+        return self._face >= len(self._mesh.faceCounts)
+
+    def next(self):
+        self._face += 1
+
+    def index(self):
+        return self._face
+
+    def polygonVertexCount(self):
+        return self._mesh.faceCounts[self._face]
+
+    def numTriangles(self, pointer):
+        pointer[0] = self._mesh.faceCounts[self._face] - 2
+
+    def hasUVs(self):
+        return bool(self._mesh.uvs)
+
+    def getVertices(self, vertices):
+        vertices._values[:] = self._mesh.getFaceVertices(self._face)
+
+    def getPoints(self, points, space=MSpace.kObject):
+        points._values[:] = [MPoint(*self._mesh.getPoint(x, space))
+            for x in self._mesh.getFaceVertices(self._face)]
+
+    def getNormals(self, vectors, space=MSpace.kObject):
+        normal = self._mesh.getNormal(self._face, space)
+        vectors._values[:] = [normal]*self._mesh.faceCounts[self._face]
+
+    def getUVs(self, us, vs):
+        uvs = [self._mesh.uvs[x] for x in self._mesh.getFaceVertices(self._face)]
+        us._values[:] = [u for (u, v) in uvs]
+        vs._values[:] = [v for (u, v) in uvs]
+
+    def getTriangles(self, points, vertexList, space=MSpace.kObject):
+        triangles = self._mesh.getTriangles(self._face)
+        vertexList._values[:] = triangles
+        points._values[:] = [MPoint(*self._mesh.getPoint(x, space)) for x in triangles]
+
+
+class MFnMesh(object):
+    def __init__(self, dagPath):
+        self._mesh = _MeshGeometry(dagPath)
+
+    def getVertices(self, vertexCount, vertexList):
+        vertexCount._values[:] = self._mesh.faceCounts
+        vertexList._values[:] = self._mesh.faceVertices
+
+    def getTriangles(self, triangleCounts, triangleVertices):
+        triangleCounts._values[:] = [x - 2 for x in self._mesh.faceCounts]
+        triangleVertices.clear()
+        for face in range(len(self._mesh.faceCounts)):
+            triangleVertices._values.extend(self._mesh.getTriangles(face))
+
+    # Each face vertex uses the uv of its vertex
+    def getAssignedUVs(self, uvCounts, uvIds):
+        hasUVs = bool(self._mesh.uvs)
+        uvCounts._values[:] = [x if hasUVs else 0 for x in self._mesh.faceCounts]
+        uvIds._values[:] = self._mesh.faceVertices if hasUVs else []
+
+    def getUVs(self, uArray, vArray):
+        uvs = self._mesh.uvs or []
+        uArray._values[:] = [u for (u, v) in uvs]
+        vArray._values[:] = [v for (u, v) in uvs]
@@ -0,0 +1,12 @@
+"""
+Stand-in for maya.OpenMayaFX. The fake scene's instancers have no particles,
+so they place no instances.
+"""
+
+class MFnInstancer(object):
+    def __init__(self, dagPath=None):
+        self.dagPath = dagPath
+
+    def allInstances(self, paths, matrices, particlePathStartIndices, pathIndices):
+        for array in (paths, matrices, particlePathStartIndices, pathIndices):
+            array.clear()
@@ -0,0 +1,54 @@
+"""
+Stand-in for maya.OpenMayaMPx. Registering a node runs its initializer and
+hands the attributes it added to the fake maya.cmds.
+"""
+
+from maya import cmds
+
+# Attributes added by the node initializer currently running
+_initializerAttributes = []
+
+
+class MPxNode(object):
+    kDependNode = 'dependNode'
+    kLocatorNode = 'locatorNode'
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def addAttribute(attribute):
+        _initializerAttributes.append(attribute)
+
+    @staticmethod
+    def attributeAffects(source, destination):
+        pass
+
+
+class MPxCommand(object):
+    def __init__(self):
+        pass
+
+
+def asMPxPtr(instance):
+    return instance
+
+
+class MFnPlugin(object):
+    def __init__(self, mobject=None, vendor=None, version=None, apiVersion=None):
+        pass
+
+    def registerNode(self, name, id, creator, initializer, nodeType=MPxNode.kDependNode, classification=None):
+        del _initializerAttributes[:]
+        initializer()
+        cmds.registerNodeType(name, list(_initializerAttributes))
+        del _initializerAttributes[:]
+
+    def deregisterNode(self, id):
+        pass
+
+    def registerCommand(self, name, creator):
+        pass
+
+    def deregisterCommand(self, name):
+        pass
@@ -0,0 +1,5 @@
+"""
+In-memory stand-in for the parts of the Maya Python API used by the Mitsuba
+exporter. Only meant for running the exporter outside of Maya, in the
+benchmark suite.
+"""
@@ -0,0 +1,551 @@
+"""
+Stand-in for maya.cmds, backed by an in-memory scene.
+
+Only the commands and flags used by the Mitsuba exporter are implemented. The
+scene holds DAG and dependency nodes, their attributes and connections. Node
+types registered through the fake OpenMayaMPx.MFnPlugin get the attributes
+created by their initializers. Attribute values and mesh points may be
+functions of the current time, which is how synthetic scenes are animated.
+
+Every command counts its calls in *callCounts*.
+"""
+
+import functools
+import math
+import os
+
+__all__ = ['callCounts',
+           'resetScene',
+           'registerNodeType',
+           'setMeshGeometry']
+
+#
+# Scene representation
+#
+
+# Built-in node types, with their attributes and default values
+_dagAttributes = {
+    'visibility' : True,
+    'intermediateObject' : False,
+    'overrideEnabled' : False,
+    'overrideVisibility' : True,
+}
+
+_lightAttributes = {
+    'color' : (1.0, 1.0, 1.0),
+    'intensity' : 1.0,
+}
+
+builtinNodeTypes = {
+    'transform' : {
+        'translate' : (0.0, 0.0, 0.0),
+        'rotate' : (0.0, 0.0, 0.0),
+        'scale' : (1.0, 1.0, 1.0),
+    },
+    'mesh' : {
+        'instObjGroups' : None,
+        'displaySmoothMesh' : 0,
+        'smoothLevel' : 2,
+        'renderSmoothLevel' : 2,
+        'useSmoothPreviewForRender' : True,
+    },
+    'camera' : {
+        'renderable' : False,
+        'orthographic' : False,
+        'orthographicWidth' : 30.0,
+        'depthOfField' : False,
+        'focusRegionScale' : 1.0,
+        'focusDistance' : 5.0,
+        'nearClipPlane' : 0.1,
+        'farClipPlane' : 10000.0,
+        'focalLength' : 35.0,
+        'horizontalFilmAperture' : 1.417,
+        'centerOfInterest' : 5.0,
+    },
+    'directionalLight' : dict(_lightAttributes),
+    'pointLight' : dict(_lightAttributes),
+    'spotLight' : dict(_lightAttributes, coneAngle=40.0, penumbraAngle=0.0),
+    'shadingEngine' : {
+        'surfaceShader' : None,
+        'volumeShader' : None,
+        'dagSetMembers' : None,
+    },
+    'instancer' : {
+        'inputHierarchy' : None,
+    },
+    'file' : {
+        'fileTextureName' : "",
+        'useFrameExtension' : False,
+        'frameExtension' : 1,
+        'outColor' : (0.5, 0.5, 0.5),
+        'outAlpha' : 1.0,
+    },
+    'resolution' : {
+        'width' : 640,
+        'height' : 480,
+    },
+    'renderGlobals' : {
+        'animation' : False,
+        'startFrame' : 1.0,
+        'endFrame' : 1.0,
+        'byFrameStep' : 1.0,
+        'extensionPadding' : 4,
+        'imageFilePrefix' : None,
+        'left' : 0,
+        'rght' : 0,
+        'top' : 0,
+        'bot' : 0,
+    },
+}
+
+for _nodeType in ['mesh', 'camera', 'directionalLight', 'pointLight', 'spotLight', 'transform', 'instancer']:
+    builtinNodeTypes[_nodeType].update(_dagAttributes)
+
+# Abstract types matched by ls and listConnections type filters
+inheritedNodeTypes = {
+    'mesh' : ['shape'],
+    'camera' : ['shape'],
+    'directionalLight' : ['light', 'shape'],
+    'pointLight' : ['light', 'shape'],
+    'spotLight' : ['light', 'shape'],
+}
+
+dagNodeTypes = ['transform', 'mesh', 'camera', 'directionalLight', 'pointLight', 'spotLight', 'instancer']
+
+# Plugin node types : name -> [(longName, shortName, default, enum fields)]
+pluginNodeTypes = {}
+
+
+class Node(object):
+    def __init__(self, name, nodeType, parent=None):
+        self.name = name
+        self.nodeType = nodeType
+        self.parent = parent
+        self.children = []
+        self.attributes = {}
+        self.shortNames = {}
+        self.enumFields = {}
+        self.geometry = None
+
+        if nodeType in builtinNodeTypes:
+            self.attributes.update(builtinNodeTypes[nodeType])
+        elif nodeType in pluginNodeTypes:
+            for (longName, shortName, default, fields) in pluginNodeTypes[nodeType]:
+                self.attributes[longName] = default
+                self.shortNames[shortName] = longName
+                if fields:
+                    self.enumFields[longName] = fields
+
+        if parent:
+            parent.children.append(self)
+
+    def isDag(self):
+        return self.nodeType in dagNodeTypes
+
+    def path(self):
+        if not self.isDag():
+            return self.name
+        if self.parent:
+            return self.parent.path() + '|' + self.name
+        return '|' + self.name
+
+    def isType(self, nodeType):
+        return nodeType == self.nodeType or nodeType in inheritedNodeTypes.get(self.nodeType, [])
+
+
+class Scene(object):
+    def __init__(self):
+        self.nodes = []
+        self.connections = []
+        self.selection = []
+        self.time = 1.0
+        self.sceneName = "benchmark.ma"
+        self.workspace = os.getcwd()
+
+        # Node names are kept unique, so paths never change once created
+        self.nodesByName = {}
+        self.nodesByPath = {}
+
+    def addNode(self, node):
+        self.nodes.append(node)
+        self.nodesByName[node.name] = node
+        self.nodesByPath[node.path()] = node
+
+
+callCounts = {}
+
+def _counted(function):
+    @functools.wraps(function)
+    def countedFunction(*args, **kwargs):
+        callCounts[function.__name__] = callCounts.get(function.__name__, 0) + 1
+        return function(*args, **kwargs)
+    return countedFunction
+
+def _getNode(name):
+    name = str(name)
+    if name.startswith('|'):
+        node = _scene.nodesByPath.get(name)
+    else:
+        node = _scene.nodesByName.get(name.split('|')[-1])
+    if node is None:
+        raise ValueError("No object matches name: %s" % name)
+    return node
+
+def _splitPlug(plug):
+    (nodeName, attribute) = str(plug).split('.', 1)
+    return (_getNode(nodeName), attribute)
+
+def _attributeName(node, attribute):
+    return node.shortNames.get(attribute, attribute)
+
+def _evaluate(value):
+    if callable(value):
+        return value(_scene.time)
+    return value
+
+def _uniqueName(name):
+    if name not in _scene.nodesByName:
+        return name
+    index = 1
+    while "%s%d" % (name, index) in _scene.nodesByName:
+        index += 1
+    return "%s%d" % (name, index)
+
+#
+# Transforms
+#
+def _matrixMultiply(a, b):
+    return [sum(a[row*4 + k]*b[k*4 + column] for k in range(4))
+        for row in range(4) for column in range(4)]
+
+def _localMatrix(node):
+    (tx, ty, tz) = _evaluate(node.attributes.get('translate', (0.0, 0.0, 0.0)))
+    (rx, ry, rz) = [math.radians(x) for x in _evaluate(node.attributes.get('rotate', (0.0, 0.0, 0.0)))]
+    (sx, sy, sz) = _evaluate(node.attributes.get('scale', (1.0, 1.0, 1.0)))
+
+    # Maya's row vector convention, xyz rotation order
+    scale = [sx, 0, 0, 0,  0, sy, 0, 0,  0, 0, sz, 0,  0, 0, 0, 1]
+    rotateX = [1, 0, 0, 0,  0, math.cos(rx), math.sin(rx), 0,  0, -math.sin(rx), math.cos(rx), 0,  0, 0, 0, 1]
+    rotateY = [math.cos(ry), 0, -math.sin(ry), 0,  0, 1, 0, 0,  math.sin(ry), 0, math.cos(ry), 0,  0, 0, 0, 1]
+    rotateZ = [math.cos(rz), math.sin(rz), 0, 0,  -math.sin(rz), math.cos(rz), 0, 0,  0, 0, 1, 0,  0, 0, 0, 1]
+    translate = [1, 0, 0, 0,  0, 1, 0, 0,  0, 0, 1, 0,  tx, ty, tz, 1]
+
+    matrix = scale
+    for nextMatrix in [rotateX, rotateY, rotateZ, translate]:
+        matrix = _matrixMultiply(matrix, nextMatrix)
+    return matrix
+
+def _worldMatrix(node):
+    matrix = [1.0, 0, 0, 0,  0, 1.0, 0, 0,  0, 0, 1.0, 0,  0, 0, 0, 1.0]
+    while node:
+        if node.nodeType == 'transform':
+            matrix = _matrixMultiply(matrix, _localMatrix(node))
+        node = node.parent
+    return matrix
+
+def _transformPoint(matrix, point):
+    (x, y, z) = point
+    return (x*matrix[0] + y*matrix[4] + z*matrix[8] + matrix[12],
+            x*matrix[1] + y*matrix[5] + z*matrix[9] + matrix[13],
+            x*matrix[2] + y*matrix[6] + z*matrix[10] + matrix[14])
+
+#
+# Fake-only functions, used to build scenes
+#
+def resetScene():
+    global _scene
+    _scene = Scene()
+
+    createNode('resolution', name='defaultResolution')
+    createNode('renderGlobals', name='defaultRenderGlobals')
+
+    callCounts.clear()
+
+def registerNodeType(nodeType, attributes):
+    pluginNodeTypes[nodeType] = [(x.longName, x.shortName, x.default, x.fields) for x in attributes]
+
+def setMeshGeometry(mesh, points, faceCounts, faceVertices, uvs=None):
+    """
+    Sets the geometry of a mesh node. *points* may be a function of the
+    current time, for deforming meshes.
+    """
+    _getNode(mesh).geometry = {
+        'points' : points,
+        'faceCounts' : faceCounts,
+        'faceVertices' : faceVertices,
+        'uvs' : uvs,
+    }
+
+#
+# Commands
+#
+@_counted
+def createNode(nodeType, name=None, parent=None, shared=False, skipSelect=False, n=None, p=None):
+    name = name or n or nodeType + "1"
+    parent = parent or p
+    if shared and name in _scene.nodesByName:
+        return name
+
+    parentNode = _getNode(parent) if parent else None
+    node = Node(_uniqueName(name), nodeType, parentNode)
+    _scene.addNode(node)
+    return node.name
+
+@_counted
+def connectAttr(source, destination, force=False, f=False):
+    (sourceNode, sourceAttribute) = _splitPlug(source)
+    (destinationNode, destinationAttribute) = _splitPlug(destination)
+    _scene.connections.append( (sourceNode, _attributeName(sourceNode, sourceAttribute),
+        destinationNode, _attributeName(destinationNode, destinationAttribute)) )
+
+@_counted
+def setAttr(plug, *values, **kwargs):
+    (node, attribute) = _splitPlug(plug)
+    if len(values) == 1:
+        value = values[0]
+    else:
+        value = tuple(values)
+    node.attributes[_attributeName(node, attribute)] = value
+
+@_counted
+def getAttr(plug, asString=False):
+    (node, attribute) = _splitPlug(plug)
+    attribute = _attributeName(node, attribute)
+
+    if attribute == 'worldMatrix':
+        return _worldMatrix(node)
+
+    if attribute not in node.attributes:
+        raise ValueError("No object matches name: %s" % plug)
+
+    value = _evaluate(node.attributes[attribute])
+    if asString and attribute in node.enumFields:
+        return node.enumFields[attribute].get(value, "")
+
+    # Compound attributes are returned as a list holding a tuple
+    if isinstance(value, (tuple, list)):
+        return [tuple(value)]
+    return value
+
+@_counted
+def attributeQuery(attribute, node=None, exists=False, ex=False):
+    node = _getNode(node)
+    return _attributeName(node, attribute) in node.attributes
+
+@_counted
+def listAttr(node):
+    return list(_getNode(node).attributes.keys())
+
+@_counted
+def objExists(name):
+    try:
+        _getNode(name)
+        return True
+    except ValueError:
+        return False
+
+@_counted
+def nodeType(name):
+    return _getNode(name).nodeType
+
+@_counted
+def ls(*names, **kwargs):
+    nodeTypeFilter = kwargs.get('type')
+    longNames = kwargs.get('long', kwargs.get('l', False))
+    selection = kwargs.get('selection', kwargs.get('sl', False))
+
+    if selection:
+        nodes = list(_scene.selection)
+    elif names:
+        # Names may be given as arguments or as lists of them
+        flatNames = []
+        for name in names:
+            flatNames.extend(name if isinstance(name, (list, tuple)) else [name])
+        nodes = [_getNode(x) for x in flatNames]
+    else:
+        nodes = list(_scene.nodes)
+
+    if nodeTypeFilter:
+        nodes = [x for x in nodes if x.isType(nodeTypeFilter)]
+
+    return [x.path() if longNames else x.name for x in nodes]
+
+@_counted
+def listRelatives(name, children=False, c=False, shapes=False, s=False, fullPath=False, f=False,
+    parent=False, p=False, allDescendents=False, ad=False, type=None, noIntermediate=False, ni=False):
+    node = _getNode(name)
+    fullPath = fullPath or f
+
+    if parent or p:
+        relatives = [node.parent] if node.parent else []
+    elif allDescendents or ad:
+        relatives = []
+        stack = list(node.children)
+        while stack:
+            relative = stack.pop(0)
+            relatives.append(relative)
+            stack.extend(relative.children)
+    else:
+        relatives = list(node.children)
+
+    if shapes or s:
+        relatives = [x for x in relatives if x.isType('shape')]
+    if type:
+        relatives = [x for x in relatives if x.isType(type)]
+    if noIntermediate or ni:
+        relatives = [x for x in relatives if not x.attributes.get('intermediateObject')]
+
+    # Maya returns None rather than an empty list
+    if not relatives:
+        return None
+    return [x.path() if fullPath else x.name for x in relatives]
+
+@_counted
+def listConnections(name, type=None, connections=False, c=False, plugs=False, p=False,
+    source=True, s=True, destination=True, d=True):
+    if '.' in str(name):
+        (node, attribute) = _splitPlug(name)
+        attribute = _attributeName(node, attribute)
+    else:
+        (node, attribute) = (_getNode(name), None)
+
+    result = []
+    for (sourceNode, sourceAttribute, destinationNode, destinationAttribute) in _scene.connections:
+        if source and s and destinationNode is node and attribute in [None, destinationAttribute]:
+            (thisAttribute, otherNode, otherAttribute) = (destinationAttribute, sourceNode, sourceAttribute)
+        elif destination and d and sourceNode is node and attribute in [None, sourceAttribute]:
+            (thisAttribute, otherNode, otherAttribute) = (sourceAttribute, destinationNode, destinationAttribute)
+        else:
+            continue
+
+        if type and not otherNode.isType(type):
+            continue
+
+        if connections or c:
+            result.append("%s.%s" % (node.name, thisAttribute))
+        if plugs or p:
+            result.append("%s.%s" % (otherNode.name, otherAttribute))
+        else:
+            result.append(otherNode.name)
+
+    return result
+
+@_counted
+def select(*names, **kwargs):
+    if kwargs.get('clear', kwargs.get('cl', False)):
+        _scene.selection = []
+        return
+
+    nodes = []
+    for name in names:
+        if isinstance(name, (list, tuple)):
+            nodes.extend([_getNode(x) for x in name])
+        else:
+            nodes.append(_getNode(name))
+
+    if kwargs.get('add', False):
+        _scene.selection.extend(nodes)
+    else:
+        _scene.selection = nodes
+
+@_counted
+def currentTime(time=None, query=False, q=False, edit=False, e=False):
+    if query or q:
+        return _scene.time
+    _scene.time = float(time)
+    return _scene.time
+
+@_counted
+def camera(name, query=False, q=False, horizontalFieldOfView=False, hfv=False):
+    node = _getNode(name)
+    focalLength = _evaluate(node.attributes['focalLength'])
+    aperture = _evaluate(node.attributes['horizontalFilmAperture'])
+    if horizontalFieldOfView or hfv:
+        return math.degrees(2.0*math.atan(0.5*aperture*25.4/focalLength))
+
+def _writeOBJ(filename, nodes):
+    meshes = []
+    stack = list(nodes)
+    while stack:
+        node = stack.pop(0)
+        if node.isType('mesh') and node not in meshes:
+            meshes.append(node)
+        stack.extend(node.children)
+
+    vertexOffset = 1
+    uvOffset = 1
+    with open(filename, 'w') as f:
+        for mesh in meshes:
+            geometry = mesh.geometry
+            if not geometry:
+                continue
+
+            matrix = _worldMatrix(mesh)
+            points = [_transformPoint(matrix, x) for x in _evaluate(geometry['points'])]
+            uvs = geometry['uvs']
+
+            f.write("g %s\n" % mesh.name)
+            f.write(''.join(["v %f %f %f\n" % point for point in points]))
+            if uvs:
+                f.write(''.join(["vt %f %f\n" % tuple(uv) for uv in uvs]))
+
+            faceVertices = geometry['faceVertices']
+            start = 0
+            for faceCount in geometry['faceCounts']:
+                indices = faceVertices[start:start+faceCount]
+                start += faceCount
+                if uvs:
+                    f.write("f %s\n" % ' '.join(["%d/%d" % (x + vertexOffset, x + uvOffset) for x in indices]))
+                else:
+                    f.write("f %s\n" % ' '.join([str(x + vertexOffset) for x in indices]))
+
+            vertexOffset += len(points)
+            if uvs:
+                uvOffset += len(uvs)
+
+@_counted
+def file(path=None, query=False, q=False, sceneName=False, sn=False, options=None, op=None,
+    type=None, typ=None, exportSelected=False, es=False, force=False, f=False):
+    if query or q:
+        if sceneName or sn:
+            return os.path.join(_scene.workspace, _scene.sceneName)
+        return None
+
+    if (exportSelected or es) and (type or typ) == "OBJexport":
+        _writeOBJ(path, list(_scene.selection))
+        return path
+
+    return path
+
+@_counted
+def about(batch=False, v=False, version=False):
+    if batch:
+        return True
+    if v or version:
+        return "2016"
+    return None
+
+@_counted
+def workspace(query=False, q=False, fullName=False, fn=False):
+    return _scene.workspace
+
+@_counted
+def renderWindowEditor(*args, **kwargs):
+    # No render view when running without a UI
+    return None
+
+@_counted
+def renderer(*args, **kwargs):
+    return None
+
+@_counted
+def pluginInfo(name, query=False, loaded=False):
+    return True
+
+@_counted
+def loadPlugin(name):
+    return [name]
+
+
+_scene = None
+resetScene()
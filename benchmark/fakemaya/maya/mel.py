@@ -0,0 +1,6 @@
+"""
+Stand-in for maya.mel. MEL isn't evaluated outside of Maya.
+"""
+
+def eval(command):
+    return None
@@ -0,0 +1,3 @@
+"""
+Stand-in for the parts of pymel used by the Mitsuba exporter.
+"""
@@ -0,0 +1,25 @@
+"""
+Stand-in for pymel.core, limited to the camera queries made by the exporter.
+"""
+
+from maya import cmds
+
+
+class PyNode(object):
+    def __init__(self, name):
+        self.name = name
+        self.node = cmds._getNode(name)
+
+    def _worldMatrix(self):
+        return cmds._worldMatrix(self.node)
+
+    def getEyePoint(self, space='world'):
+        return list(cmds._transformPoint(self._worldMatrix(), (0.0, 0.0, 0.0)))
+
+    def getWorldCenterOfInterest(self):
+        centerOfInterest = cmds._evaluate(self.node.attributes.get('centerOfInterest', 5.0))
+        return list(cmds._transformPoint(self._worldMatrix(), (0.0, 0.0, -centerOfInterest)))
+
+    def getWorldUp(self):
+        matrix = self._worldMatrix()
+        return [matrix[4], matrix[5], matrix[6]]
@@ -0,0 +1,223 @@
+"""
+Synthetic scene generators for the exporter benchmarks. Scenes are built with
+the fake maya.cmds, so the plugin's node types have to be registered first.
+"""
+
+import math
+
+from maya import cmds
+
+__all__ = ['leafMaterialTypes',
+           'createMesh',
+           'createMaterial',
+           'createLight',
+           'createCamera',
+           'createScene']
+
+# Leaf materials, with the color attribute that may receive a file texture
+leafMaterialTypes = [
+    ("MitsubaDiffuseShader", "reflectance"),
+    ("MitsubaPlasticShader", "diffuseReflectance"),
+    ("MitsubaRoughConductorShader", "specularReflectance"),
+    ("MitsubaDielectricShader", None),
+    ("MitsubaRoughDiffuseShader", "reflectance"),
+    ("MitsubaWardShader", "diffuseReflectance"),
+]
+
+lightTypes = ['directionalLight', 'pointLight', 'spotLight']
+
+
+def _gridGeometry(resolution):
+    points = []
+    uvs = []
+    for j in range(resolution + 1):
+        for i in range(resolution + 1):
+            u = float(i)/resolution
+            v = float(j)/resolution
+            points.append((u - 0.5, 0.0, v - 0.5))
+            uvs.append((u, v))
+
+    faceCounts = []
+    faceVertices = []
+    for j in range(resolution):
+        for i in range(resolution):
+            corner = j*(resolution + 1) + i
+            faceCounts.append(4)
+            faceVertices.extend([corner, corner + 1, corner + resolution + 2, corner + resolution + 1])
+
+    return (points, uvs, faceCounts, faceVertices)
+
+
+def createMesh(name, resolution, shadingEngine, translate, animated=False, deforming=False):
+    """
+    Creates a transform and a mesh made of a grid of *resolution* x
+    *resolution* quads, assigned to *shadingEngine*.
+    """
+
+    transform = cmds.createNode('transform', name=name)
+    mesh = cmds.createNode('mesh', name=name + "Shape", parent=transform)
+
+    (points, uvs, faceCounts, faceVertices) = _gridGeometry(resolution)
+    if deforming:
+        restPoints = points
+        points = lambda time: [(x, 0.1*math.sin(x*6.0 + time*0.25), z) for (x, y, z) in restPoints]
+    cmds.setMeshGeometry(mesh, points, faceCounts, faceVertices, uvs)
+
+    if animated:
+        (tx, ty, tz) = translate
+        cmds.setAttr(transform + ".translate", lambda time: (tx + 0.1*time, ty, tz))
+        cmds.setAttr(transform + ".rotate", lambda time: (0.0, 5.0*time, 0.0))
+    else:
+        cmds.setAttr(transform + ".translate", *translate)
+
+    cmds.connectAttr(mesh + ".instObjGroups", shadingEngine + ".dagSetMembers")
+
+    return transform
+
+
+def _createFileTexture(name, material, attribute):
+    fileNode = cmds.createNode('file', name=name + "File")
+    cmds.setAttr(fileNode + ".fileTextureName", "/textures/%s.exr" % name, type="string")
+    cmds.connectAttr(fileNode + ".outColor", material + "." + attribute)
+
+
+def createMaterial(name, index, depth=0, textured=False):
+    """
+    Creates a material. A *depth* greater than 0 creates a tree of alternating
+    blend and mixture materials of that depth, with leaf materials at the
+    bottom.
+    """
+
+    if depth > 0:
+        if depth % 2:
+            material = cmds.createNode("MitsubaBlendShader", name=name)
+            cmds.setAttr(material + ".weight", 0.5)
+        else:
+            material = cmds.createNode("MitsubaMixtureShader", name=name)
+            cmds.setAttr(material + ".weight1", 0.5)
+            cmds.setAttr(material + ".weight2", 0.5)
+
+        for childIndex in [1, 2]:
+            child = createMaterial("%s_%d" % (name, childIndex), index + childIndex, depth - 1, textured)
+            cmds.connectAttr(child + ".outColor", material + ".bsdf%d" % childIndex)
+
+        return material
+
+    (materialType, textureAttribute) = leafMaterialTypes[index % len(leafMaterialTypes)]
+    material = cmds.createNode(materialType, name=name)
+    if textured and textureAttribute:
+        _createFileTexture(name, material, textureAttribute)
+
+    return material
+
+
+def createLight(name, index, lightType, animated=False):
+    transform = cmds.createNode('transform', name=name)
+    light = cmds.createNode(lightType, name=name + "Shape", parent=transform)
+
+    angle = 2.0*math.pi*index/8.0
+    translate = (10.0*math.cos(angle), 10.0, 10.0*math.sin(angle))
+    cmds.setAttr(transform + ".translate", *translate)
+    cmds.setAttr(transform + ".rotate", -45.0, math.degrees(angle), 0.0)
+
+    if animated:
+        cmds.setAttr(light + ".intensity", lambda time: 1.0 + 0.1*time)
+
+    return light
+
+
+def createInstancer(name, sources):
+    """
+    Creates a particle instancer placing the transforms *sources*. The fake
+    instancer has no particles, so it places no instances.
+    """
+
+    instancer = cmds.createNode('instancer', name=name)
+    for source in sources:
+        cmds.connectAttr(source + ".matrix", instancer + ".inputHierarchy")
+    return instancer
+
+
+def createCamera(name="persp"):
+    transform = cmds.createNode('transform', name=name)
+    camera = cmds.createNode('camera', name=name + "Shape", parent=transform)
+    cmds.setAttr(transform + ".translate", 0.0, 5.0, 30.0)
+    cmds.setAttr(transform + ".rotate", -10.0, 0.0, 0.0)
+    cmds.setAttr(camera + ".renderable", True)
+    cmds.setAttr(camera + ".centerOfInterest", 30.0)
+    return camera
+
+
+def createScene(meshes=10,
+                materials=4,
+                depth=0,
+                lights=2,
+                resolution=8,
+                frames=1,
+                textured=True,
+                deforming=False,
+                instancers=0):
+    """
+    Resets the fake scene and fills it with a synthetic scene.
+
+    Parameters
+    ----------
+    meshes : int
+        Number of meshes, assigned to the materials in turn.
+    materials : int
+        Number of materials, each with its own shading group.
+    depth : int
+        Depth of the blend and mixture material trees. 0 for leaf materials.
+    lights : int
+        Number of directional, point and spot lights.
+    resolution : int
+        Each mesh is a grid of *resolution* x *resolution* quads.
+    frames : int
+        Length of the frame range. Scenes with more than one frame animate
+        their transforms and light intensities.
+    textured : bool
+        Connect file textures to the leaf materials.
+    deforming : bool
+        Animate the mesh points.
+    instancers : int
+        Number of particle instancers, each placing one of the meshes.
+
+    Returns
+    -------
+    str
+        The render settings node.
+    """
+
+    cmds.resetScene()
+
+    animated = frames > 1
+    cmds.setAttr("defaultRenderGlobals.startFrame", 1.0)
+    cmds.setAttr("defaultRenderGlobals.endFrame", float(frames))
+    cmds.setAttr("defaultRenderGlobals.animation", animated)
+
+    renderSettings = cmds.createNode('MitsubaRenderSettings', name='defaultMitsubaRenderGlobals')
+
+    createCamera()
+
+    for lightIndex in range(lights):
+        createLight("light%d" % lightIndex, lightIndex, lightTypes[lightIndex % len(lightTypes)], animated)
+
+    shadingEngines = []
+    for materialIndex in range(max(1, materials)):
+        material = createMaterial("material%d" % materialIndex, materialIndex, depth, textured)
+        shadingEngine = cmds.createNode('shadingEngine', name="material%dSG" % materialIndex)
+        cmds.connectAttr(material + ".outColor", shadingEngine + ".surfaceShader")
+        shadingEngines.append(shadingEngine)
+
+    rowLength = max(1, int(math.ceil(math.sqrt(meshes))))
+    for meshIndex in range(meshes):
+        translate = (1.5*(meshIndex % rowLength), 0.0, 1.5*(meshIndex // rowLength))
+        createMesh("mesh%d" % meshIndex, resolution, shadingEngines[meshIndex % len(shadingEngines)],
+            translate, animated, deforming)
+
+    for instancerIndex in range(instancers if meshes else 0):
+        createInstancer("instancer%d" % instancerIndex, ["mesh%d" % (instancerIndex % meshes)])
+
+    cmds.select(clear=True)
+
+    return renderSettings
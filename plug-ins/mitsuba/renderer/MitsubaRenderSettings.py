@@ -21,6 +21,14 @@ class MitsubaRenderSetting(OpenMayaMPx.MPxNode):
     mSampleCount = OpenMaya.MObject()
     mSamplerDimension = OpenMaya.MObject()
     mSamplerScramble = OpenMaya.MObject()
+    mProgressive = OpenMaya.MObject()
+    mProgressiveInitialSampleCount = OpenMaya.MObject()
+    mProgressiveTimeBudget = OpenMaya.MObject()
+    mAdaptiveSampling = OpenMaya.MObject()
+    mAdaptiveSamplingPilotSampleCount = OpenMaya.MObject()
+    mAdaptiveSamplingTargetNoise = OpenMaya.MObject()
+    mAdaptiveSamplingMinSampleCount = OpenMaya.MObject()
+    mAdaptiveSamplingMaxSampleCount = OpenMaya.MObject()
 
     # Reconstruction Filter variables
     mReconstructionFilter = OpenMaya.MObject()
@@ -32,6 +40,33 @@ class MitsubaRenderSetting(OpenMayaMPx.MPxNode):
     mWritePartialResultsInterval = OpenMaya.MObject()
     mBlockSize = OpenMaya.MObject()
     mThreads = OpenMaya.MObject()
+    mRegionComposite = OpenMaya.MObject()
+    mRenderEstimate = OpenMaya.MObject()
+    mExportStatistics = OpenMaya.MObject()
+    mRenderTrace = OpenMaya.MObject()
+    mRenderProfile = OpenMaya.MObject()
+    mRenderProfileMemory = OpenMaya.MObject()
+    mRenderCache = OpenMaya.MObject()
+    mRenderCacheSize = OpenMaya.MObject()
+    mCompactMeshes = OpenMaya.MObject()
+    mBinaryMeshes = OpenMaya.MObject()
+    mCacheRigidMeshes = OpenMaya.MObject()
+    mArchiveDeformingMeshes = OpenMaya.MObject()
+    mCullGeometry = OpenMaya.MObject()
+    mCullMargin = OpenMaya.MObject()
+    mCullGIDistance = OpenMaya.MObject()
+    mCullDistance = OpenMaya.MObject()
+    mLevelOfDetail = OpenMaya.MObject()
+    mLODTrianglesPerPixel = OpenMaya.MObject()
+    mMergeSmallMeshes = OpenMaya.MObject()
+    mMergeMeshTriangles = OpenMaya.MObject()
+    mExportCurves = OpenMaya.MObject()
+    mHairRadius = OpenMaya.MObject()
+    mHairSubdivisions = OpenMaya.MObject()
+    mTessellateSurfaces = OpenMaya.MObject()
+    mExportFluids = OpenMaya.MObject()
+    mCropVolumes = OpenMaya.MObject()
+    mVolumeVoxelSize = OpenMaya.MObject()
 
     # Integrator - Path Tracer variables
     mPathTracerUseInfiniteDepth = OpenMaya.MObject()
@@ -299,6 +334,14 @@ def nodeInitializer():
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mSampleCount", "sampleCount", "sc", 8)
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mSamplerDimension", "samplerDimension", "sd", 4)
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mSamplerScramble", "samplerScramble", "ss", -1)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mProgressive", "progressive", "prg", False)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mProgressiveInitialSampleCount", "progressiveInitialSampleCount", "prgis", 1)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mProgressiveTimeBudget", "progressiveTimeBudget", "prgtb", 0.0)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mAdaptiveSampling", "adaptiveSampling", "adsm", False)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mAdaptiveSamplingPilotSampleCount", "adaptiveSamplingPilotSampleCount", "aspsc", 4)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mAdaptiveSamplingTargetNoise", "adaptiveSamplingTargetNoise", "astn", 0.02)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mAdaptiveSamplingMinSampleCount", "adaptiveSamplingMinSampleCount", "asmin", 4)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mAdaptiveSamplingMaxSampleCount", "adaptiveSamplingMaxSampleCount", "asmax", 1024)
 
         # Reconstruction Filter variables
         MitsubaRenderSetting.addStringAttribute(sAttr,  "mReconstructionFilter", "reconstructionFilter", "rf", "Box filter")
@@ -310,6 +353,33 @@ def nodeInitializer():
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mWritePartialResultsInterval", "writePartialResultsInterval", "wpri", 15)
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mBlockSize", "blockSize", "bs", 32)
         MitsubaRenderSetting.addIntegerAttribute(nAttr, "mThreads", "threads", "th", 0)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRegionComposite", "regionComposite", "rrc", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRenderEstimate", "renderEstimate", "rest", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mExportStatistics", "exportStatistics", "exst", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRenderTrace", "renderTrace", "rtrc", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRenderProfile", "renderProfile", "rprf", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRenderProfileMemory", "renderProfileMemory", "rprfm", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mRenderCache", "renderCache", "rcch", False)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mRenderCacheSize", "renderCacheSize", "rcchs", 2048)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mCompactMeshes", "compactMeshes", "cmsh", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mBinaryMeshes", "binaryMeshes", "bnms", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mCacheRigidMeshes", "cacheRigidMeshes", "crm", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mArchiveDeformingMeshes", "archiveDeformingMeshes", "adm", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mCullGeometry", "cullGeometry", "cul", False)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mCullMargin", "cullMargin", "culm", 0.1)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mCullGIDistance", "cullGIDistance", "culg", 0.0)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mCullDistance", "cullDistance", "culd", 0.0)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mLevelOfDetail", "levelOfDetail", "lod", False)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mLODTrianglesPerPixel", "lodTrianglesPerPixel", "lodtp", 0.5)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mMergeSmallMeshes", "mergeSmallMeshes", "msm", False)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mMergeMeshTriangles", "mergeMeshTriangles", "mmt", 500)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mExportCurves", "exportCurves", "excv", False)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mHairRadius", "hairRadius", "hrad", 0.025)
+        MitsubaRenderSetting.addIntegerAttribute(nAttr, "mHairSubdivisions", "hairSubdivisions", "hsub", 4)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mTessellateSurfaces", "tessellateSurfaces", "tsrf", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mExportFluids", "exportFluids", "exfl", False)
+        MitsubaRenderSetting.addBooleanAttribute(nAttr, "mCropVolumes", "cropVolumes", "crpv", False)
+        MitsubaRenderSetting.addFloatAttribute(nAttr, "mVolumeVoxelSize", "volumeVoxelSize", "vvs", 0.0)
 
         # Integrator - Path Tracer variables
         MitsubaRenderSetting.addBooleanAttribute(nAttr, "mPathTracerUseInfiniteDepth", "iPathTracerUseInfiniteDepth", "iptuid", True)
@@ -525,6 +595,14 @@ def nodeInitializer():
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mSampleCount)
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mSamplerDimension)
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mSamplerScramble)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mProgressive)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mProgressiveInitialSampleCount)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mProgressiveTimeBudget)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mAdaptiveSampling)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mAdaptiveSamplingPilotSampleCount)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mAdaptiveSamplingTargetNoise)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mAdaptiveSamplingMinSampleCount)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mAdaptiveSamplingMaxSampleCount)
 
         # Reconstruction Filter variables
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mReconstructionFilter)
@@ -536,6 +614,33 @@ def nodeInitializer():
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mWritePartialResultsInterval)
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mBlockSize)
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mThreads)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRegionComposite)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderEstimate)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mExportStatistics)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderTrace)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderProfile)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderProfileMemory)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderCache)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mRenderCacheSize)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCompactMeshes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mBinaryMeshes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCacheRigidMeshes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mArchiveDeformingMeshes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCullGeometry)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCullMargin)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCullGIDistance)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCullDistance)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mLevelOfDetail)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mLODTrianglesPerPixel)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mMergeSmallMeshes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mMergeMeshTriangles)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mExportCurves)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mHairRadius)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mHairSubdivisions)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mTessellateSurfaces)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mExportFluids)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mCropVolumes)
+        MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mVolumeVoxelSize)
 
         # Integrator - Path Tracer variables
         MitsubaRenderSetting.addAttribute(MitsubaRenderSetting.mPathTracerUseInfiniteDepth)
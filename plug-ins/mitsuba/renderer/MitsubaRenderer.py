@@ -1,5 +1,7 @@
 import inspect
+import math
 import os
+import shutil
 import sys
 import time
 
@@ -10,6 +12,9 @@ import maya.OpenMayaMPx as OpenMayaMPx
 
 kPluginCmdName = "Mitsuba"
 
+# Upper bound on the number of renders used to build a progressive image
+kProgressiveMaxPasses = 64
+
 pluginDir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 sys.path.append(pluginDir)
 
@@ -17,6 +22,8 @@ sys.path.append(os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..', 'util')))
 
 from process import Process
+import chrometrace
+import imagefile
 
 # Import modules for settings, material, lights and volumes
 import MitsubaRenderSettings
@@ -29,6 +36,12 @@ renderSettings = None
 # IO
 #
 import MitsubaRendererIO
+import MitsubaRendererEstimate
+import MitsubaRendererStatistics
+from MitsubaRendererStatistics import exportStage
+import MitsubaRendererProfile
+import MitsubaRendererCache
+import MitsubaRendererSequence
 
 #
 # Utility functions
@@ -57,6 +70,35 @@ def updateRenderSettings():
     global renderSettings
     print( "\n\n\nMitsuba Render Settings - Update - Python\n\n\n" )
 
+def estimateRender():
+    global renderSettings
+    createRenderSettingsNode()
+
+    userSelection = cmds.ls(sl=True)
+
+    projectDir = cmds.workspace(q=True, fn=True)
+    renderDir = os.path.join(projectDir, "renderData")
+
+    # Export the scene to measure it, then remove the exported geometry
+    (sceneElement, geometryFiles) = MitsubaRendererIO.getSceneElement(renderDir, renderSettings)
+    estimate = MitsubaRendererEstimate.estimateRender(sceneElement, renderDir)
+
+    for geometryFile in geometryFiles:
+        try:
+            os.remove(geometryFile)
+        except:
+            print( "Error removing temporary file : %s" % geometryFile )
+
+    if len(userSelection) > 0:
+        cmds.select(userSelection)
+    else:
+        cmds.select(cl=True)
+
+    estimateText = MitsubaRendererEstimate.formatEstimate(estimate)
+    print( estimateText )
+
+    return estimateText
+
 def getImageExtension(renderSettings):
     filmType = cmds.getAttr( "%s.film" % renderSettings )
 
@@ -173,6 +215,41 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
         animation = self.isAnimation()
         print( "Render Settings - Animation        : %s" % animation )
 
+        renderTrace = cmds.getAttr("%s.%s" % (renderSettings, "renderTrace"))
+        print( "Render Settings - Render Trace     : %s" % renderTrace )
+
+        if renderTrace:
+            chrometrace.startTracing()
+
+        try:
+            with chrometrace.span("renderJob", "mitsuba", animation=animation):
+                imageName = self.renderFrames(renderDir, renderSettings, mitsubaPath, oiiotoolPath,
+                    mtsDir, keepTempFiles, animation, verbose)
+        finally:
+            if renderTrace:
+                traceName = self.getTraceFileName(projectDir)
+                chrometrace.stopTracing(traceName)
+                print( "Render trace : %s" % traceName )
+
+        # Display the render
+        if not animation and not cmds.about(batch=True):
+            MitsubaRendererUI.showRender(imageName)
+
+        # Select the objects that the user had selected before they rendered, or clear the selection
+        if len(userSelection) > 0:
+            cmds.select(userSelection)
+        else:
+            cmds.select(cl=True)
+
+    def renderFrames(self,
+                     renderDir,
+                     renderSettings,
+                     mitsubaPath,
+                     oiiotoolPath,
+                     mtsDir,
+                     keepTempFiles,
+                     animation,
+                     verbose):
         # Animation
         if animation:
             startFrame = int(cmds.getAttr("defaultRenderGlobals.startFrame"))
@@ -181,13 +258,33 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
             print( "Animation frame range : %d to %d, step %d" % (
                 startFrame, endFrame, byFrame) )
 
-            for frame in range(startFrame, endFrame+1, byFrame):
-                print( "Rendering frame " + str(frame) + " - begin" )
-
-                self.exportAndRender(renderDir, renderSettings, mitsubaPath, oiiotoolPath,
-                    mtsDir, keepTempFiles, animation, frame, verbose)
-
-                print( "Rendering frame " + str(frame) + " - end" )
+            frames = range(startFrame, endFrame+1, byFrame)
+
+            # Geometry that doesn't deform is exported once for all frames, and
+            # deforming geometry is archived with one mesh per frame
+            sequenceCache = None
+            cacheRigidMeshes = cmds.getAttr("%s.%s" % (renderSettings, "cacheRigidMeshes"))
+            archiveDeformingMeshes = cmds.getAttr("%s.%s" % (renderSettings, "archiveDeformingMeshes"))
+            if cacheRigidMeshes or archiveDeformingMeshes:
+                sequenceCache = MitsubaRendererSequence.SequenceCache(
+                    os.path.join(renderDir, "sequenceGeometry"), frames, 
+                    cacheRigidMeshes, archiveDeformingMeshes)
+
+            imageName = None
+            try:
+                for frame in frames:
+                    print( "Rendering frame " + str(frame) + " - begin" )
+
+                    with chrometrace.span("frame %d" % frame, "mitsuba"):
+                        imageName = self.exportAndRender(renderDir, renderSettings, mitsubaPath, oiiotoolPath,
+                            mtsDir, keepTempFiles, animation, frame, verbose, sequenceCache)
+
+                    print( "Rendering frame " + str(frame) + " - end" )
+            finally:
+                if sequenceCache:
+                    print( sequenceCache.formatMotion() )
+                    if not keepTempFiles:
+                        sequenceCache.cleanup()
 
             print( "Animation finished" )
 
@@ -196,15 +293,14 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
             imageName = self.exportAndRender(renderDir, renderSettings, mitsubaPath, oiiotoolPath,
                 mtsDir, keepTempFiles, animation, None, verbose)
 
-            # Display the render
-            if not cmds.about(batch=True):
-                MitsubaRendererUI.showRender(imageName)
+        return imageName
 
-        # Select the objects that the user had selected before they rendered, or clear the selection
-        if len(userSelection) > 0:
-            cmds.select(userSelection)
-        else:
-            cmds.select(cl=True)
+    # The trace covers every frame of the render, so it's named like the non-animated image
+    def getTraceFileName(self, projectDir):
+        imagePrefix = cmds.getAttr("defaultRenderGlobals.imageFilePrefix")
+        if imagePrefix is None:
+            imagePrefix = self.getScenePrefix()
+        return os.path.join(projectDir, "images", imagePrefix + ".trace.json")
 
     def isAnimation(self):
         animation = cmds.getAttr("defaultRenderGlobals.animation")
@@ -223,47 +319,479 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
 
         return animation
 
+    @chrometrace.traced('oiiotool')
     def resetImageDataWindow(self, imageName, oiiotoolPath):
-        editor = cmds.renderWindowEditor(q=True, editorName=True )
-        #print( "resetImageDataWindow - editor : %s" % editor )
-        if editor:
-            renderRegion = cmds.renderWindowEditor(editor, q=True, mq=True)
-            #print( "resetImageDataWindow - render region : %s" % renderRegion )
-            if renderRegion:
-                left = cmds.getAttr( "defaultRenderGlobals.left" )
-                right = cmds.getAttr( "defaultRenderGlobals.rght" )
-                top = cmds.getAttr( "defaultRenderGlobals.top" )
-                bottom = cmds.getAttr( "defaultRenderGlobals.bot" )
-            
-                imageWidth = cmds.getAttr("defaultResolution.width")
-                imageHeight = cmds.getAttr("defaultResolution.height")
-
-                pathTokens = os.path.splitext(imageName)
-                imageNameCropped = "%s_crop%s" % (pathTokens[0], pathTokens[1])
-                #print( "Generating cropped image : %s" % imageNameCropped )
-
+        renderRegion = MitsubaRendererIO.getRenderRegion()
+        if renderRegion:
+            (left, right, top, bottom) = renderRegion
+        
+            imageWidth = cmds.getAttr("defaultResolution.width")
+            imageHeight = cmds.getAttr("defaultResolution.height")
+
+            # Rewrite the header or pad the image in memory when the format allows it
+            resetStart = time.time()
+            if imagefile.resetDataWindow(imageName, imageWidth, imageHeight, left, imageHeight-top-1):
+                print( "Reset image data window - native  : %.3f seconds" % (time.time() - resetStart) )
+                return
+
+            if oiiotoolPath == "":
+                print( "Unable to reset image data window without oiiotool : %s" % imageName )
+                return
+
+            pathTokens = os.path.splitext(imageName)
+            imageNameCropped = "%s_crop%s" % (pathTokens[0], pathTokens[1])
+            #print( "Generating cropped image : %s" % imageNameCropped )
+
+            oiiotoolResult = None
+            try:
+                #cmd = '/usr/local/bin/oiiotool'
+                cropArgs = '%dx%d-%d-%d' % (imageWidth, imageHeight, left, imageHeight-top)
+                args = ['-v', imageName, '--crop', cropArgs, '--noautocrop', '-o', imageNameCropped]
+                oiiotool = Process(description='reset image data window',
+                    cmd=oiiotoolPath,
+                    args=args)
+                oiiotool.execute()
+                oiiotoolResult = oiiotool.status
+                #print( "oiiotool result : %s" % oiiotoolResult )
+            except:
+                print( "Unable to run oiiotool" )
                 oiiotoolResult = None
-                try:
-                    #cmd = '/usr/local/bin/oiiotool'
-                    cropArgs = '%dx%d-%d-%d' % (imageWidth, imageHeight, left, imageHeight-top)
-                    args = ['-v', imageName, '--crop', cropArgs, '--noautocrop', '-o', imageNameCropped]
-                    oiiotool = Process(description='reset image data window',
-                        cmd=oiiotoolPath,
-                        args=args)
-                    oiiotool.execute()
-                    oiiotoolResult = oiiotool.status
-                    #print( "oiiotool result : %s" % oiiotoolResult )
-                except:
-                    print( "Unable to run oiiotool" )
-                    oiiotoolResult = None
-
-                # Move the image with the new data window over the original rendered image
-                if oiiotoolResult in [0, None]:
-                    os.rename(imageNameCropped, imageName)
+
+            # Move the image with the new data window over the original rendered image
+            if oiiotoolResult in [0, None]:
+                os.rename(imageNameCropped, imageName)
+
+            print( "Reset image data window - oiiotool : %.3f seconds" % (time.time() - resetStart) )
+
+    @chrometrace.traced('oiiotool')
+    def compositeRenderRegion(self, imageName, fullFrameImageName, oiiotoolPath):
+        renderRegion = MitsubaRendererIO.getRenderRegion()
+        if not renderRegion or not os.path.exists(fullFrameImageName):
+            return False
+
+        (left, right, top, bottom) = renderRegion
+
+        imageWidth = cmds.getAttr("defaultResolution.width")
+        imageHeight = cmds.getAttr("defaultResolution.height")
+
+        fullFrameResolution = imagefile.getImageResolution(fullFrameImageName)
+        if fullFrameResolution and fullFrameResolution != (imageWidth, imageHeight):
+            print( "Full frame image resolution doesn't match render resolution : %s" % fullFrameImageName )
+            return False
+
+        # Paste the rendered region over the last full frame, in memory when the format allows it
+        compositeStart = time.time()
+        if not imagefile.pasteImage(fullFrameImageName, imageName, left, imageHeight-top-1, imageName):
+            if oiiotoolPath == "":
+                return False
+
+            pathTokens = os.path.splitext(imageName)
+            imageNameComposite = "%s_composite%s" % (pathTokens[0], pathTokens[1])
+
+            try:
+                # --paste takes the foreground first, then the background
+                pasteArgs = '+%d+%d' % (left, imageHeight-top-1)
+                args = ['-v', imageName, fullFrameImageName, '--paste', pasteArgs, '-o', imageNameComposite]
+                oiiotool = Process(description='composite render region',
+                    cmd=oiiotoolPath,
+                    args=args)
+                oiiotool.execute()
+            except:
+                print( "Unable to run oiiotool" )
+                return False
+
+            if not os.path.exists(imageNameComposite):
+                return False
+
+            os.remove(imageName)
+            os.rename(imageNameComposite, imageName)
+
+        # The composite becomes the full frame for the next region render
+        shutil.copyfile(imageName, fullFrameImageName)
+
+        print( "Composite render region : %.3f seconds" % (time.time() - compositeStart) )
+
+        return True
 
     def getScenePrefix(self):
         return str('.'.join(os.path.split(cmds.file(q=True, sn=True))[-1].split('.')[:-1]))
 
+    def executeMitsuba(self,
+                       outFileName,
+                       imageName,
+                       logName,
+                       mitsubaPath,
+                       mtsDir,
+                       args,
+                       showPartialResults=True,
+                       logHeader=None):
+        args = args + [
+            '-o',
+            imageName,
+            outFileName]
+
+        if ' ' in mtsDir:
+            env = {"LD_LIBRARY_PATH":str("\"%s\"" % mtsDir)}
+        else:
+            env = {"LD_LIBRARY_PATH":str(mtsDir)}
+
+        mitsubaRender = Process(description='render an image',
+            cmd=mitsubaPath,
+            args=args,
+            env=env)
+
+        # Mitsuba loads the scene before starting the render job
+        renderJobStart = []
+
+        def renderLogCallback(line):
+            if not renderJobStart and "Starting render job" in line:
+                renderJobStart.append(time.time())
+
+            if showPartialResults and "Writing image" in line:
+                imageName = line.split("\"")[-2]
+
+                # Display the render
+                if not cmds.about(batch=True):
+                    MitsubaRendererUI.showRender(imageName)
+
+        mitsubaRender.log_callback = renderLogCallback
+        #mitsubaRender.echo = False
+
+        with chrometrace.span("executeMitsuba", "render", image=imageName):
+            mitsubaRender.execute()
+
+        if renderJobStart and mitsubaRender.pid is not None:
+            chrometrace.recordSpan("load scene", "render", mitsubaRender.trace_start,
+                renderJobStart[0], mitsubaRender.pid)
+            chrometrace.recordSpan("render job", "render", renderJobStart[0],
+                time.time(), mitsubaRender.pid)
+
+        mitsubaRender.write_log_to_disk(logName, format='txt', header=logHeader)
+
+        print( "Render execution returned : %s" % mitsubaRender.status )
+
+        return mitsubaRender.status
+
+    @chrometrace.traced('oiiotool')
+    def accumulateImage(self, imageName, passImageName, accumulatedSamples, passSamples, oiiotoolPath):
+        if accumulatedSamples == 0 or not os.path.exists(imageName):
+            if os.path.exists(imageName):
+                os.remove(imageName)
+            os.rename(passImageName, imageName)
+            return
+
+        # Weight each image by the number of samples it contains
+        totalSamples = float(accumulatedSamples + passSamples)
+        accumulatedWeight = accumulatedSamples/totalSamples
+        passWeight = passSamples/totalSamples
+
+        pathTokens = os.path.splitext(imageName)
+        imageNameAccumulated = "%s_accumulated%s" % (pathTokens[0], pathTokens[1])
+
+        accumulated = False
+        if pathTokens[1].lower() == ".pfm":
+            accumulated = imagefile.blendPFM(imageName, passImageName, 
+                accumulatedWeight, passWeight, imageNameAccumulated)
+
+        if not accumulated and oiiotoolPath != "":
+            try:
+                args = [imageName, '--mulc', str(accumulatedWeight), 
+                    passImageName, '--mulc', str(passWeight), 
+                    '--add', '-o', imageNameAccumulated]
+                oiiotool = Process(description='accumulate progressive pass',
+                    cmd=oiiotoolPath,
+                    args=args)
+                oiiotool.echo = False
+                oiiotool.execute()
+                accumulated = os.path.exists(imageNameAccumulated)
+            except:
+                print( "Unable to run oiiotool" )
+
+        if accumulated:
+            os.remove(imageName)
+            os.remove(passImageName)
+            os.rename(imageNameAccumulated, imageName)
+
+        # Without a way to average images, keep the image with the most samples
+        else:
+            print( "Unable to accumulate progressive pass : %s" % passImageName )
+            if passSamples > accumulatedSamples:
+                os.remove(imageName)
+                os.rename(passImageName, imageName)
+            else:
+                os.remove(passImageName)
+
+    def renderPass(self,
+                   outFileName,
+                   imageName,
+                   logName,
+                   sceneElement,
+                   mitsubaPath,
+                   mtsDir,
+                   args,
+                   frame,
+                   renderSettings,
+                   passIndex,
+                   passSampleCount,
+                   passScramble,
+                   showPartialResults=False):
+        samplerElement = MitsubaRendererIO.writeSampler(frame, renderSettings, 
+            passSampleCount, passScramble)
+        MitsubaRendererIO.replaceSampler(sceneElement, samplerElement)
+        MitsubaRendererIO.writeSceneElement(outFileName, sceneElement)
+
+        imagePathTokens = os.path.splitext(imageName)
+        logPathTokens = os.path.splitext(logName)
+        passImageName = "%s_pass%d%s" % (imagePathTokens[0], passIndex, imagePathTokens[1])
+        passLogName = "%s_pass%d%s" % (logPathTokens[0], passIndex, logPathTokens[1])
+
+        self.executeMitsuba(outFileName, passImageName, passLogName, mitsubaPath, mtsDir, args, 
+            showPartialResults=showPartialResults)
+
+        if not os.path.exists(passImageName):
+            print( "Render pass %d didn't produce an image" % passIndex )
+            return None
+
+        return passImageName
+
+    def renderSceneProgressive(self,
+                               outFileName,
+                               imageName,
+                               logName,
+                               sceneElement,
+                               mitsubaPath,
+                               oiiotoolPath,
+                               mtsDir,
+                               args,
+                               frame,
+                               renderSettings):
+        sampleCount = cmds.getAttr("%s.%s" % (renderSettings, "sampleCount"))
+        passSampleCount = max(1, cmds.getAttr("%s.%s" % (renderSettings, "progressiveInitialSampleCount")))
+        timeBudget = cmds.getAttr("%s.%s" % (renderSettings, "progressiveTimeBudget"))
+        samplerScramble = cmds.getAttr("%s.%s" % (renderSettings, "samplerScramble"))
+        if samplerScramble == -1:
+            samplerScramble = frame
+
+        print( "Render Settings - Progressive      : %s" % True )
+        print( "Render Settings - Initial Samples  : %s" % passSampleCount )
+        print( "Render Settings - Time Budget      : %s" % timeBudget )
+
+        renderStart = time.time()
+        secondsPerSample = None
+        accumulatedSamples = 0
+        passIndex = 0
+
+        while accumulatedSamples < sampleCount:
+            passSampleCount = min(passSampleCount, sampleCount - accumulatedSamples)
+
+            # Size the pass to fit in the remaining time
+            if timeBudget > 0 and secondsPerSample:
+                remainingSeconds = timeBudget - (time.time() - renderStart)
+                passSampleCount = min(passSampleCount, int(remainingSeconds/secondsPerSample))
+                if passSampleCount < 1:
+                    print( "Progressive render - time budget reached" )
+                    break
+
+            # Each pass uses a different scramble value so that the passes are independent
+            passScramble = samplerScramble*kProgressiveMaxPasses + passIndex
+
+            passStart = time.time()
+            passImageName = self.renderPass(outFileName, imageName, logName, sceneElement, 
+                mitsubaPath, mtsDir, args, frame, renderSettings, 
+                passIndex, passSampleCount, passScramble, showPartialResults=(passIndex == 0))
+            passSeconds = time.time() - passStart
+
+            if not passImageName:
+                break
+
+            self.accumulateImage(imageName, passImageName, accumulatedSamples, passSampleCount, oiiotoolPath)
+            accumulatedSamples += passSampleCount
+            secondsPerSample = passSeconds/passSampleCount
+
+            print( "Progressive render - pass %d : %d samples, %d accumulated, %.1f seconds" % (
+                passIndex, passSampleCount, accumulatedSamples, passSeconds) )
+
+            # Display the running average
+            if not cmds.about(batch=True):
+                MitsubaRendererUI.showRender(imageName)
+
+            passSampleCount *= 2
+            passIndex += 1
+            if passIndex >= kProgressiveMaxPasses:
+                break
+
+        print( "Progressive render - %d samples in %.1f seconds" % (
+            accumulatedSamples, time.time() - renderStart) )
+
+    @chrometrace.traced('oiiotool')
+    def estimateNoise(self, imageNameA, imageNameB, oiiotoolPath):
+        # Two renders that differ only in their sampler scramble have the same expected value,
+        # so half of the mean squared difference estimates the variance of each render
+        statistics = None
+        if os.path.splitext(imageNameA)[-1].lower() == ".pfm":
+            statistics = imagefile.differencePFM(imageNameA, imageNameB)
+
+        if not statistics and oiiotoolPath != "":
+            pathTokens = os.path.splitext(imageNameA)
+            imageNameDifference = "%s_difference%s" % (pathTokens[0], pathTokens[1])
+
+            try:
+                args = [imageNameA, imageNameB, '--sub', '--dup', '--mul', '-o', imageNameDifference]
+                oiiotool = Process(description='difference of pilot renders',
+                    cmd=oiiotoolPath,
+                    args=args)
+                oiiotool.echo = False
+                oiiotool.execute()
+
+                args = ['--info', '--stats', imageNameDifference, imageNameA, imageNameB]
+                oiiotool = Process(description='statistics of pilot renders',
+                    cmd=oiiotoolPath,
+                    args=args)
+                oiiotool.echo = False
+                oiiotool.execute()
+
+                # Average the color channels of the difference and both pilots
+                averages = []
+                for line in oiiotool.log:
+                    if "Stats Avg:" in line:
+                        values = []
+                        for token in line.split(':')[-1].split()[:3]:
+                            try:
+                                values.append(float(token))
+                            except ValueError:
+                                pass
+                        averages.append(sum(values)/max(1, len(values)))
+
+                if len(averages) == 3:
+                    statistics = (averages[0], (averages[1] + averages[2])/2.0)
+            except:
+                print( "Unable to run oiiotool" )
+
+            if os.path.exists(imageNameDifference):
+                os.remove(imageNameDifference)
+
+        if not statistics:
+            return None
+
+        (meanSquaredDifference, mean) = statistics
+        if mean <= 0.0:
+            return None
+
+        # Relative standard deviation of a single pilot render
+        return math.sqrt(meanSquaredDifference/2.0)/mean
+
+    def renderSceneAdaptive(self,
+                            outFileName,
+                            imageName,
+                            logName,
+                            sceneElement,
+                            mitsubaPath,
+                            oiiotoolPath,
+                            mtsDir,
+                            args,
+                            frame,
+                            renderSettings):
+        sampleCount = cmds.getAttr("%s.%s" % (renderSettings, "sampleCount"))
+        pilotSampleCount = max(1, cmds.getAttr("%s.%s" % (renderSettings, "adaptiveSamplingPilotSampleCount")))
+        targetNoise = cmds.getAttr("%s.%s" % (renderSettings, "adaptiveSamplingTargetNoise"))
+        minSampleCount = cmds.getAttr("%s.%s" % (renderSettings, "adaptiveSamplingMinSampleCount"))
+        maxSampleCount = cmds.getAttr("%s.%s" % (renderSettings, "adaptiveSamplingMaxSampleCount"))
+        samplerScramble = cmds.getAttr("%s.%s" % (renderSettings, "samplerScramble"))
+        if samplerScramble == -1:
+            samplerScramble = frame
+
+        print( "Render Settings - Adaptive Sampling : %s" % True )
+        print( "Render Settings - Pilot Samples     : %s" % pilotSampleCount )
+        print( "Render Settings - Target Noise      : %s" % targetNoise )
+
+        renderStart = time.time()
+
+        # Two independent pilot renders
+        pilotImageNames = []
+        for passIndex in range(2):
+            passScramble = samplerScramble*kProgressiveMaxPasses + passIndex
+            pilotImageName = self.renderPass(outFileName, imageName, logName, sceneElement, 
+                mitsubaPath, mtsDir, args, frame, renderSettings, 
+                passIndex, pilotSampleCount, passScramble)
+            if pilotImageName:
+                pilotImageNames.append(pilotImageName)
+
+        noise = None
+        if len(pilotImageNames) == 2:
+            noise = self.estimateNoise(pilotImageNames[0], pilotImageNames[1], oiiotoolPath)
+
+        # Noise falls with the square root of the sample count
+        if noise is not None and targetNoise > 0.0:
+            frameSampleCount = int(math.ceil(pilotSampleCount*(noise/targetNoise)**2))
+            frameSampleCount = max(minSampleCount, min(maxSampleCount, frameSampleCount))
+            print( "Adaptive sampling - frame %s : pilot noise %.4f, sampleCount %d" % (
+                frame, noise, frameSampleCount) )
+        else:
+            frameSampleCount = sampleCount
+            print( "Adaptive sampling - frame %s : unable to estimate noise, sampleCount %d" % (
+                frame, frameSampleCount) )
+
+        # The pilot renders contribute to the final image
+        accumulatedSamples = 0
+        for pilotImageName in pilotImageNames:
+            self.accumulateImage(imageName, pilotImageName, accumulatedSamples, pilotSampleCount, oiiotoolPath)
+            accumulatedSamples += pilotSampleCount
+
+        remainingSampleCount = frameSampleCount - accumulatedSamples
+        if remainingSampleCount > 0:
+            passScramble = samplerScramble*kProgressiveMaxPasses + 2
+            passImageName = self.renderPass(outFileName, imageName, logName, sceneElement, 
+                mitsubaPath, mtsDir, args, frame, renderSettings, 
+                2, remainingSampleCount, passScramble, showPartialResults=True)
+            if passImageName:
+                self.accumulateImage(imageName, passImageName, accumulatedSamples, remainingSampleCount, oiiotoolPath)
+                accumulatedSamples += remainingSampleCount
+
+        print( "Adaptive sampling - frame %s : %d samples in %.1f seconds" % (
+            frame, accumulatedSamples, time.time() - renderStart) )
+
+        return accumulatedSamples
+
+    def recordRenderEstimate(self, estimate, renderDir, logName, peakMemoryStart):
+        try:
+            with open(logName, 'r') as logFile:
+                renderTime = MitsubaRendererEstimate.parseRenderTime(logFile)
+        except (IOError, OSError):
+            renderTime = None
+
+        # The children's peak memory only reflects this render if it grew
+        peakMemory = MitsubaRendererEstimate.getChildPeakMemory()
+        if peakMemory is None or peakMemoryStart is None or peakMemory <= peakMemoryStart:
+            peakMemory = None
+
+        if renderTime:
+            print( "Render Estimate - Actual Time      : %s (estimated %s)" % (
+                MitsubaRendererEstimate.formatSeconds(renderTime),
+                MitsubaRendererEstimate.formatSeconds(estimate['time'])) )
+        if peakMemory:
+            print( "Render Estimate - Actual Memory    : %s (estimated %s)" % (
+                MitsubaRendererEstimate.formatBytes(peakMemory),
+                MitsubaRendererEstimate.formatBytes(estimate['memory'])) )
+
+        MitsubaRendererEstimate.recordCalibration(renderDir, estimate, renderTime, peakMemory)
+
+    def getRenderCache(self, renderDir, renderSettings):
+        cacheSize = cmds.getAttr("%s.%s" % (renderSettings, "renderCacheSize"))
+        return MitsubaRendererCache.RenderCache(os.path.join(renderDir, "renderCache"),
+            cacheSize*1024*1024)
+
+    # Settings that change the rendered image without changing the scene description
+    def getRenderCacheOptions(self, renderSettings, progressive, adaptiveSampling):
+        options = {}
+        if adaptiveSampling:
+            for attribute in ["adaptiveSamplingPilotSampleCount", "adaptiveSamplingTargetNoise", 
+                "adaptiveSamplingMinSampleCount", "adaptiveSamplingMaxSampleCount"]:
+                options[attribute] = cmds.getAttr("%s.%s" % (renderSettings, attribute))
+        elif progressive:
+            for attribute in ["progressiveInitialSampleCount", "progressiveTimeBudget"]:
+                options[attribute] = cmds.getAttr("%s.%s" % (renderSettings, attribute))
+        return options
+
     def renderScene(self,
                     outFileName, 
                     renderDir, 
@@ -275,7 +803,8 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
                     animation=False, 
                     frame=1, 
                     verbose=False,
-                    renderSettings=None):
+                    renderSettings=None,
+                    sceneElement=None):
         imageDir = os.path.join(os.path.split(renderDir)[0], 'images')
         os.chdir(imageDir)
 
@@ -289,6 +818,8 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
         writePartialResultsInterval = -1
         blockSize = 32
         threads = 0
+        regionComposite = False
+        renderEstimate = False
         if renderSettings:
             extension = getImageExtension(renderSettings)
 
@@ -296,12 +827,16 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
             writePartialResultsInterval = cmds.getAttr("%s.%s" % (renderSettings, "writePartialResultsInterval"))
             blockSize = cmds.getAttr("%s.%s" % (renderSettings, "blockSize"))
             threads = cmds.getAttr("%s.%s" % (renderSettings, "threads"))
+            regionComposite = cmds.getAttr("%s.%s" % (renderSettings, "regionComposite"))
+            renderEstimate = cmds.getAttr("%s.%s" % (renderSettings, "renderEstimate"))
 
             print( "Render Settings - Partial Results  : %s" % writePartialResults )
             print( "Render Settings - Results Interval : %s" % writePartialResultsInterval )
             print( "Render Settings - Block Size       : %s" % blockSize )
             if threads:
                 print( "Render Settings - Threads          : %s" % threads )
+            print( "Render Settings - Region Composite : %s" % regionComposite )
+            print( "Render Settings - Render Estimate  : %s" % renderEstimate )
 
         if animation:
             extensionPadding = cmds.getAttr("defaultRenderGlobals.extensionPadding")
@@ -319,51 +854,78 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
         if threads:
             args.extend(['-p', str(threads)])
         args.extend([
-            '-b', str(blockSize), 
-            '-o',
-            imageName,
-            outFileName])
-
-        if ' ' in mtsDir:
-            env = {"LD_LIBRARY_PATH":str("\"%s\"" % mtsDir)}
+            '-b', str(blockSize)])
+
+        progressive = False
+        adaptiveSampling = False
+        if renderSettings and sceneElement:
+            progressive = cmds.getAttr("%s.%s" % (renderSettings, "progressive"))
+            adaptiveSampling = cmds.getAttr("%s.%s" % (renderSettings, "adaptiveSampling"))
+
+        # Reuse the image of an identical scene rendered earlier
+        renderCache = None
+        cacheKey = None
+        cached = False
+        if renderSettings and sceneElement and cmds.getAttr("%s.%s" % (renderSettings, "renderCache")):
+            renderCache = self.getRenderCache(renderDir, renderSettings)
+            cacheKey = MitsubaRendererCache.getSceneKey(MitsubaRendererIO.getElementHash(sceneElement),
+                mitsubaPath, mtsDir,
+                self.getRenderCacheOptions(renderSettings, progressive, adaptiveSampling))
+            cached = renderCache.fetch(cacheKey, imageName)
+            print( "Render Settings - Render Cache     : %s" % ("hit" if cached else "miss") )
+        renderStart = time.time()
+
+        if cached:
+            with open(logName, 'w') as logFile:
+                logFile.write("Render cache hit : %s\n" % cacheKey)
+        elif adaptiveSampling:
+            self.renderSceneAdaptive(outFileName, imageName, logName, sceneElement, 
+                mitsubaPath, oiiotoolPath, mtsDir, args, frame, renderSettings)
+        elif progressive:
+            self.renderSceneProgressive(outFileName, imageName, logName, sceneElement, 
+                mitsubaPath, oiiotoolPath, mtsDir, args, frame, renderSettings)
         else:
-            env = {"LD_LIBRARY_PATH":str(mtsDir)}
-
-        mitsubaRender = Process(description='render an image',
-            cmd=mitsubaPath,
-            args=args,
-            env=env)
-
-        def renderLogCallback(line):
-            if "Writing image" in line:
-                imageName = line.split("\"")[-2]
-
-                # Display the render
-                if not cmds.about(batch=True):
-                    MitsubaRendererUI.showRender(imageName)
-
-        mitsubaRender.log_callback = renderLogCallback
-        #mitsubaRender.echo = False
-
-        mitsubaRender.execute()
-        mitsubaRender.write_log_to_disk(logName, format='txt')
-
-        print( "Render execution returned : %s" % mitsubaRender.status )
-
-        if oiiotoolPath != "":
-            self.resetImageDataWindow(imageName, oiiotoolPath)
+            estimate = None
+            estimateText = None
+            if renderEstimate and sceneElement:
+                estimate = MitsubaRendererEstimate.estimateRender(sceneElement, renderDir)
+                estimateText = MitsubaRendererEstimate.formatEstimate(estimate) + "\n"
+                print( estimateText )
+
+            peakMemoryStart = MitsubaRendererEstimate.getChildPeakMemory()
+
+            self.executeMitsuba(outFileName, imageName, logName, mitsubaPath, mtsDir, args,
+                logHeader=estimateText)
+
+            if estimate:
+                self.recordRenderEstimate(estimate, renderDir, logName, peakMemoryStart)
+
+        # Only cache an image written by this render
+        if (renderCache and not cached and os.path.exists(imageName) and
+            os.path.getmtime(imageName) >= int(renderStart)):
+            renderCache.store(cacheKey, imageName)
+
+        # Region renders can be composited into the last full frame render
+        fullFrameImageName = os.path.join(renderDir, imagePrefix + "_fullFrame." + extension)
+        if MitsubaRendererIO.getRenderRegion():
+            if not (regionComposite and not animation and
+                self.compositeRenderRegion(imageName, fullFrameImageName, oiiotoolPath)):
+                self.resetImageDataWindow(imageName, oiiotoolPath)
+        elif regionComposite and not animation and os.path.exists(imageName):
+            shutil.copyfile(imageName, fullFrameImageName)
 
         if not keepTempFiles:
             #Delete all of the temp file we just made
-            os.chdir(renderDir)
-            for geometryFile in geometryFiles:
-                try:
-                    #print( "Removing geometry : %s" % geometryFile )
-                    os.remove(geometryFile)
-                except:
-                    print( "Error removing temporary file : %s" % geometryFile )
-            #print( "Removing mitsuba scene description : %s" % outFileName )
-            os.remove(outFileName)
+            with chrometrace.span("removeTempFiles", "cleanup", files=len(geometryFiles) + 1):
+                os.chdir(renderDir)
+                for geometryFile in geometryFiles:
+                    try:
+                        #print( "Removing geometry : %s" % geometryFile )
+                        os.remove(geometryFile)
+                    except:
+                        print( "Error removing temporary file : %s" % geometryFile )
+                #print( "Removing mitsuba scene description : %s" % outFileName )
+                os.remove(outFileName)
             #os.remove(logName)
         else:
             print( "Keeping temporary files" )
@@ -379,7 +941,8 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
                         keepTempFiles,  
                         animation, 
                         frame=None, 
-                        verbose=False):
+                        verbose=False,
+                        sequenceCache=None):
 
         if frame != None:
             # Calling this can lead to Maya 2016 locking up if you don't have MAYA_RELEASE_PYTHON_GIL set
@@ -396,13 +959,44 @@ class mitsubaForMaya(OpenMayaMPx.MPxCommand):
 
         outFileName = os.path.join(renderDir, "%s.xml" % scenePrefix)
 
-        # Export scene and geometry
-        geometryFiles = MitsubaRendererIO.writeScene(outFileName, renderDir, renderSettings)
-
-        # Render scene, delete scene and geometry
-        imageName = self.renderScene(outFileName, renderDir, mitsubaPath, oiiotoolPath,
-            mtsDir, keepTempFiles, geometryFiles, animation, frame, verbose,
-            renderSettings)
+        # Count maya.cmds calls while exporting and rendering
+        statistics = None
+        if cmds.getAttr("%s.%s" % (renderSettings, "exportStatistics")):
+            statistics = MitsubaRendererStatistics.ExportStatistics()
+            statistics.countCommands(cmds)
+
+        # Profile the Python side of the export and render
+        profile = MitsubaRendererProfile.renderProfile(
+            cmds.getAttr("%s.%s" % (renderSettings, "renderProfile")),
+            cmds.getAttr("%s.%s" % (renderSettings, "renderProfileMemory")))
+
+        try:
+            with profile:
+                # Export scene and geometry
+                with exportStage(statistics, "getSceneElement") as stage:
+                    (sceneElement, geometryFiles) = MitsubaRendererIO.getSceneElement(renderDir, 
+                        renderSettings, statistics, sequenceCache)
+                    stage.addElements(sceneElement)
+
+                with exportStage(statistics, "writeSceneElement") as stage:
+                    MitsubaRendererIO.writeSceneElement(outFileName, sceneElement)
+                    stage.addFile(outFileName)
+
+                # Render scene, delete scene and geometry
+                with exportStage(statistics, "renderScene"):
+                    imageName = self.renderScene(outFileName, renderDir, mitsubaPath, oiiotoolPath,
+                        mtsDir, keepTempFiles, geometryFiles, animation, frame, verbose,
+                        renderSettings, sceneElement)
+        finally:
+            if statistics:
+                statistics.restoreCommands()
+
+        # Summarize next to the frame's log
+        if statistics:
+            print( statistics.formatTable() )
+            statistics.writeJSON(MitsubaRendererStatistics.getStatisticsFileName(imageName))
+
+        profile.write(imageName)
 
         return imageName
 
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+
+kCacheIndexFileName = "index.json"
+kHashBlockSize = 1024*1024
+
+# Coarsest modification time resolution of the filesystems in use, FAT's
+kTimestampResolution = 2.0
+
+# File hashes and Mitsuba versions, keyed by path, inode, size and
+# modification time
+fileHashes = {}
+mitsubaVersions = {}
+
+#
+# Content hashes
+#
+def getFileStamp(filename):
+    try:
+        stat = os.stat(filename)
+    except (IOError, OSError):
+        return None
+    mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+    return (os.path.abspath(filename), stat.st_ino, stat.st_size, mtime)
+
+# A file rewritten at the same size within its modification time's resolution
+# keeps its stamp, so the hashes of files modified that recently aren't kept.
+# Files the exporter writes each frame are hashed again until they're older.
+def hashFile(filename):
+    stamp = getFileStamp(filename)
+    if stamp is None:
+        return None
+    if stamp in fileHashes:
+        return fileHashes[stamp]
+
+    fileHash = hashlib.sha1()
+    try:
+        modified = os.path.getmtime(filename)
+        with open(filename, 'rb') as f:
+            while True:
+                block = f.read(kHashBlockSize)
+                if not block:
+                    break
+                fileHash.update(block)
+    except (IOError, OSError):
+        return None
+
+    if time.time() - modified > kTimestampResolution:
+        fileHashes[stamp] = fileHash.hexdigest()
+    return fileHash.hexdigest()
+
+# The version line printed by 'mitsuba -h', or a fingerprint of the binary
+# when the version can't be read
+def getMitsubaVersion(mitsubaPath, mtsDir=None):
+    stamp = getFileStamp(mitsubaPath)
+    if stamp is None:
+        return None
+    if stamp in mitsubaVersions:
+        return mitsubaVersions[stamp]
+
+    version = None
+    try:
+        env = dict(os.environ)
+        if mtsDir:
+            env["LD_LIBRARY_PATH"] = str(mtsDir)
+        process = subprocess.Popen([mitsubaPath, '-h'], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0].decode('utf-8', 'replace')
+        match = re.search(r"Mitsuba version ([^\s,]+)", output)
+        if match:
+            version = match.group(1)
+    except (IOError, OSError, ValueError):
+        pass
+
+    if version is None:
+        version = "binary-%s" % hashFile(mitsubaPath)
+
+    mitsubaVersions[stamp] = version
+    return version
+
+# Key for the image produced by rendering a scene with a Mitsuba binary.
+# sceneHash is the scene element's Merkle hash, which covers the content of the
+# files it references. renderOptions holds the settings that change the image
+# without appearing in the scene description.
+def getSceneKey(sceneHash, mitsubaPath, mtsDir=None, renderOptions=None):
+    keyHash = hashlib.sha1()
+    keyHash.update(sceneHash.encode('utf-8'))
+    keyHash.update(("\nmitsuba %s" % getMitsubaVersion(mitsubaPath, mtsDir)).encode('utf-8'))
+    if renderOptions:
+        keyHash.update(("\n" + json.dumps(renderOptions, sort_keys=True)).encode('utf-8'))
+    return keyHash.hexdigest()
+
+#
+# Rendered images, keyed by scene key, evicted least recently used first
+#
+class RenderCache(object):
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.entries = self.readIndex()
+
+    def getIndexFileName(self):
+        return os.path.join(self.cacheDir, kCacheIndexFileName)
+
+    def readIndex(self):
+        try:
+            with open(self.getIndexFileName(), 'r') as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        # Drop entries whose images have gone missing
+        return dict([(key, entry) for key, entry in entries.items()
+            if os.path.exists(os.path.join(self.cacheDir, entry['file']))])
+
+    def writeIndex(self):
+        try:
+            with open(self.getIndexFileName(), 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+        except (IOError, OSError):
+            print( "Unable to write render cache index : %s" % self.getIndexFileName() )
+
+    def getSize(self):
+        return sum([entry['bytes'] for entry in self.entries.values()])
+
+    # Copies the cached image for key to imageName. Returns False on a miss.
+    def fetch(self, key, imageName):
+        entry = self.entries.get(key)
+        if not entry:
+            return False
+
+        try:
+            shutil.copyfile(os.path.join(self.cacheDir, entry['file']), imageName)
+        except (IOError, OSError):
+            del self.entries[key]
+            self.writeIndex()
+            return False
+
+        entry['lastUsed'] = time.time()
+        entry['hits'] = entry.get('hits', 0) + 1
+        self.writeIndex()
+        return True
+
+    def store(self, key, imageName):
+        if not os.path.exists(imageName):
+            return False
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        cachedName = key + os.path.splitext(imageName)[-1]
+        try:
+            shutil.copyfile(imageName, os.path.join(self.cacheDir, cachedName))
+        except (IOError, OSError):
+            print( "Unable to add render to cache : %s" % imageName )
+            return False
+
+        self.entries[key] = {
+            'file' : cachedName,
+            'bytes' : os.path.getsize(imageName),
+            'lastUsed' : time.time(),
+            'hits' : 0,
+        }
+        self.evict()
+        self.writeIndex()
+        return key in self.entries
+
+    def evict(self):
+        size = self.getSize()
+        for key in sorted(self.entries, key=lambda x: self.entries[x]['lastUsed']):
+            if size <= self.maxBytes:
+                break
+            entry = self.entries.pop(key)
+            size -= entry['bytes']
+            try:
+                os.remove(os.path.join(self.cacheDir, entry['file']))
+            except (IOError, OSError):
+                pass
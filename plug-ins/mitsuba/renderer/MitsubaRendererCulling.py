@@ -0,0 +1,150 @@
+import math
+
+import maya.cmds as cmds
+
+#
+# Culling of geometry that can't contribute to the image
+#
+
+# 4x4 matrices are flat lists of 16 values in Maya's row vector convention
+def multiplyMatrices(a, b):
+    result = [0.0]*16
+    for row in range(4):
+        for column in range(4):
+            result[row*4 + column] = sum([a[row*4 + i]*b[i*4 + column] for i in range(4)])
+    return result
+
+def transformPoint(matrix, point):
+    (x, y, z) = point
+    return [x*matrix[column] + y*matrix[4 + column] + z*matrix[8 + column] + matrix[12 + column]
+        for column in range(3)]
+
+def getBoundingBoxCorners(shape):
+    (minX, minY, minZ) = cmds.getAttr(shape + ".boundingBoxMin")[0]
+    (maxX, maxY, maxZ) = cmds.getAttr(shape + ".boundingBoxMax")[0]
+    return [(x, y, z) for x in (minX, maxX) for y in (minY, maxY) for z in (minZ, maxZ)]
+
+# Meshes with an area light shader are written as emitters, so they light the
+# scene from wherever they are
+def hasAreaLight(shape):
+    for sg in set(cmds.listConnections(shape, type="shadingEngine") or []):
+        for shader in cmds.listConnections(sg + ".surfaceShader") or []:
+            if cmds.nodeType(shader) == "MitsubaObjectAreaLightShader":
+                return True
+    return False
+
+# Plane through the origin with the given normal, normalized so distances are
+# in world units
+def normalizePlane(x, y, z, d=0.0):
+    length = math.sqrt(x*x + y*y + z*z)
+    return (x/length, y/length, z/length, d/length)
+
+# The camera's view volume, as planes in camera space whose positive side is
+# outside. Maya cameras look down -z. margin widens the sides, as a fraction of
+# the width and height of the image. Geometry is kept while it's within
+# giDistance of the view volume, so nearby geometry still casts shadows and
+# bounces light into view. Geometry further than cullDistance from the camera
+# is always culled, when cullDistance is set. Sensors that see in every
+# direction only cull by distance, with viewPlanes turned off.
+class CameraFrustum(object):
+    def __init__(self, cameraShape, margin=0.0, giDistance=0.0, cullDistance=0.0, viewPlanes=True):
+        self.cameraShape = cameraShape
+        self.giDistance = giDistance
+        self.cullDistance = cullDistance
+        self.worldToCamera = cmds.getAttr(cameraShape + ".worldInverseMatrix")
+
+        imageWidth = cmds.getAttr("defaultResolution.width")
+        imageHeight = cmds.getAttr("defaultResolution.height")
+        aspect = float(imageHeight)/imageWidth
+
+        nearClip = cmds.getAttr(cameraShape + ".nearClipPlane")
+        scale = 1.0 + margin
+
+        if cmds.getAttr(cameraShape + ".orthographic"):
+            halfWidth = scale*cmds.getAttr(cameraShape + ".orthographicWidth")/2.0
+            halfHeight = halfWidth*aspect
+            self.planes = [
+                (1.0, 0.0, 0.0, -halfWidth),
+                (-1.0, 0.0, 0.0, -halfWidth),
+                (0.0, 1.0, 0.0, -halfHeight),
+                (0.0, -1.0, 0.0, -halfHeight),
+            ]
+        else:
+            fov = cmds.camera(cameraShape, query=True, horizontalFieldOfView=True)
+            tanX = scale*math.tan(math.radians(fov)/2.0)
+            tanY = tanX*aspect
+            self.planes = [
+                normalizePlane(1.0, 0.0, tanX),
+                normalizePlane(-1.0, 0.0, tanX),
+                normalizePlane(0.0, 1.0, tanY),
+                normalizePlane(0.0, -1.0, tanY),
+            ]
+        self.planes.append( (0.0, 0.0, 1.0, nearClip) )
+
+        if not viewPlanes:
+            self.planes = []
+
+    # A box is outside when all of its corners are more than giDistance
+    # outside of the same plane
+    def isCulled(self, transform, shape):
+        objectToCamera = multiplyMatrices(cmds.getAttr(transform + ".worldMatrix"), self.worldToCamera)
+        corners = [transformPoint(objectToCamera, corner) for corner in getBoundingBoxCorners(shape)]
+
+        # Distance from the camera to the box around the corners
+        if self.cullDistance > 0.0:
+            nearest = 0.0
+            for axis in range(3):
+                values = [corner[axis] for corner in corners]
+                offset = max(min(values), 0.0) + min(max(values), 0.0)
+                nearest += offset*offset
+            if math.sqrt(nearest) > self.cullDistance:
+                return True
+
+        for (nx, ny, nz, d) in self.planes:
+            outside = True
+            for (x, y, z) in corners:
+                if nx*x + ny*y + nz*z + d <= self.giDistance:
+                    outside = False
+                    break
+            if outside:
+                return True
+        return False
+
+# Drops the meshes outside of a camera's frustum and counts what was dropped.
+# Area lights are never dropped.
+class GeometryCulling(object):
+    def __init__(self, frustum):
+        self.frustum = frustum
+        self.meshes = 0
+        self.triangles = 0
+        self.culledMeshes = 0
+        self.culledTriangles = 0
+        self.areaLights = []
+
+    def cull(self, transforms):
+        kept = []
+        for transform in transforms:
+            shape = cmds.listRelatives(transform, children=True, shapes=True, fullPath=True)[0]
+            triangles = 0
+            if cmds.nodeType(shape) == "mesh":
+                triangles = cmds.polyEvaluate(shape, triangle=True)
+            self.meshes += 1
+            self.triangles += triangles
+
+            if hasAreaLight(shape):
+                if self.frustum.isCulled(transform, shape):
+                    self.areaLights.append(transform)
+                kept.append(transform)
+            elif self.frustum.isCulled(transform, shape):
+                self.culledMeshes += 1
+                self.culledTriangles += triangles
+            else:
+                kept.append(transform)
+        return kept
+
+    def formatReport(self):
+        report = "Geometry culling - meshes culled : %d of %d, triangles culled : %d of %d" % (
+            self.culledMeshes, self.meshes, self.culledTriangles, self.triangles)
+        if self.areaLights:
+            report += "\n\tkept as area lights : %s" % ", ".join(self.areaLights)
+        return report
@@ -0,0 +1,363 @@
+import json
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+
+import imagefile
+
+import MitsubaRendererMesh
+
+#
+# Render time and memory estimates, computed from an exported scene element
+# hierarchy and calibrated against the renders of previous frames
+#
+
+# Name of the calibration history kept in the renderData directory
+kCalibrationFileName = "mitsubaEstimateCalibration.json"
+
+# Number of past renders used to calibrate the estimates
+kCalibrationHistory = 50
+
+# Memory model, in bytes
+kBaseMemory = 96 * 1024 * 1024
+kBytesPerTriangle = 96
+kBytesPerTexel = 16
+kBytesPerPhoton = 48
+kBytesPerPixel = 32
+
+# Time model, in seconds per work unit, before calibration. A work unit is one
+# camera sample, or one traced photon.
+kSecondsPerSample = 2.0e-6
+kSecondsPerPhoton = 1.0e-6
+
+# Relative cost of a camera sample for each integrator
+integratorSampleCost = {
+    "ao" : 0.3,
+    "direct" : 0.5,
+    "path" : 1.0,
+    "volpath" : 1.5,
+    "volpath_simple" : 1.2,
+    "bdpt" : 3.0,
+    "photonmapper" : 1.0,
+    "ppm" : 1.0,
+    "sppm" : 1.0,
+    "pssmlt" : 4.0,
+    "mlt" : 6.0,
+    "erpt" : 6.0,
+    "ptracer" : 1.0,
+    "vpl" : 2.0,
+}
+
+# Integrators that wrap another integrator
+metaIntegrators = ["adaptive", "irrcache", "multichannel"]
+
+#
+# Scene element traversal
+#
+def iterElements(element):
+    yield element
+    for child in element['children']:
+        for descendant in iterElements(child):
+            yield descendant
+
+def getParameter(element, name, default=None):
+    for child in element['children']:
+        if child['attributes'].get('name') == name and 'value' in child['attributes']:
+            return child['attributes']['value']
+    return default
+
+def getIntegerParameter(element, name, default=0):
+    try:
+        return int(getParameter(element, name, default))
+    except (TypeError, ValueError):
+        return default
+
+def getIntegratorTypes(sceneElement):
+    integratorTypes = []
+    for child in sceneElement['children']:
+        if child['type'] == 'integrator':
+            integratorElement = child
+            while integratorElement:
+                integratorTypes.append(integratorElement['attributes'].get('type'))
+                subIntegrators = [x for x in integratorElement['children'] if x['type'] == 'integrator']
+                integratorElement = subIntegrators[0] if subIntegrators else None
+    return integratorTypes
+
+#
+# Scene data sizes, read from the headers of the exported files
+#
+def getTriangleCount(filename):
+    extension = os.path.splitext(filename)[-1].lower()
+    triangles = 0
+    try:
+        if extension == ".obj":
+            with open(filename, 'rb') as f:
+                for line in f:
+                    if line.startswith(b'f '):
+                        triangles += len(line.split()) - 3
+        elif extension == ".ply":
+            with open(filename, 'rb') as f:
+                for line in f:
+                    tokens = line.split()
+                    if tokens[:2] == [b'element', b'face']:
+                        triangles = int(tokens[2])
+                    elif tokens[:1] == [b'end_header']:
+                        break
+        elif extension == ".serialized":
+            triangles = MitsubaRendererMesh.readSerializedHeader(filename)[3]
+    except (IOError, OSError, ValueError, IndexError, struct.error, zlib.error):
+        return None
+    return triangles
+
+def getVolumeSize(filename):
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(24)
+        if len(header) < 24 or header[:3] != b'VOL':
+            return None
+        encoding, xres, yres, zres, channels = struct.unpack('<5i', header[4:24])
+    except (IOError, OSError, struct.error):
+        return None
+
+    # Float32, float16 and uint8 encodings
+    bytesPerValue = {1 : 4, 2 : 2, 3 : 1}.get(encoding, 4)
+    return (xres, yres, zres, channels, bytesPerValue)
+
+def getSceneStatistics(sceneElement):
+    statistics = {
+        'integrators' : getIntegratorTypes(sceneElement),
+        'triangles' : 0,
+        'meshes' : 0,
+        'unknownMeshes' : 0,
+        'texels' : 0,
+        'textures' : 0,
+        'unknownTextures' : 0,
+        'voxels' : 0,
+        'volumeBytes' : 0,
+        'volumes' : 0,
+        'photons' : 0,
+        'sampleCount' : 1,
+        'pixels' : 0,
+    }
+
+    seenFiles = set()
+    for element in iterElements(sceneElement):
+        elementType = element['type']
+        typeAttribute = element['attributes'].get('type')
+        filename = getParameter(element, 'filename')
+
+        if elementType == 'shape' and filename and filename not in seenFiles:
+            seenFiles.add(filename)
+            triangles = getTriangleCount(filename)
+            if triangles is None:
+                statistics['unknownMeshes'] += 1
+            else:
+                statistics['meshes'] += 1
+                statistics['triangles'] += triangles
+
+        elif elementType == 'texture' and typeAttribute == 'bitmap' and filename and filename not in seenFiles:
+            seenFiles.add(filename)
+            resolution = imagefile.getImageResolution(filename)
+            if resolution is None:
+                statistics['unknownTextures'] += 1
+            else:
+                statistics['textures'] += 1
+                statistics['texels'] += resolution[0]*resolution[1]
+
+        elif elementType == 'volume' and typeAttribute == 'gridvolume' and filename and filename not in seenFiles:
+            seenFiles.add(filename)
+            volumeSize = getVolumeSize(filename)
+            if volumeSize:
+                (xres, yres, zres, channels, bytesPerValue) = volumeSize
+                statistics['volumes'] += 1
+                statistics['voxels'] += xres*yres*zres
+                statistics['volumeBytes'] += xres*yres*zres*channels*bytesPerValue
+
+        elif elementType == 'integrator':
+            if typeAttribute == 'photonmapper':
+                for photonParameter in ['globalPhotons', 'causticPhotons', 'volumePhotons']:
+                    statistics['photons'] += getIntegerParameter(element, photonParameter)
+            elif typeAttribute in ['ppm', 'sppm']:
+                statistics['photons'] += getIntegerParameter(element, 'photonCount')
+
+        elif elementType == 'sampler':
+            statistics['sampleCount'] = max(1, getIntegerParameter(element, 'sampleCount', 1))
+
+        elif elementType == 'film':
+            width = getIntegerParameter(element, 'cropWidth', getIntegerParameter(element, 'width'))
+            height = getIntegerParameter(element, 'cropHeight', getIntegerParameter(element, 'height'))
+            statistics['pixels'] = width*height
+
+    return statistics
+
+#
+# Calibration
+#
+def getCalibrationKey(statistics):
+    return '/'.join([x for x in statistics['integrators'] if x])
+
+def readCalibration(renderDir):
+    calibrationFileName = os.path.join(renderDir, kCalibrationFileName)
+    try:
+        with open(calibrationFileName, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return []
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values)//2
+    if len(values) % 2:
+        return values[middle]
+    return 0.5*(values[middle-1] + values[middle])
+
+def getCalibrationScales(renderDir, calibrationKey):
+    records = [x for x in readCalibration(renderDir) if x.get('key') == calibrationKey]
+
+    timeScale = median([x['actualTime']/x['modelTime'] for x in records
+        if x.get('actualTime') and x.get('modelTime')])
+    memoryScale = median([x['actualMemory']/x['modelMemory'] for x in records
+        if x.get('actualMemory') and x.get('modelMemory')])
+
+    return (timeScale, memoryScale, len(records))
+
+def recordCalibration(renderDir, estimate, actualTime, actualMemory=None):
+    if not estimate or not actualTime:
+        return
+
+    records = readCalibration(renderDir)
+    records.append({
+        'key' : estimate['key'],
+        'time' : time.time(),
+        'modelTime' : estimate['modelTime'],
+        'modelMemory' : estimate['modelMemory'],
+        'actualTime' : actualTime,
+        'actualMemory' : actualMemory,
+    })
+    records = records[-kCalibrationHistory:]
+
+    calibrationFileName = os.path.join(renderDir, kCalibrationFileName)
+    try:
+        with open(calibrationFileName, 'w') as f:
+            json.dump(records, f, indent=1)
+    except (IOError, OSError):
+        print( "Unable to write render estimate calibration : %s" % calibrationFileName )
+
+#
+# Mitsuba log parsing
+#
+timeUnitSeconds = {
+    'ms' : 0.001,
+    's' : 1.0,
+    'm' : 60.0,
+    'min' : 60.0,
+    'h' : 3600.0,
+    'd' : 86400.0,
+}
+
+def parseRenderTime(logLines):
+    renderTime = None
+    for line in logLines:
+        match = re.search(r'Render time: ([0-9.]+)\s*(ms|min|s|m|h|d)\b', line)
+        if match:
+            renderTime = float(match.group(1))*timeUnitSeconds[match.group(2)]
+    return renderTime
+
+def getChildPeakMemory():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Peak resident size of the largest child process waited on so far
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+#
+# Estimates
+#
+def estimateRender(sceneElement, renderDir=None):
+    statistics = getSceneStatistics(sceneElement)
+
+    # Memory
+    modelMemory = (kBaseMemory +
+        statistics['triangles']*kBytesPerTriangle +
+        statistics['texels']*kBytesPerTexel +
+        statistics['volumeBytes'] +
+        statistics['photons']*kBytesPerPhoton +
+        statistics['pixels']*kBytesPerPixel)
+
+    # Time
+    sampleCost = 1.0
+    for integratorType in statistics['integrators']:
+        if integratorType not in metaIntegrators:
+            sampleCost = integratorSampleCost.get(integratorType, 1.0)
+
+    modelTime = (statistics['pixels']*statistics['sampleCount']*sampleCost*kSecondsPerSample +
+        statistics['photons']*kSecondsPerPhoton)
+
+    key = getCalibrationKey(statistics)
+    (timeScale, memoryScale, calibrationRenders) = (None, None, 0)
+    if renderDir:
+        (timeScale, memoryScale, calibrationRenders) = getCalibrationScales(renderDir, key)
+
+    estimate = {
+        'key' : key,
+        'statistics' : statistics,
+        'modelTime' : modelTime,
+        'modelMemory' : modelMemory,
+        'time' : modelTime*(timeScale or 1.0),
+        'memory' : modelMemory*(memoryScale or 1.0),
+        'calibrationRenders' : calibrationRenders,
+    }
+
+    return estimate
+
+def formatBytes(value):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(value) < 1024.0:
+            return "%.1f %s" % (value, unit)
+        value /= 1024.0
+    return "%.1f TB" % value
+
+def formatSeconds(value):
+    if value < 60.0:
+        return "%.1f seconds" % value
+    elif value < 3600.0:
+        return "%.1f minutes" % (value/60.0)
+    return "%.1f hours" % (value/3600.0)
+
+def formatEstimate(estimate):
+    statistics = estimate['statistics']
+
+    lines = []
+    lines.append( "Render Estimate - Integrator       : %s" % estimate['key'] )
+    lines.append( "Render Estimate - Triangles        : %d in %d meshes" % (
+        statistics['triangles'], statistics['meshes']) )
+    lines.append( "Render Estimate - Texels           : %d in %d textures" % (
+        statistics['texels'], statistics['textures']) )
+    if statistics['unknownMeshes'] or statistics['unknownTextures']:
+        lines.append( "Render Estimate - Not Measured     : %d meshes, %d textures" % (
+            statistics['unknownMeshes'], statistics['unknownTextures']) )
+    if statistics['volumes']:
+        lines.append( "Render Estimate - Voxels           : %d in %d volumes" % (
+            statistics['voxels'], statistics['volumes']) )
+    if statistics['photons']:
+        lines.append( "Render Estimate - Photons          : %d" % statistics['photons'] )
+    lines.append( "Render Estimate - Samples          : %d pixels, %d per pixel" % (
+        statistics['pixels'], statistics['sampleCount']) )
+    lines.append( "Render Estimate - Memory           : %s" % formatBytes(estimate['memory']) )
+    lines.append( "Render Estimate - Time             : %s" % formatSeconds(estimate['time']) )
+    if estimate['calibrationRenders']:
+        lines.append( "Render Estimate - Calibration      : %d previous renders" % estimate['calibrationRenders'] )
+    else:
+        lines.append( "Render Estimate - Calibration      : none, using default costs" )
+
+    return '\n'.join(lines)
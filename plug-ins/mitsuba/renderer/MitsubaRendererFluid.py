@@ -0,0 +1,99 @@
+import hashlib
+import os
+
+import maya.cmds as cmds
+
+import MitsubaRendererVolume
+
+#
+# Fluid containers, written as Mitsuba grid volumes. Maya's fluid grids, like
+# Mitsuba's, have x varying fastest, then y, then z, so the values read from
+# Maya are written as they are.
+#
+
+# densityMethod and colorMethod values of the grids that hold voxels
+kStaticGrid = 1
+kDynamicGrid = 2
+
+def getFluidShape(transform):
+    return cmds.listRelatives(transform, children=True, shapes=True, type="fluidShape",
+        noIntermediate=True, fullPath=True)[0]
+
+def getFluidResolution(fluid):
+    return tuple([int(x) for x in cmds.getAttr(fluid + ".resolution")[0]])
+
+# The container spans its dimensions, centered on its origin
+def getFluidBoundingBox(fluid):
+    (width, height, depth) = cmds.getAttr(fluid + ".dimensions")[0]
+    return (-width/2.0, -height/2.0, -depth/2.0, width/2.0, height/2.0, depth/2.0)
+
+# Maya's voxels are at the centers of the container's cells, and Mitsuba's
+# first and last voxels on each axis are on the faces of the grid's bounding
+# box, so the grid is inset from the container by half a cell. Axes with a
+# single cell, like the depth of 2D fluids, keep the container's extent.
+def getFluidGridBoundingBox(fluid, resolution):
+    bbox = list(getFluidBoundingBox(fluid))
+    for axis in range(3):
+        if resolution[axis] > 1:
+            inset = (bbox[axis + 3] - bbox[axis])/(2.0*resolution[axis])
+            bbox[axis] += inset
+            bbox[axis + 3] -= inset
+    return tuple(bbox)
+
+def hasGrid(fluid, methodAttribute):
+    return cmds.getAttr(fluid + "." + methodAttribute) in [kStaticGrid, kDynamicGrid]
+
+# Every voxel of one of the fluid's grids, read in a single call
+def getFluidGrid(fluid, attribute):
+    return cmds.getFluidAttr(fluid, attribute=attribute)
+
+# Writes the grids of fluids to a directory, as files named after their
+# content, so frames where a fluid hasn't changed reuse the file written for
+# an earlier frame or render
+class FluidCache(object):
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.written = 0
+        self.cacheHits = 0
+
+    def writeGrid(self, resolution, channels, bbox, values):
+        header = MitsubaRendererVolume.packVolumeHeader(resolution, channels, bbox)
+        voxels = MitsubaRendererVolume.packVoxels(values)
+
+        gridHash = hashlib.sha1()
+        gridHash.update(header)
+        gridHash.update(voxels)
+        filename = os.path.join(self.cacheDir, gridHash.hexdigest() + ".vol")
+        if os.path.exists(filename):
+            self.cacheHits += 1
+            return filename
+
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        # Written under a temporary name so an interrupted write isn't reused
+        partialFilename = filename + ".partial"
+        MitsubaRendererVolume.writeVolume(partialFilename, resolution, channels, bbox, voxels)
+        os.rename(partialFilename, filename)
+        self.written += 1
+        return filename
+
+    # Returns the density grid file, and the color grid file, or None for
+    # fluids without a density grid or a color grid
+    def export(self, transform):
+        fluid = getFluidShape(transform)
+        resolution = getFluidResolution(fluid)
+        bbox = getFluidGridBoundingBox(fluid, resolution)
+
+        densityFilename = None
+        if hasGrid(fluid, "densityMethod"):
+            densityFilename = self.writeGrid(resolution, 1, bbox, getFluidGrid(fluid, "density"))
+
+        colorFilename = None
+        if densityFilename and hasGrid(fluid, "colorMethod"):
+            colorFilename = self.writeGrid(resolution, 3, bbox, getFluidGrid(fluid, "color"))
+
+        return (densityFilename, colorFilename)
+
+    def formatReport(self):
+        return "Fluids - grids written : %d, cache hits : %d" % (self.written, self.cacheHits)
@@ -0,0 +1,72 @@
+import struct
+
+#
+# Mitsuba's binary hair format : a header, the number of vertices, then the
+# vertices of each fiber as little endian x, y, z floats. The first vertex of
+# every fiber after the first is preceded by a single infinite value.
+#
+kHairHeader = b"BINARY_HAIR"
+kHairFiberSeparator = struct.pack('<f', float('inf'))
+
+# Streams fibers to a hair file. Only the current fiber is held in memory, the
+# vertex count is filled in when the file is closed.
+class HairWriter(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(kHairHeader)
+        self.file.write(struct.pack('<I', 0))
+        self.vertices = 0
+        self.fibers = 0
+        self.segments = 0
+
+    # points is a sequence of x, y, z tuples
+    def addFiber(self, points):
+        if len(points) < 2:
+            return
+        if self.fibers:
+            self.file.write(kHairFiberSeparator)
+
+        values = []
+        for point in points:
+            values.extend(point)
+        self.file.write(struct.pack('<%df' % len(values), *values))
+
+        self.vertices += len(points)
+        self.fibers += 1
+        self.segments += len(points) - 1
+
+    def close(self):
+        try:
+            self.file.seek(len(kHairHeader))
+            self.file.write(struct.pack('<I', self.vertices))
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+# The fibers of a hair file, for checking what was written
+def readHair(filename):
+    with open(filename, 'rb') as f:
+        if f.read(len(kHairHeader)) != kHairHeader:
+            raise ValueError("Not a binary hair file : %s" % filename)
+        (vertices,) = struct.unpack('<I', f.read(4))
+
+        fibers = []
+        fiber = []
+        for i in range(vertices):
+            (x,) = struct.unpack('<f', f.read(4))
+            if x == float('inf'):
+                fibers.append(fiber)
+                fiber = []
+                (x,) = struct.unpack('<f', f.read(4))
+            (y, z) = struct.unpack('<ff', f.read(8))
+            fiber.append( (x, y, z) )
+        if fiber:
+            fibers.append(fiber)
+    return fibers
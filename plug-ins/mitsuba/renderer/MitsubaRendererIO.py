@@ -1,3 +1,5 @@
+import array
+import hashlib
 import os
 import struct
 
@@ -10,9 +12,25 @@ import pymel.core
 
 from process import Process
 
+from MitsubaRendererStatistics import exportStage
+from MitsubaRendererCache import hashFile
+import MitsubaRendererCulling
+import MitsubaRendererFluid
+import MitsubaRendererHair
+import MitsubaRendererInstancer
+import MitsubaRendererLOD
+import MitsubaRendererMesh
+import MitsubaRendererSequence
+import MitsubaRendererTessellation
+import MitsubaRendererVDB
+import MitsubaRendererVolume
+
 # Will be populated as materials are registered with Maya
 materialNodeTypes = []
 
+# Faces read from Maya before each write to a binary mesh
+kSerializedBatchFaces = 10000
+
 #
 # XML formatted printing
 #
@@ -67,10 +85,19 @@ def writeElement(outFile, element, depth=0):
 # General functionality
 #
 
-# Returns the surfaceShader node for a piece of geometry (geom)
-def getSurfaceShader(geom):
+# Returns the shading groups assigned to a piece of geometry (geom), in the
+# order they were connected
+def getShadingGroups(geom):
     shapeNode = cmds.listRelatives(geom, children=True, shapes=True, fullPath=True)[0]
-    sg = cmds.listConnections(shapeNode, type="shadingEngine")[0]
+    shadingGroups = []
+    for sg in cmds.listConnections(shapeNode, type="shadingEngine") or []:
+        if sg not in shadingGroups:
+            shadingGroups.append(sg)
+    return shadingGroups
+
+def getShadingGroupSurfaceShader(sg):
+    if not sg:
+        return None
     shader = cmds.listConnections(sg+".surfaceShader")
     #if shader is None:
     #    shader = cmds.listConnections(sg+".volumeShader")
@@ -78,14 +105,23 @@ def getSurfaceShader(geom):
         shader = shader[0]
     return shader
 
-def getVolumeShader(geom):
-    shapeNode = cmds.listRelatives(geom, children=True, shapes=True, fullPath=True)[0]
-    sg = cmds.listConnections(shapeNode, type="shadingEngine")[0]
+def getShadingGroupVolumeShader(sg):
+    if not sg:
+        return None
     shader = cmds.listConnections(sg+".volumeShader")
     if shader:
         shader = shader[0]
     return shader
 
+# Returns the surfaceShader node for a piece of geometry (geom)
+def getSurfaceShader(geom):
+    shadingGroups = getShadingGroups(geom)
+    return getShadingGroupSurfaceShader(shadingGroups[0] if shadingGroups else None)
+
+def getVolumeShader(geom):
+    shadingGroups = getShadingGroups(geom)
+    return getShadingGroupVolumeShader(shadingGroups[0] if shadingGroups else None)
+
 def listToMitsubaText(list):
     return " ".join( map(str, list) )
 
@@ -109,22 +145,45 @@ class SceneElement(dict):
         if attributes:
             for key, value in attributes.iteritems():
                 self.attributes[key] = value
+
+        # Merkle hash of the subtree, computed on demand
+        self.parents = []
+        self.elementHash = None
       
     def addChild(self, child):
         self.children.append( child )
+        self.adoptChild( child )
+        self.invalidateHash()
          
     def addChildren(self, children):
         self.children.extend( children )
+        for child in children:
+            self.adoptChild( child )
+        self.invalidateHash()
+
+    def replaceChild(self, index, child):
+        replaced = self.children[index]
+        self.children[index] = child
+        self.releaseChild( replaced )
+        self.adoptChild( child )
+        self.invalidateHash()
+
+    def removeChild(self, child):
+        self.children.remove( child )
+        self.releaseChild( child )
+        self.invalidateHash()
 
     def getChild(self, index):
         return self.children[index]
         
     def addAttribute(self, key, value):
         self.attributes[key] = value
+        self.invalidateHash()
 
     def removeAttribute(self, key):
         if key in self.attributes:
             del( self.attributes[key] )         
+            self.invalidateHash()
 
     def getAttribute(self, key):
         if key in self.attributes:
@@ -132,6 +191,130 @@ class SceneElement(dict):
         else:
             return None
 
+    # Parents are compared by identity, as separate elements with the same
+    # content are equal dicts
+    def adoptChild(self, child):
+        if isinstance(child, SceneElement) and not any([parent is self for parent in child.parents]):
+            child.parents.append( self )
+
+    # Drops the link to a child that's no longer among the children, so it
+    # stops invalidating this element
+    def releaseChild(self, child):
+        if not isinstance(child, SceneElement) or any([c is child for c in self.children]):
+            return
+        child.parents = [parent for parent in child.parents if parent is not self]
+
+    # getHash hashes the children before their parent, so an element with a
+    # cached hash has descendants with cached hashes too. An element without a
+    # cached hash has no ancestors with cached hashes, so invalidation can stop
+    # there.
+    def invalidateHash(self):
+        if self.elementHash is None:
+            return
+        self.elementHash = None
+        for parent in self.parents:
+            parent.invalidateHash()
+
+    def getHash(self):
+        if self.elementHash is None:
+            self.elementHash = computeElementHash(self)
+        return self.elementHash
+
+#
+# Merkle hashes of scene element trees. Files referenced by filename
+# parameters contribute their content, not their path.
+#
+def isFileReference(attributes, key):
+    return key == 'filename' or (key == 'value' and attributes.get('name') == 'filename')
+
+def hashText(value):
+    if not isinstance(value, basestring):
+        value = str(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+def computeElementHash(element):
+    elementHash = hashlib.sha1()
+    if element in [{}, None]:
+        return elementHash.hexdigest()
+
+    elementHash.update( hashText(element['type']) )
+    attributes = element['attributes']
+    for key in sorted(attributes):
+        value = attributes[key]
+        if isFileReference(attributes, key):
+            contentHash = hashFile(str(value))
+            if contentHash:
+                value = "sha1:%s" % contentHash
+        elementHash.update( "\0%s=%s" % (hashText(key), hashText(value)) )
+
+    for child in element['children']:
+        elementHash.update( "\0" + getElementHash(child) )
+
+    return elementHash.hexdigest()
+
+def getElementHash(element):
+    if isinstance(element, SceneElement):
+        return element.getHash()
+    return computeElementHash(element)
+
+def getElementLabel(element):
+    if element in [{}, None]:
+        return "empty"
+    attributes = element['attributes']
+    for key in ['id', 'name']:
+        if key in attributes:
+            return "%s[%s=%s]" % (element['type'], key, attributes[key])
+    return element['type']
+
+# The subtrees that differ between two scene element trees, as a list of
+# ('added' | 'removed' | 'changed', path, elementA, elementB). Subtrees with
+# matching hashes are skipped without being visited.
+def diffElements(elementA, elementB, path=""):
+    if getElementHash(elementA) == getElementHash(elementB):
+        return []
+
+    elementPath = path + "/" + getElementLabel(elementB)
+    if (elementA in [{}, None] or elementB in [{}, None] or
+        elementA['type'] != elementB['type'] or 
+        elementA['attributes'] != elementB['attributes']):
+        return [('changed', elementPath, elementA, elementB)]
+
+    # Pair up children with identical hashes, wherever they moved to
+    unmatchedByHash = {}
+    for child in elementA['children']:
+        unmatchedByHash.setdefault(getElementHash(child), []).append(child)
+
+    addedOrChanged = []
+    for child in elementB['children']:
+        matches = unmatchedByHash.get(getElementHash(child))
+        if matches:
+            matches.pop()
+        else:
+            addedOrChanged.append(child)
+
+    # Then children with the same type and id or name
+    unmatched = set([id(child) for matches in unmatchedByHash.values() for child in matches])
+    unmatchedByLabel = {}
+    for child in elementA['children']:
+        if id(child) in unmatched:
+            unmatchedByLabel.setdefault(getElementLabel(child), []).append(child)
+
+    differences = []
+    for child in addedOrChanged:
+        matches = unmatchedByLabel.get(getElementLabel(child))
+        if matches:
+            differences.extend( diffElements(matches.pop(0), child, elementPath) )
+        else:
+            differences.append( ('added', elementPath + "/" + getElementLabel(child), None, child) )
+
+    for matches in unmatchedByLabel.values():
+        for child in matches:
+            differences.append( ('removed', elementPath + "/" + getElementLabel(child), child, None) )
+
+    return differences
+
 def BooleanParameter(name, value):
     return SceneElement('boolean', {'name':name, 'value':booleanToMisubaText(value)} )
 
@@ -173,6 +356,11 @@ def LookAtElement(aim, origin, up):
     return SceneElement('lookat', { 'target':listToMitsubaText(aim), 
         'origin':listToMitsubaText(origin), 'up':listToMitsubaText(up) } )
 
+# Maya matrices transform row vectors, Mitsuba's transform column vectors
+def MatrixElement(matrix):
+    transposed = [matrix[column*4 + row] for row in range(4) for column in range(4)]
+    return SceneElement('matrix', {'value':listToMitsubaText(transposed)} )
+
 def createSceneElement(typeAttribute=None, id=None, elementType='scene'):
     element = SceneElement(elementType)
     if typeAttribute:
@@ -521,8 +709,12 @@ def writeMediumHomogeneous(medium, mediumName):
 
     return mediumElement
 
-# A heterogeneous medium
-def writeMediumHeterogeneous(medium, mediumName):
+# A heterogeneous medium. volumes holds volume elements to use in place of the
+# medium's own, keyed by parameter name.
+def writeMediumHeterogeneous(medium, mediumName, volumes=None):
+    if volumes is None:
+        volumes = {}
+
     # Create a structure to be written
     mediumElement = MediumElement('heterogeneous', mediumName)
 
@@ -531,8 +723,11 @@ def writeMediumHeterogeneous(medium, mediumName):
         samplingMethodName = samplingMethodUIToPreset[samplingMethodUIName]
     mediumElement.addChild( StringParameter('method', samplingMethodName) )
 
-    mediumElement.addChild( TexturedVolumeAttributeElement(medium, 'density') )
-    mediumElement.addChild( TexturedVolumeAttributeElement(medium, 'albedo') )
+    for attribute in ['density', 'albedo']:
+        if attribute in volumes:
+            mediumElement.addChild( volumes[attribute] )
+        else:
+            mediumElement.addChild( TexturedVolumeAttributeElement(medium, attribute) )
 
     fileTexture = getTextureFile(medium, 'orientation')
     if fileTexture:
@@ -1666,7 +1861,13 @@ def writeIntegrator(renderSettings):
 #
 #Write image sample generator
 #
-def writeSampler(frameNumber, renderSettings):
+scrambledSamplers = [
+    "Halton QMC Sampler",
+    "Hammersley QMC Sampler",
+    "Sobol QMC Sampler"
+]
+
+def writeSampler(frameNumber, renderSettings, sampleCountOverride=None, scrambleOverride=None):
     samplerMaya = cmds.getAttr("%s.%s" % (renderSettings, "sampler")).replace('_', ' ')
     sampleCount = cmds.getAttr("%s.%s" % (renderSettings, "sampleCount"))
     samplerDimension = cmds.getAttr("%s.%s" % (renderSettings, "samplerDimension"))
@@ -1674,6 +1875,16 @@ def writeSampler(frameNumber, renderSettings):
     if samplerScramble == -1:
         samplerScramble = frameNumber
 
+    if sampleCountOverride is not None:
+        sampleCount = sampleCountOverride
+
+    # Independent renders of the same frame need a sampler that can be scrambled
+    if scrambleOverride is not None:
+        samplerScramble = scrambleOverride
+        if samplerMaya not in scrambledSamplers:
+            print( "Unsupported Sampler for independent passes : %s. Using Sobol QMC Sampler" % samplerMaya)
+            samplerMaya = "Sobol QMC Sampler"
+
     mayaUINameToMitsubaName = {
         "Independent Sampler"  : "independent",
         "Stratified Sampler" : "stratified",
@@ -1696,13 +1907,18 @@ def writeSampler(frameNumber, renderSettings):
         samplerMaya == "Low Discrepancy Sampler" ):
         elementDict.addChild( IntegerParameter('dimension', samplerDimension) )
 
-    elif( samplerMaya == "Halton QMC Sampler" or
-        samplerMaya == "Hammersley QMC Sampler" or
-        samplerMaya == "Sobol QMC Sampler" ):
+    elif samplerMaya in scrambledSamplers:
         elementDict.addChild( IntegerParameter('scramble', samplerScramble) )
 
     return elementDict
 
+def replaceSampler(sceneElement, samplerElement):
+    for sensorElement in sceneElement.children:
+        if sensorElement['type'] == 'sensor':
+            for i in range(len(sensorElement.children)):
+                if sensorElement.children[i]['type'] == 'sampler':
+                    sensorElement.replaceChild(i, samplerElement)
+
 def filmAddMultichannelAttributes(renderSettings, elementDict):
     multichannelPosition = cmds.getAttr("%s.%s" % (renderSettings, "multichannelPosition"))
     multichannelRelPosition = cmds.getAttr("%s.%s" % (renderSettings, "multichannelRelPosition"))
@@ -1753,7 +1969,7 @@ def filmAddMultichannelAttributes(renderSettings, elementDict):
             break
 
     if pixelFormatChild:
-        elementDict['children'].remove( pixelFormatChild )
+        elementDict.removeChild( pixelFormatChild )
 
     elementDict.addChild( StringParameter('pixelFormat', pixelFormat) )
     elementDict.addChild( StringParameter('channelNames', channelNames) )
@@ -1986,25 +2202,34 @@ def writeFilmMath(renderSettings, filmMitsuba):
 
     return elementDict
 
-def addRenderRegionCropCoordinates(filmElement):
+def getRenderRegion():
     editor = cmds.renderWindowEditor(q=True, editorName=True )
-    #print( "addRenderRegionCropCoordinates - editor : %s" % editor )
+    #print( "getRenderRegion - editor : %s" % editor )
     if editor:
         renderRegion = cmds.renderWindowEditor(editor, q=True, mq=True)
-        #print( "addRenderRegionCropCoordinates - render region : %s" % renderRegion )
+        #print( "getRenderRegion - render region : %s" % renderRegion )
         if renderRegion:
             left = cmds.getAttr( "defaultRenderGlobals.left" )
             right = cmds.getAttr( "defaultRenderGlobals.rght" )
             top = cmds.getAttr( "defaultRenderGlobals.top" )
             bottom = cmds.getAttr( "defaultRenderGlobals.bot" )
 
-            imageWidth = cmds.getAttr("defaultResolution.width")
-            imageHeight = cmds.getAttr("defaultResolution.height")
+            return (left, right, top, bottom)
+
+    return None
+
+def addRenderRegionCropCoordinates(filmElement):
+    renderRegion = getRenderRegion()
+    if renderRegion:
+        (left, right, top, bottom) = renderRegion
+
+        imageWidth = cmds.getAttr("defaultResolution.width")
+        imageHeight = cmds.getAttr("defaultResolution.height")
 
-            filmElement.addChild( IntegerParameter('cropOffsetX', left) )
-            filmElement.addChild( IntegerParameter('cropOffsetY', imageHeight-top-1 ) )
-            filmElement.addChild( IntegerParameter('cropWidth',   right-left+1 ) )
-            filmElement.addChild( IntegerParameter('cropHeight',  top-bottom+1 ) )
+        filmElement.addChild( IntegerParameter('cropOffsetX', left) )
+        filmElement.addChild( IntegerParameter('cropOffsetY', imageHeight-top-1 ) )
+        filmElement.addChild( IntegerParameter('cropWidth',   right-left+1 ) )
+        filmElement.addChild( IntegerParameter('cropHeight',  top-bottom+1 ) )
 
     return filmElement
 
@@ -2449,7 +2674,28 @@ def writeLights():
 
     return lightElements
 
-def getRenderableGeometry():
+# Culls the geometry that can't contribute to the image, when enabled
+def getGeometryCulling(renderSettings):
+    if not renderSettings or not cmds.getAttr("%s.%s" % (renderSettings, "cullGeometry")):
+        return None
+
+    margin = cmds.getAttr("%s.%s" % (renderSettings, "cullMargin"))
+    giDistance = cmds.getAttr("%s.%s" % (renderSettings, "cullGIDistance"))
+    cullDistance = cmds.getAttr("%s.%s" % (renderSettings, "cullDistance"))
+
+    # Sensor overrides don't share the camera's field of view
+    viewPlanes = cmds.getAttr("%s.sensorOverride" % renderSettings) == "None"
+
+    frustum = MitsubaRendererCulling.CameraFrustum(getRenderableCamera(), 
+        margin, giDistance, cullDistance, viewPlanes)
+    return MitsubaRendererCulling.GeometryCulling(frustum)
+
+def getRenderableGeometry(renderSettings=None):
+    # NURBS surfaces are included when they're tessellated
+    geometryTypes = ["mesh"]
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "tessellateSurfaces")):
+        geometryTypes.append("nurbsSurface")
+
     # Build list of visible geometry
     transforms = cmds.ls(type="transform", long=True)
     geoms = []
@@ -2458,44 +2704,118 @@ def getRenderableGeometry():
         rels = cmds.listRelatives(transform, fullPath=True)
         if rels:
             for rel in rels:
-                if cmds.nodeType(rel)=="mesh":
+                if cmds.nodeType(rel) in geometryTypes:
                     visible = isVisible(transform)
                     if visible:
                         if transform not in geoms:
                             geoms.append(transform)
                             #print( "getRenderableGeometry - transform : %s" % transform )
 
+    culling = getGeometryCulling(renderSettings)
+    if culling:
+        geoms = culling.cull(geoms)
+        print( culling.formatReport() )
+
+    # Only the level of each lodGroup the camera would see
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "levelOfDetail")):
+        geoms = MitsubaRendererLOD.selectVariants(geoms, getRenderableCamera())
+
     return geoms
 
+def getRenderableInstancers():
+    return [x for x in cmds.ls(type="instancer", long=True) if isVisible(x)]
+
+def isInstancedMesh(path):
+    return (cmds.nodeType(path) == "transform" and 
+        bool(cmds.listRelatives(path, shapes=True, type="mesh", noIntermediate=True)))
+
+# The meshes an instancer places at its particles
+def getInstancerSources(instancer):
+    sources = cmds.listConnections(instancer + ".inputHierarchy", source=True, destination=False) or []
+    meshes = []
+    for source in cmds.ls(sources, long=True):
+        for transform in [source] + (cmds.listRelatives(source, allDescendents=True, type="transform", 
+            fullPath=True) or []):
+            if isInstancedMesh(transform) and transform not in meshes:
+                meshes.append(transform)
+    return meshes
+
+# Curves are rendered as hair when a hair system drives them, as the output
+# curves of follicles, or when they're under a transform with a mitsubaHair
+# attribute that's on, like a group of curves generated from XGen. Follicles'
+# start and rest curves are never rendered.
+kHairAttribute = "mitsubaHair"
+
+def isFollicleInputCurve(shape):
+    plugs = cmds.listConnections(shape + ".worldSpace", source=False, destination=True, 
+        type="follicle", plugs=True) or []
+    return any([plug.split('.')[-1] in ["startPosition", "restPosition"] for plug in plugs])
+
+def isHairCurve(shape):
+    if isFollicleInputCurve(shape):
+        return False
+    if cmds.listConnections(shape + ".create", source=True, destination=False, type="follicle"):
+        return True
+
+    node = shape
+    while node:
+        if cmds.attributeQuery(kHairAttribute, node=node, exists=True):
+            return bool(cmds.getAttr(node + "." + kHairAttribute))
+        parents = cmds.listRelatives(node, parent=True, fullPath=True)
+        node = parents[0] if parents else None
+    return False
+
+# Visible hair curves, grouped by the transform above their own
+def getRenderableCurveGroups():
+    groups = {}
+    order = []
+    for shape in cmds.ls(type="nurbsCurve", long=True, noIntermediate=True):
+        if not isVisible(shape) or not isHairCurve(shape):
+            continue
+        transform = cmds.listRelatives(shape, parent=True, fullPath=True)[0]
+        parents = cmds.listRelatives(transform, parent=True, fullPath=True)
+        group = parents[0] if parents else transform
+        if group not in groups:
+            groups[group] = []
+            order.append(group)
+        if transform not in groups[group]:
+            groups[group].append(transform)
+    return [(group, groups[group]) for group in order]
+
+def getRenderableFluids():
+    return [cmds.listRelatives(x, parent=True, fullPath=True)[0] 
+        for x in cmds.ls(type="fluidShape", long=True, noIntermediate=True) if isVisible(x)]
+
 def writeMaterials(geoms):
     writtenMaterials = []
     materialElements = []
 
-    #Write the material for each piece of geometry in the scene
+    #Write the materials of each shading group of each piece of geometry in the scene
     for geom in geoms:
         #print( "writeMaterials - geom : %s" % geom )
-        # Surface shader
-        material = getSurfaceShader(geom)
-        if material and material not in writtenMaterials:
+        for sg in getShadingGroups(geom):
+            # Surface shader
+            material = getShadingGroupSurfaceShader(sg)
+            if material and material not in writtenMaterials:
 
-            materialType = cmds.nodeType(material)
-            if materialType in materialNodeTypes:
-                if materialType not in ["MitsubaObjectAreaLightShader"]:
-                    materialElement = writeShader(material, material)
+                materialType = cmds.nodeType(material)
+                if materialType in materialNodeTypes:
+                    if materialType not in ["MitsubaObjectAreaLightShader"]:
+                        materialElement = writeShader(material, material)
 
-                    materialElements.append(materialElement)
-                    writtenMaterials.append(material)
+                        materialElements.append(materialElement)
+                        writtenMaterials.append(material)
 
-        # Medium / Volume shaders
-        mediumMaterial = getVolumeShader(geom)
-        if mediumMaterial and mediumMaterial not in writtenMaterials:
+            # Medium / Volume shaders
+            mediumMaterial = getShadingGroupVolumeShader(sg)
+            if mediumMaterial and mediumMaterial not in writtenMaterials:
 
-            materialType = cmds.nodeType(mediumMaterial)
-            if materialType in materialNodeTypes:
-                mediumMaterialElement = writeShader(mediumMaterial, mediumMaterial)
+                materialType = cmds.nodeType(mediumMaterial)
+                if materialType in materialNodeTypes:
+                    mediumMaterialElement = writeShader(mediumMaterial, mediumMaterial)
 
-                materialElements.append(mediumMaterialElement)
-                writtenMaterials.append(mediumMaterial)
+                    materialElements.append(mediumMaterialElement)
+                    writtenMaterials.append(mediumMaterial)
         
     return writtenMaterials, materialElements
 
@@ -2509,12 +2829,552 @@ def exportGeometry(geom, renderDir):
 
     return objFilenameFullPath
 
-def writeShape(geomFilename, surfaceShader, mediumShader, renderDir):
-    shapeDict = ShapeElement('obj')
+#
+# Streaming export to Mitsuba's binary mesh format. Each face vertex becomes a
+# vertex of the binary mesh, so uvs and normals never have to be matched up
+# across faces and memory use is bounded by the batch size.
+#
+def getMeshDagPath(geom):
+    shape = cmds.listRelatives(geom, children=True, shapes=True, fullPath=True)[0]
+    selection = OpenMaya.MSelectionList()
+    selection.add(shape)
+    dagPath = OpenMaya.MDagPath()
+    selection.getDagPath(0, dagPath)
+    return dagPath
+
+# Calls addFace for each polygon, handing the values it gathers to write in batches
+def streamPolygons(dagPath, addFace, write, batchFaces=kSerializedBatchFaces):
+    polygons = OpenMaya.MItMeshPolygon(dagPath)
+    values = []
+    faces = 0
+    while not polygons.isDone():
+        addFace(polygons, values)
+        faces += 1
+        if faces % batchFaces == 0:
+            write(values)
+            del values[:]
+        polygons.next()
+    if values:
+        write(values)
+
+def getPolygonCounts(dagPath):
+    vertexCount = 0
+    triangleCount = 0
+    hasUVs = False
+
+    util = OpenMaya.MScriptUtil()
+    trianglesPtr = util.asIntPtr()
+
+    polygons = OpenMaya.MItMeshPolygon(dagPath)
+    while not polygons.isDone():
+        vertexCount += polygons.polygonVertexCount()
+        polygons.numTriangles(trianglesPtr)
+        triangleCount += OpenMaya.MScriptUtil.getInt(trianglesPtr)
+        hasUVs = hasUVs or polygons.hasUVs()
+        polygons.next()
+
+    return (vertexCount, triangleCount, hasUVs)
+
+# A hash of the face vertices, triangles and uvs a mesh's serialized uvs and
+# triangles are made from, read with whole mesh calls. Frames of a mesh only
+# share their uvs and triangles when their hashes match.
+def getTopologyHash(dagPath, uvs):
+    mesh = OpenMaya.MFnMesh(dagPath)
+    counts = OpenMaya.MIntArray()
+    indices = OpenMaya.MIntArray()
+    topologyHash = hashlib.sha1()
+
+    def addValues(typecode, values):
+        topologyHash.update( MitsubaRendererMesh.littleEndianBytes(
+            array.array(typecode, [values[i] for i in range(values.length())])) )
+
+    mesh.getVertices(counts, indices)
+    addValues('i', counts)
+    addValues('i', indices)
+    mesh.getTriangles(counts, indices)
+    addValues('i', counts)
+    addValues('i', indices)
+
+    if uvs:
+        us = OpenMaya.MFloatArray()
+        vs = OpenMaya.MFloatArray()
+        mesh.getAssignedUVs(counts, indices)
+        mesh.getUVs(us, vs)
+        addValues('i', counts)
+        addValues('i', indices)
+        addValues('f', us)
+        addValues('f', vs)
+
+    return topologyHash.hexdigest()
+
+# Functions that add the positions, normals, uvs and triangles of a polygon to
+# a list of values, and one that creates triangle functions. Triangles index
+# the face vertices of the mesh they're written to, so each mesh needs its own.
+def getPolygonAdders(space):
+    points = OpenMaya.MPointArray()
+    vectors = OpenMaya.MVectorArray()
+    us = OpenMaya.MFloatArray()
+    vs = OpenMaya.MFloatArray()
+    faceVertices = OpenMaya.MIntArray()
+    triangleVertices = OpenMaya.MIntArray()
+
+    def addPositions(polygons, values):
+        polygons.getPoints(points, space)
+        for i in range(points.length()):
+            point = points[i]
+            values.extend( (point.x, point.y, point.z) )
+
+    def addNormals(polygons, values):
+        polygons.getNormals(vectors, space)
+        for i in range(vectors.length()):
+            vector = vectors[i]
+            values.extend( (vector.x, vector.y, vector.z) )
+
+    # Mitsuba's OBJ loader flips v by default, the binary format doesn't
+    def addUVs(polygons, values):
+        if polygons.hasUVs():
+            polygons.getUVs(us, vs)
+            for i in range(us.length()):
+                values.extend( (us[i], 1.0 - vs[i]) )
+        else:
+            values.extend( [0.0]*(2*polygons.polygonVertexCount()) )
+
+    # Triangles index the face vertices of their polygon
+    def getTriangleAdder():
+        faceVertexOffset = [0]
+        def addTriangles(polygons, values):
+            polygons.getVertices(faceVertices)
+            faceVertexIndices = {}
+            for i in range(faceVertices.length()):
+                faceVertexIndices[faceVertices[i]] = faceVertexOffset[0] + i
+            polygons.getTriangles(points, triangleVertices, OpenMaya.MSpace.kObject)
+            values.extend( [faceVertexIndices[triangleVertices[i]] for i in range(triangleVertices.length())] )
+            faceVertexOffset[0] += faceVertices.length()
+        return addTriangles
+
+    return (addPositions, addNormals, addUVs, getTriangleAdder)
+
+def getSpace(objectSpace):
+    if objectSpace:
+        return OpenMaya.MSpace.kObject
+    return OpenMaya.MSpace.kWorld
+
+# Streams a mesh's polygons to a serialized mesh writer. The uvs and triangles
+# are skipped when the writer splices them in from an earlier frame.
+def writeSerializedPolygons(dagPath, writer, uvs, objectSpace=False):
+    writeSerializedMeshes([dagPath], writer, uvs, objectSpace)
+
+# Streams the polygons of several meshes to a writer as a single mesh
+def writeSerializedMeshes(dagPaths, writer, uvs, objectSpace=False):
+    (addPositions, addNormals, addUVs, getTriangleAdder) = getPolygonAdders(getSpace(objectSpace))
+
+    for dagPath in dagPaths:
+        streamPolygons(dagPath, addPositions, writer.addPositions)
+    for dagPath in dagPaths:
+        streamPolygons(dagPath, addNormals, writer.addNormals)
+    if not writer.spliceTopology:
+        if uvs:
+            for dagPath in dagPaths:
+                streamPolygons(dagPath, addUVs, writer.addUVs)
+
+        # The face vertex offset carries on from one mesh to the next
+        addTriangles = getTriangleAdder()
+        for dagPath in dagPaths:
+            streamPolygons(dagPath, addTriangles, writer.addTriangles)
+
+def exportGeometrySerialized(geom, renderDir, uvs=True, objectSpace=False):
+    geomFilename = geom.replace(':', '__').replace('|', '__')
+    serializedFilenameFullPath = os.path.join(renderDir, geomFilename + ".serialized")
+
+    dagPath = getMeshDagPath(geom)
+    (vertexCount, triangleCount, hasUVs) = getPolygonCounts(dagPath)
+    uvs = uvs and hasUVs
+
+    with MitsubaRendererMesh.SerializedMeshWriter(serializedFilenameFullPath, vertexCount, triangleCount,
+        normals=True, uvs=uvs, name=geomFilename) as writer:
+        writeSerializedPolygons(dagPath, writer, uvs, objectSpace)
+
+    return serializedFilenameFullPath
+
+#
+# Small meshes that share their surface and medium shaders are merged into a
+# single world space mesh, so they cost one file and one shape instead of one
+# each.
+#
+
+# Returns the meshes that aren't merged and a list of the groups of meshes that
+# are, with their shaders. Only static meshes are merged in an animation, and
+# meshes that are tessellated are never merged.
+def groupMergedMeshes(geoms, maxTriangles, sequenceCache=None, tessellate=False):
+    candidates = {}
+    order = []
+    for geom in geoms:
+        if len(getShadingGroups(geom)) > 1:
+            continue
+        if tessellate and MitsubaRendererTessellation.getTessellation(geom):
+            continue
+        if sequenceCache and sequenceCache.getMotion(geom) != MitsubaRendererSequence.kStatic:
+            continue
+        shape = cmds.listRelatives(geom, children=True, shapes=True, fullPath=True)[0]
+        if cmds.polyEvaluate(shape, triangle=True) > maxTriangles:
+            continue
+
+        shaders = (getSurfaceShader(geom), getVolumeShader(geom))
+        if shaders not in candidates:
+            candidates[shaders] = []
+            order.append(shaders)
+        candidates[shaders].append(geom)
+
+    groups = []
+    merged = set()
+    for shaders in order:
+        if len(candidates[shaders]) > 1:
+            groups.append( (shaders[0], shaders[1], candidates[shaders]) )
+            merged.update( candidates[shaders] )
+
+    remaining = [geom for geom in geoms if geom not in merged]
+    return (remaining, groups)
+
+def exportMergedGeometrySerialized(geoms, surfaceShader, mediumShader, renderDir, uvs=True):
+    # Named by the shaders and the meshes merged, which can change between frames
+    names = [x for x in (surfaceShader, mediumShader) if x] or ["default"]
+    mergedHash = hashlib.sha1("\n".join(geoms).encode('utf-8')).hexdigest()[:8]
+    geomFilename = "__".join(names + ["merged", mergedHash]).replace(':', '__').replace('|', '__')
+    serializedFilenameFullPath = os.path.join(renderDir, geomFilename + ".serialized")
+
+    dagPaths = [getMeshDagPath(geom) for geom in geoms]
+    vertexCount = 0
+    triangleCount = 0
+    hasUVs = False
+    for dagPath in dagPaths:
+        counts = getPolygonCounts(dagPath)
+        vertexCount += counts[0]
+        triangleCount += counts[1]
+        hasUVs = hasUVs or counts[2]
+    uvs = uvs and hasUVs
+
+    with MitsubaRendererMesh.SerializedMeshWriter(serializedFilenameFullPath, vertexCount, triangleCount,
+        normals=True, uvs=uvs, name=geomFilename) as writer:
+        writeSerializedMeshes(dagPaths, writer, uvs)
+
+    return serializedFilenameFullPath
+
+#
+# Each mesh placed by an instancer is exported once, in object space, as a
+# shapegroup. The instances of the shapegroups are written to a separate file
+# that the scene includes.
+#
+def getShapeGroupId(path):
+    return "instanced" + path.replace(':', '__').replace('|', '__')
+
+def writeShapeGroup(path, renderDir, materialElements, compactMeshes=False):
+    surfaceShader = getSurfaceShader(path)
+    volumeShader = getVolumeShader(path)
+    keepUVs = not compactMeshes or materialsUseTextures(materialElements, [surfaceShader, volumeShader])
+
+    instancedDir = os.path.join(renderDir, "instancedGeometry")
+    if not os.path.exists(instancedDir):
+        os.makedirs(instancedDir)
+    geomFilename = exportGeometrySerialized(path, instancedDir, keepUVs, objectSpace=True)
+
+    shapeGroup = ShapeElement('shapegroup', getShapeGroupId(path))
+    shapeGroup.addChild( writeShape(geomFilename, surfaceShader, volumeShader, renderDir, 
+        toWorld=cmds.getAttr(path + ".worldMatrix")) )
+    return (geomFilename, shapeGroup)
+
+# Returns the instances file and the number of instances written. The shape
+# groups of the meshes that haven't been written yet are added to shapeGroups.
+def writeInstancer(instancer, renderDir, materialElements, shapeGroups, compactMeshes=False):
+    (pathNames, matrices, pairParticles, pairPaths) = MitsubaRendererInstancer.getInstances(instancer)
+
+    files = []
+    shapeGroupMatrices = []
+    instanceCount = 0
+    for pathIndex, path in enumerate(pathNames):
+        if not isInstancedMesh(path):
+            continue
+
+        if path not in shapeGroups:
+            (geomFilename, shapeGroup) = writeShapeGroup(path, renderDir, materialElements, compactMeshes)
+            shapeGroups[path] = shapeGroup
+            files.append(geomFilename)
+
+        pathMatrices = MitsubaRendererInstancer.getPathMatrices(matrices, pairParticles, pairPaths, pathIndex)
+        shapeGroupMatrices.append( (getShapeGroupId(path), pathMatrices) )
+        instanceCount += len(pathMatrices)
+
+    instancesFilename = None
+    if shapeGroupMatrices:
+        instancerName = instancer.replace(':', '__').replace('|', '__')
+        instancesFilename = MitsubaRendererInstancer.writeInstances(
+            os.path.join(renderDir, instancerName + ".instances.xml"), shapeGroupMatrices)
+        files.append(instancesFilename)
+
+    return (files, instancesFilename, instanceCount)
+
+#
+# Curves are written as Mitsuba's binary hair, in world space, a file per group
+# of curves. The fibers of linear curves follow their control vertices. Other
+# curves are evaluated at their distinct knots within the curve's parameter
+# range, and at subdivisions points along each span, so the fibers pass
+# through points on the curves and follow their curvature.
+#
+def getCurveSpanPoints(shape, subdivisions):
+    selection = OpenMaya.MSelectionList()
+    selection.add(shape)
+    dagPath = OpenMaya.MDagPath()
+    selection.getDagPath(0, dagPath)
+    curve = OpenMaya.MFnNurbsCurve(dagPath)
+    knots = OpenMaya.MDoubleArray()
+    curve.getKnots(knots)
+
+    start = cmds.getAttr(shape + ".minValue")
+    end = cmds.getAttr(shape + ".maxValue")
+    knotParams = sorted(set([knots[i] for i in range(knots.length()) if start <= knots[i] <= end]))
+
+    subdivisions = max(subdivisions, 1)
+    params = []
+    for (spanStart, spanEnd) in zip(knotParams[:-1], knotParams[1:]):
+        params.extend( [spanStart + (spanEnd - spanStart)*i/float(subdivisions) for i in range(subdivisions)] )
+    params.extend( knotParams[-1:] )
+
+    points = []
+    point = OpenMaya.MPoint()
+    for param in params:
+        curve.getPointAtParam(param, point, OpenMaya.MSpace.kWorld)
+        points.append( (point.x, point.y, point.z) )
+    return points
+
+def exportHair(group, curves, renderDir, subdivisions=4):
+    hairFilename = group.replace(':', '__').replace('|', '__')
+    hairFilenameFullPath = os.path.join(renderDir, hairFilename + ".mitshair")
+
+    with MitsubaRendererHair.HairWriter(hairFilenameFullPath) as writer:
+        for curve in curves:
+            shape = cmds.listRelatives(curve, children=True, shapes=True, noIntermediate=True, 
+                fullPath=True)[0]
+            if cmds.getAttr(shape + ".degree") > 1:
+                writer.addFiber(getCurveSpanPoints(shape, subdivisions))
+                continue
+
+            values = cmds.xform(curve + ".cv[*]", query=True, worldSpace=True, translation=True)
+            cvs = [tuple(values[i:i+3]) for i in range(0, len(values), 3)]
+
+            # Periodic curves
+            if cmds.getAttr(shape + ".form") == 2 and cvs and cvs[0] != cvs[-1]:
+                cvs.append(cvs[0])
+            writer.addFiber(cvs)
+
+    return (hairFilenameFullPath, writer.segments)
+
+# The filename parameters of the density and albedo grid volumes under
+# elements, with the name of the volume they belong to
+def getGridVolumeFiles(elements):
+    files = []
+    for element in elements:
+        if not element:
+            continue
+        attributes = element['attributes']
+        if (element['type'] == 'volume' and attributes.get('type') == 'gridvolume' and 
+            attributes.get('name') in ['density', 'albedo']):
+            for child in element['children']:
+                if child['type'] == 'string' and child['attributes'].get('name') == 'filename':
+                    files.append( (child, attributes.get('name')) )
+        files.extend( getGridVolumeFiles(element['children']) )
+    return files
+
+# Replaces the files of the grid volumes under elements with the files
+# volumeCache preprocesses them to
+def preprocessVolumes(elements, volumeCache):
+    for (filenameElement, name) in getGridVolumeFiles(elements):
+        filenameElement.addAttribute('value', volumeCache.preprocess(filenameElement['attributes']['value'], 
+            crop=(name == 'density')))
+
+# Starts converting the OpenVDB files of the grid volumes under elements, and
+# returns the grid volumes' filename parameters
+def convertVDBVolumes(elements, vdbConverter):
+    vdbFiles = [(filenameElement, name) for (filenameElement, name) in getGridVolumeFiles(elements)
+        if MitsubaRendererVDB.isVDBFile(filenameElement['attributes']['value'])]
+    if vdbFiles and not vdbConverter.isAvailable():
+        print( "Skipping OpenVDB conversion, pyopenvdb and NumPy are needed to read OpenVDB files" )
+        return []
+
+    for (filenameElement, name) in vdbFiles:
+        vdbConverter.submit(filenameElement['attributes']['value'], name)
+    vdbConverter.close()
+    return vdbFiles
+
+#
+# Fluid containers are written as a cube holding a heterogeneous medium, with
+# the fluid's density grid, and its color grid as the albedo. The medium's
+# other parameters come from the Mitsuba heterogeneous medium assigned to the
+# fluid, when there is one. The cube has no BSDF, so its boundary is index
+# matched.
+#
+def GridVolumeElement(name, volumePath, toWorld):
+    element = VolumeElement(name, volumePath)
+    transformDict = TransformElement()
+    transformDict.addAttribute('name', 'toWorld')
+    transformDict.addChild( MatrixElement(toWorld) )
+    element.addChild( transformDict )
+    return element
+
+def writeFluid(transform, densityFilename, colorFilename):
+    fluid = MitsubaRendererFluid.getFluidShape(transform)
+    worldMatrix = cmds.getAttr(transform + ".worldMatrix")
+
+    volumes = {'density' : GridVolumeElement('density', densityFilename, worldMatrix)}
+    if colorFilename:
+        volumes['albedo'] = GridVolumeElement('albedo', colorFilename, worldMatrix)
+
+    medium = getVolumeShader(transform)
+    if medium and cmds.nodeType(medium) == "MitsubaHeterogeneousParticipatingMedium":
+        mediumElement = writeMediumHeterogeneous(medium, None, volumes)
+    else:
+        mediumElement = MediumElement('heterogeneous')
+        mediumElement.addChild( StringParameter('method', 'woodcock') )
+        mediumElement.addChild( volumes['density'] )
+        if 'albedo' in volumes:
+            mediumElement.addChild( volumes['albedo'] )
+        else:
+            albedoElement = VolumeElement('albedo', typeAttribute='constvolume')
+            albedoElement.addChild( SpectrumParameter('value', 1.0) )
+            mediumElement.addChild( albedoElement )
+        mediumElement.addChild( FloatParameter('scale', cmds.getAttr(fluid + ".densityScale")) )
+    mediumElement.addAttribute('name', 'interior')
+
+    # Mitsuba's cube spans -1 to 1 on each axis
+    bbox = MitsubaRendererFluid.getFluidBoundingBox(fluid)
+    toWorld = list(worldMatrix)
+    for row in range(3):
+        halfSize = (bbox[row + 3] - bbox[row])/2.0
+        toWorld[row*4:row*4 + 4] = [x*halfSize for x in toWorld[row*4:row*4 + 4]]
+
+    shapeDict = ShapeElement('cube')
+    transformDict = TransformElement()
+    transformDict.addAttribute('name', 'toWorld')
+    transformDict.addChild( MatrixElement(toWorld) )
+    shapeDict.addChild( transformDict )
+    shapeDict.addChild( mediumElement )
+    return shapeDict
+
+# Appends the current frame of a deforming mesh to its archive and returns its
+# shape index. Frames with the same face vertices, triangles and uvs as the
+# previous one reuse its compressed uvs and triangles.
+def exportGeometryToArchive(geom, archive, uvs=True):
+    geomFilename = geom.replace(':', '__').replace('|', '__')
+
+    dagPath = getMeshDagPath(geom)
+    (vertexCount, triangleCount, hasUVs) = getPolygonCounts(dagPath)
+    uvs = uvs and hasUVs
+
+    (mesh, shapeIndex) = archive.appendMesh(vertexCount, triangleCount, normals=True, uvs=uvs, 
+        name=geomFilename, topologyKey=(vertexCount, triangleCount, uvs, getTopologyHash(dagPath, uvs)))
+    with mesh as writer:
+        writeSerializedPolygons(dagPath, writer, uvs)
+
+    return shapeIndex
+
+#
+# Meshes with per-face shading group assignments are split into one part per
+# shading group. The parts are written to one binary file and selected in the
+# scene with shapeIndex, each with its own materials.
+#
+
+# Returns the shading group of each part of a mesh, None for faces without
+# one, and the part of each face. Shading groups without faces are skipped.
+def getShadingGroupParts(dagPath):
+    mesh = OpenMaya.MFnMesh(dagPath)
+    shaders = OpenMaya.MObjectArray()
+    faceShaders = OpenMaya.MIntArray()
+    mesh.getConnectedShaders(dagPath.instanceNumber(), shaders, faceShaders)
+
+    shadingGroups = []
+    partIndices = {}
+    faceParts = []
+    for i in range(faceShaders.length()):
+        shaderIndex = faceShaders[i]
+        if shaderIndex not in partIndices:
+            partIndices[shaderIndex] = len(shadingGroups)
+            if shaderIndex < 0:
+                shadingGroups.append(None)
+            else:
+                shadingGroups.append(OpenMaya.MFnDependencyNode(shaders[shaderIndex]).name())
+        faceParts.append(partIndices[shaderIndex])
+
+    return (shadingGroups, faceParts)
+
+# Gathers every part of a mesh in a single pass over its polygons, then writes
+# the parts to a file as consecutive meshes
+def exportGeometryParts(geom, renderDir, dagPath, faceParts, partCount, uvs=True, objectSpace=False):
+    geomFilename = geom.replace(':', '__').replace('|', '__')
+    serializedFilenameFullPath = os.path.join(renderDir, geomFilename + ".serialized")
+
+    (addPositions, addNormals, addUVs, getTriangleAdder) = getPolygonAdders(getSpace(objectSpace))
+
+    parts = []
+    for i in range(partCount):
+        parts.append( {
+            'positions' : array.array('f'),
+            'normals' : array.array('f'),
+            'uvs' : array.array('f'),
+            'triangles' : array.array('I'),
+            'addTriangles' : getTriangleAdder(),
+        } )
+
+    hasUVs = False
+    polygons = OpenMaya.MItMeshPolygon(dagPath)
+    while not polygons.isDone():
+        part = parts[faceParts[polygons.index()]]
+        addPositions(polygons, part['positions'])
+        addNormals(polygons, part['normals'])
+        if uvs:
+            addUVs(polygons, part['uvs'])
+            hasUVs = hasUVs or polygons.hasUVs()
+        part['addTriangles'](polygons, part['triangles'])
+        polygons.next()
+    uvs = uvs and hasUVs
+
+    archive = MitsubaRendererMesh.SerializedArchive(serializedFilenameFullPath)
+    for i, part in enumerate(parts):
+        (mesh, shapeIndex) = archive.appendMesh(len(part['positions'])//3, len(part['triangles'])//3, 
+            normals=True, uvs=uvs, name="%s_%d" % (geomFilename, i))
+        with mesh as writer:
+            writer.addPositions(part['positions'])
+            writer.addNormals(part['normals'])
+            if uvs:
+                writer.addUVs(part['uvs'])
+            writer.addTriangles(part['triangles'])
+
+    return serializedFilenameFullPath
+
+def writeShape(geomFilename, surfaceShader, mediumShader, renderDir, faceNormals=False, toWorld=None,
+    shapeIndex=None):
+    if geomFilename.endswith(".serialized"):
+        shapeDict = ShapeElement('serialized')
+    elif geomFilename.endswith(".mitshair"):
+        shapeDict = ShapeElement('hair')
+    else:
+        shapeDict = ShapeElement('obj')
 
     # Add reference to exported geometry
     shapeDict.addChild( StringParameter('filename', geomFilename) )
 
+    # One of the meshes of an archive
+    if shapeIndex is not None:
+        shapeDict.addChild( IntegerParameter('shapeIndex', shapeIndex) )
+
+    # Geometry exported in object space
+    if toWorld:
+        transformDict = TransformElement()
+        transformDict.addAttribute('name', 'toWorld')
+        transformDict.addChild( MatrixElement(toWorld) )
+        shapeDict.addChild( transformDict )
+
+    # Compacted faceted meshes don't store normals
+    if faceNormals:
+        shapeDict.addChild( BooleanParameter('faceNormals', True) )
+
     # Write medium shader reference
     if mediumShader and cmds.nodeType(mediumShader) in materialNodeTypes:
         if cmds.nodeType(mediumShader) == "MitsubaSSSDipoleShader":
@@ -2544,10 +3404,82 @@ def writeShape(geomFilename, surfaceShader, mediumShader, renderDir):
     return shapeDict
 
 
-def writeGeometryAndMaterials(renderDir):
-    geoms = getRenderableGeometry()
-
-    writtenMaterials, materialElements = writeMaterials(geoms)
+# Whether any of the materials written for the shaders uses a texture. Shaders
+# without a written material, like area lights, are assumed to.
+def materialsUseTextures(materialElements, shaders):
+    for shader in shaders:
+        if not shader or cmds.nodeType(shader) not in materialNodeTypes:
+            continue
+
+        materialElement = None
+        for element in materialElements:
+            if element['attributes'].get('id') == shader:
+                materialElement = element
+                break
+        if not materialElement:
+            return True
+
+        stack = [materialElement]
+        while stack:
+            element = stack.pop()
+            if element['type'] == 'texture':
+                return True
+            stack.extend( element['children'] )
+
+    return False
+
+def writeGeometryAndMaterials(renderDir, statistics=None, renderSettings=None, sequenceCache=None):
+    with exportStage(statistics, "getRenderableGeometry"):
+        geoms = getRenderableGeometry(renderSettings)
+
+    with exportStage(statistics, "getRenderableInstancers"):
+        instancers = getRenderableInstancers()
+        instancedGeoms = []
+        for instancer in instancers:
+            instancedGeoms.extend( [x for x in getInstancerSources(instancer) if x not in instancedGeoms] )
+
+    curveGroups = []
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "exportCurves")):
+        with exportStage(statistics, "getRenderableCurves"):
+            curveGroups = getRenderableCurveGroups()
+
+    # The materials of a group of curves are those of its first curve
+    with exportStage(statistics, "writeMaterials") as stage:
+        writtenMaterials, materialElements = writeMaterials(geoms + 
+            [x for x in instancedGeoms if x not in geoms] + [curves[0] for (group, curves) in curveGroups])
+        stage.addElements(materialElements)
+
+    # OpenVDB files are converted while the geometry is exported
+    vdbConverter = MitsubaRendererVDB.VDBConverter(os.path.join(renderDir, "vdbCache"))
+    vdbFiles = convertVDBVolumes(materialElements, vdbConverter)
+
+    compactMeshes = False
+    binaryMeshes = False
+    if renderSettings:
+        compactMeshes = cmds.getAttr("%s.%s" % (renderSettings, "compactMeshes"))
+        binaryMeshes = cmds.getAttr("%s.%s" % (renderSettings, "binaryMeshes"))
+    compaction = []
+
+    # Small meshes that share shaders are merged
+    mergedGroups = []
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "mergeSmallMeshes")):
+        with exportStage(statistics, "groupMergedMeshes"):
+            (geoms, mergedGroups) = groupMergedMeshes(geoms, 
+                cmds.getAttr("%s.%s" % (renderSettings, "mergeMeshTriangles")), sequenceCache,
+                cmds.getAttr("%s.%s" % (renderSettings, "tessellateSurfaces")))
+
+    # NURBS surfaces and smooth preview meshes are tessellated, in object space
+    tessellationCache = None
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "tessellateSurfaces")):
+        tessellationCache = MitsubaRendererTessellation.TessellationCache(
+            os.path.join(renderDir, "tessellationCache"),
+            lambda geom, directory, uvs: exportGeometrySerialized(geom, directory, uvs, objectSpace=True))
+
+    levelOfDetail = None
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "levelOfDetail")):
+        levelOfDetail = MitsubaRendererLOD.LevelOfDetail(getRenderableCamera(),
+            cmds.getAttr("%s.%s" % (renderSettings, "lodTrianglesPerPixel")),
+            os.path.join(renderDir, "lodCache"))
 
     geoFiles = []
     shapeElements = []
@@ -2561,15 +3493,280 @@ def writeGeometryAndMaterials(renderDir):
         #print( "\tsurface : %s" % surfaceShader )
         #print( "\tvolume  : %s" % volumeShader )
 
-        geomFilename = exportGeometry(geom, renderDir)
+        keepUVs = not compactMeshes or materialsUseTextures(materialElements, [surfaceShader, volumeShader])
+
+        motion = None
+        if sequenceCache:
+            motion = sequenceCache.getMotion(geom)
+        cacheRigid = (sequenceCache and sequenceCache.rigidMeshes and 
+            motion != MitsubaRendererSequence.kDeforming)
+
+        # The smoothed mesh doesn't keep per-face shading group assignments, so
+        # meshes with several shading groups are exported unsmoothed, split by
+        # shading group
+        tessellation = None
+        if tessellationCache:
+            tessellation = MitsubaRendererTessellation.getTessellation(geom)
+        if (tessellation and tessellation[0] == MitsubaRendererTessellation.kTessellateSmoothMesh and 
+            len(getShadingGroups(geom)) > 1):
+            print( "Skipping smooth preview tessellation of mesh with several shading groups : %s" % geom )
+            tessellation = None
+        if tessellation:
+            with exportStage(statistics, "tessellate") as stage:
+                geomFilename = tessellationCache.export(geom, tessellation, keepUVs)
+                stage.addFile(geomFilename)
+
+            with exportStage(statistics, "writeShape") as stage:
+                shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir, 
+                    toWorld=cmds.getAttr(geom + ".worldMatrix"))
+                stage.addElements(shapeElement)
+            shapeElements.append(shapeElement)
+            continue
+
+        # Meshes with several shading groups are split into a part per shading group
+        partShaders = []
+        if len(getShadingGroups(geom)) > 1:
+            dagPath = getMeshDagPath(geom)
+            (partShadingGroups, faceParts) = getShadingGroupParts(dagPath)
+            if len(partShadingGroups) > 1:
+                partShaders = [(getShadingGroupSurfaceShader(sg), getShadingGroupVolumeShader(sg)) 
+                    for sg in partShadingGroups]
+
+        if partShaders:
+            shaders = []
+            for shaderPair in partShaders:
+                shaders.extend(shaderPair)
+            keepUVs = not compactMeshes or materialsUseTextures(materialElements, shaders)
+
+            geomFilename = None
+            if cacheRigid:
+                geomFilename = sequenceCache.getFile(geom)
+            if not geomFilename:
+                with exportStage(statistics, "exportGeometry") as stage:
+                    if cacheRigid:
+                        geomFilename = exportGeometryParts(geom, sequenceCache.getDirectory(), dagPath, 
+                            faceParts, len(partShaders), keepUVs, objectSpace=True)
+                        sequenceCache.setFile(geom, geomFilename)
+                    else:
+                        geomFilename = exportGeometryParts(geom, renderDir, dagPath, 
+                            faceParts, len(partShaders), keepUVs)
+                        geoFiles.append(geomFilename)
+                    stage.addFile(geomFilename)
+
+            toWorld = None
+            if cacheRigid:
+                toWorld = cmds.getAttr(geom + ".worldMatrix")
+
+            with exportStage(statistics, "writeShape") as stage:
+                for shapeIndex, (partSurfaceShader, partVolumeShader) in enumerate(partShaders):
+                    shapeElement = writeShape(geomFilename, partSurfaceShader, partVolumeShader, renderDir, 
+                        toWorld=toWorld, shapeIndex=shapeIndex)
+                    stage.addElements(shapeElement)
+                    shapeElements.append(shapeElement)
+            continue
+
+        # Meshes that are small on screen are decimated, unless they're textured
+        geomFilename = None
+        if levelOfDetail and not materialsUseTextures(materialElements, [surfaceShader, volumeShader]):
+            with exportStage(statistics, "decimateMesh") as stage:
+                geomFilename = levelOfDetail.exportDecimated(geom)
+                if geomFilename:
+                    stage.addFile(geomFilename)
+
+        if geomFilename:
+            toWorld = cmds.getAttr(geom + ".worldMatrix")
+            with exportStage(statistics, "writeShape") as stage:
+                shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir, toWorld=toWorld)
+                stage.addElements(shapeElement)
+            shapeElements.append(shapeElement)
+            continue
+
+        # Static and rigid meshes are exported once per animation, in object space
+        if cacheRigid:
+            geomFilename = sequenceCache.getFile(geom)
+            if not geomFilename:
+                with exportStage(statistics, "exportGeometry") as stage:
+                    geomFilename = exportGeometrySerialized(geom, sequenceCache.getDirectory(), 
+                        keepUVs, objectSpace=True)
+                    stage.addFile(geomFilename)
+                sequenceCache.setFile(geom, geomFilename)
+            toWorld = cmds.getAttr(geom + ".worldMatrix")
+
+            with exportStage(statistics, "writeShape") as stage:
+                shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir, toWorld=toWorld)
+                stage.addElements(shapeElement)
+            shapeElements.append(shapeElement)
+            continue
+
+        # Deforming meshes add a mesh per frame to an archive
+        if sequenceCache and sequenceCache.deformingMeshes and motion == MitsubaRendererSequence.kDeforming:
+            archive = sequenceCache.getArchive(geom)
+            with exportStage(statistics, "exportGeometry") as stage:
+                shapeIndex = exportGeometryToArchive(geom, archive, keepUVs)
+                stage.addFile(archive.filename)
+
+            with exportStage(statistics, "writeShape") as stage:
+                shapeElement = writeShape(archive.filename, surfaceShader, volumeShader, renderDir, 
+                    shapeIndex=shapeIndex)
+                stage.addElements(shapeElement)
+            shapeElements.append(shapeElement)
+            continue
+
+        with exportStage(statistics, "exportGeometry") as stage:
+            if binaryMeshes:
+                geomFilename = exportGeometrySerialized(geom, renderDir, keepUVs)
+            else:
+                geomFilename = exportGeometry(geom, renderDir)
+            stage.addFile(geomFilename)
         geoFiles.append(geomFilename)
 
-        shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir)
+        faceNormals = False
+        if compactMeshes and not binaryMeshes:
+            with exportStage(statistics, "compactMesh") as stage:
+                meshStatistics = MitsubaRendererMesh.compactOBJ(geomFilename, keepUVs)
+                stage.addFile(geomFilename)
+            faceNormals = meshStatistics['faceNormals']
+            compaction.append(meshStatistics)
+
+        with exportStage(statistics, "writeShape") as stage:
+            shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir, faceNormals)
+            stage.addElements(shapeElement)
         shapeElements.append(shapeElement)
 
+    # Merged meshes are written once per animation when they're cached
+    for (surfaceShader, volumeShader, mergedGeoms) in mergedGroups:
+        keepUVs = not compactMeshes or materialsUseTextures(materialElements, [surfaceShader, volumeShader])
+        mergedKey = ("merged", surfaceShader, volumeShader, tuple(mergedGeoms))
+
+        geomFilename = None
+        if sequenceCache:
+            geomFilename = sequenceCache.getFile(mergedKey)
+        if not geomFilename:
+            with exportStage(statistics, "exportGeometry") as stage:
+                if sequenceCache:
+                    geomFilename = exportMergedGeometrySerialized(mergedGeoms, surfaceShader, volumeShader,
+                        sequenceCache.getDirectory(), keepUVs)
+                    sequenceCache.setFile(mergedKey, geomFilename)
+                else:
+                    geomFilename = exportMergedGeometrySerialized(mergedGeoms, surfaceShader, volumeShader,
+                        renderDir, keepUVs)
+                    geoFiles.append(geomFilename)
+                stage.addFile(geomFilename)
+
+        with exportStage(statistics, "writeShape") as stage:
+            shapeElement = writeShape(geomFilename, surfaceShader, volumeShader, renderDir)
+            stage.addElements(shapeElement)
+        shapeElements.append(shapeElement)
+
+    # Instancers add the shapegroups of their meshes, then include their instances
+    shapeGroups = {}
+    instanceElements = []
+    instanceCount = 0
+    for instancer in instancers:
+        with exportStage(statistics, "writeInstancer") as stage:
+            (instancerFiles, instancesFilename, instancerCount) = writeInstancer(instancer, renderDir, 
+                materialElements, shapeGroups, compactMeshes)
+            for instancerFile in instancerFiles:
+                stage.addFile(instancerFile)
+        geoFiles.extend(instancerFiles)
+        instanceCount += instancerCount
+        if instancesFilename:
+            instanceElements.append( SceneElement('include', {'filename':instancesFilename}) )
+
+    if instancers:
+        shapeElements.extend( [shapeGroups[x] for x in sorted(shapeGroups)] )
+        shapeElements.extend( instanceElements )
+        print( "Instancers - instancers : %d, meshes : %d, instances : %d" % (
+            len(instancers), len(shapeGroups), instanceCount) )
+
+    # Static groups of curves are written once per animation
+    hairSegments = 0
+    hairSubdivisions = 4
+    if curveGroups:
+        hairSubdivisions = cmds.getAttr("%s.%s" % (renderSettings, "hairSubdivisions"))
+    for (group, curves) in curveGroups:
+        static = bool(sequenceCache) and all([sequenceCache.getMotion(curve) == MitsubaRendererSequence.kStatic
+            for curve in curves])
+        hairKey = ("hair", group)
+
+        hairFilename = None
+        if static:
+            hairFilename = sequenceCache.getFile(hairKey)
+        if not hairFilename:
+            with exportStage(statistics, "exportHair") as stage:
+                if static:
+                    (hairFilename, segments) = exportHair(group, curves, sequenceCache.getDirectory(), 
+                        hairSubdivisions)
+                    sequenceCache.setFile(hairKey, hairFilename)
+                else:
+                    (hairFilename, segments) = exportHair(group, curves, renderDir, hairSubdivisions)
+                    geoFiles.append(hairFilename)
+                stage.addFile(hairFilename)
+            hairSegments += segments
+
+        with exportStage(statistics, "writeShape") as stage:
+            shapeElement = writeShape(hairFilename, getSurfaceShader(curves[0]), None, renderDir)
+            shapeElement.addChild( FloatParameter('radius', 
+                cmds.getAttr("%s.%s" % (renderSettings, "hairRadius"))) )
+            stage.addElements(shapeElement)
+        shapeElements.append(shapeElement)
+
+    if curveGroups:
+        print( "Hair - groups : %d, curves : %d, segments written : %d" % (len(curveGroups),
+            sum([len(curves) for (group, curves) in curveGroups]), hairSegments) )
+
+    # Fluid grids are read every frame and written when they've changed
+    if renderSettings and cmds.getAttr("%s.%s" % (renderSettings, "exportFluids")):
+        fluidCache = MitsubaRendererFluid.FluidCache(os.path.join(renderDir, "fluidCache"))
+        for fluid in getRenderableFluids():
+            with exportStage(statistics, "exportFluid") as stage:
+                (densityFilename, colorFilename) = fluidCache.export(fluid)
+                for filename in [densityFilename, colorFilename]:
+                    if filename:
+                        stage.addFile(filename)
+            if not densityFilename:
+                print( "Skipping fluid without a density grid : %s" % fluid )
+                continue
+
+            with exportStage(statistics, "writeShape") as stage:
+                shapeElement = writeFluid(fluid, densityFilename, colorFilename)
+                stage.addElements(shapeElement)
+            shapeElements.append(shapeElement)
+        print( fluidCache.formatReport() )
+
+    if vdbFiles:
+        with exportStage(statistics, "convertVDB") as stage:
+            for (filenameElement, name) in vdbFiles:
+                volumeFilename = vdbConverter.getResult(filenameElement['attributes']['value'], name)
+                filenameElement.addAttribute('value', volumeFilename)
+                stage.addFile(volumeFilename)
+        print( vdbConverter.formatReport() )
+
+    # Grid volumes are cropped to their density and resampled to the voxel size
+    if renderSettings:
+        crop = cmds.getAttr("%s.%s" % (renderSettings, "cropVolumes"))
+        voxelSize = cmds.getAttr("%s.%s" % (renderSettings, "volumeVoxelSize"))
+        if crop or voxelSize > 0.0:
+            volumeCache = MitsubaRendererVolume.VolumeCache(os.path.join(renderDir, "volumeCache"), 
+                crop, voxelSize)
+            with exportStage(statistics, "preprocessVolumes"):
+                preprocessVolumes(materialElements + shapeElements, volumeCache)
+            print( volumeCache.formatReport() )
+
+    if mergedGroups:
+        print( "Merged meshes - meshes : %d, shapes : %d" % (
+            sum([len(group[2]) for group in mergedGroups]), len(mergedGroups)) )
+
+    if compaction:
+        print( MitsubaRendererMesh.formatCompaction(compaction) )
+    if levelOfDetail:
+        print( levelOfDetail.formatDecimation() )
+    if tessellationCache:
+        print( tessellationCache.formatTessellation() )
+
     return (geoFiles, shapeElements, materialElements)
 
-def writeScene(outFileName, renderDir, renderSettings):
+def getSceneElement(renderDir, renderSettings, statistics=None, sequenceCache=None):
     #
     # Generate scene element hierarchy
     #
@@ -2579,27 +3776,37 @@ def writeScene(outFileName, renderDir, renderSettings):
     sceneElement.addAttribute('version', '0.5.0')
 
     # Get integrator
-    integratorElement = writeIntegrator(renderSettings)
+    with exportStage(statistics, "writeIntegrator") as stage:
+        integratorElement = writeIntegrator(renderSettings)
+        stage.addElements(integratorElement)
     sceneElement.addChild( integratorElement)
 
     # Get sensor : camera, sampler, and film
     frameNumber = int(cmds.currentTime(query=True))
-    sensorElement = writeSensor(frameNumber, renderSettings)
+    with exportStage(statistics, "writeSensor") as stage:
+        sensorElement = writeSensor(frameNumber, renderSettings)
+        stage.addElements(sensorElement)
     sceneElement.addChild( sensorElement)
 
     # Get lights
-    lightElements = writeLights()
+    with exportStage(statistics, "writeLights") as stage:
+        lightElements = writeLights()
+        stage.addElements(lightElements)
     if lightElements:
         sceneElement.addChildren( lightElements )
 
     # Get geom and material assignments
-    (exportedGeometryFiles, shapeElements, materialElements) = writeGeometryAndMaterials(renderDir)
+    (exportedGeometryFiles, shapeElements, materialElements) = writeGeometryAndMaterials(renderDir, statistics,
+        renderSettings, sequenceCache)
     if materialElements:
         sceneElement.addChildren( materialElements )
 
     if shapeElements:
         sceneElement.addChildren( shapeElements )
 
+    return (sceneElement, exportedGeometryFiles)
+
+def writeSceneElement(outFileName, sceneElement):
     #
     # Write the structure to disk
     #
@@ -2607,5 +3814,11 @@ def writeScene(outFileName, renderDir, renderSettings):
         outFile.write("<?xml version=\'1.0\' encoding=\'utf-8\'?>\n")
         writeElement(outFile, sceneElement)
 
-    return exportedGeometryFiles
+def writeScene(outFileName, renderDir, renderSettings, statistics=None):
+    (sceneElement, exportedGeometryFiles) = getSceneElement(renderDir, renderSettings, statistics)
+
+    with exportStage(statistics, "writeSceneElement") as stage:
+        writeSceneElement(outFileName, sceneElement)
+        stage.addFile(outFileName)
 
+    return exportedGeometryFiles
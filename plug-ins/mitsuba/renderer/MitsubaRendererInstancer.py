@@ -0,0 +1,111 @@
+import maya.OpenMaya as OpenMaya
+import maya.OpenMayaFX as OpenMayaFX
+
+# The Python API 2.0 returns instance matrices much faster, where it has an
+# instancer function set
+try:
+    import maya.api.OpenMaya as OpenMaya2
+    import maya.api.OpenMayaFX as OpenMayaFX2
+    if not hasattr(OpenMayaFX2, "MFnInstancer"):
+        OpenMayaFX2 = None
+except ImportError:
+    OpenMayaFX2 = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Particle instancers, exported as a shapegroup per instanced mesh and an
+# instance of it per particle
+#
+
+# Returns the full path of each instanced object, the instancing matrix of each
+# particle as 16 values in Maya's row vector convention, and for each pair of
+# particle and instanced object, the particle and the object's index
+def getInstances(instancer):
+    if OpenMayaFX2:
+        selection = OpenMaya2.MSelectionList()
+        selection.add(instancer)
+        (paths, matrices, startIndices, pathIndices) = OpenMayaFX2.MFnInstancer(
+            selection.getDagPath(0)).allInstances()
+        pathNames = [paths[i].fullPathName() for i in range(len(paths))]
+        values = []
+        for matrix in matrices:
+            values.extend(matrix)
+        startIndices = list(startIndices)
+        pathIndices = list(pathIndices)
+    else:
+        selection = OpenMaya.MSelectionList()
+        selection.add(instancer)
+        dagPath = OpenMaya.MDagPath()
+        selection.getDagPath(0, dagPath)
+
+        paths = OpenMaya.MDagPathArray()
+        matrices = OpenMaya.MMatrixArray()
+        startIndexArray = OpenMaya.MIntArray()
+        pathIndexArray = OpenMaya.MIntArray()
+        OpenMayaFX.MFnInstancer(dagPath).allInstances(paths, matrices, startIndexArray, pathIndexArray)
+
+        pathNames = [paths[i].fullPathName() for i in range(paths.length())]
+        values = []
+        for i in range(matrices.length()):
+            matrix = matrices[i]
+            values.extend( [matrix(row, column) for row in range(4) for column in range(4)] )
+        startIndices = [startIndexArray[i] for i in range(startIndexArray.length())]
+        pathIndices = [pathIndexArray[i] for i in range(pathIndexArray.length())]
+
+    particleCount = len(values)//16
+
+    # The start indices may or may not end with the total number of paths
+    if len(startIndices) == particleCount:
+        startIndices.append(len(pathIndices))
+
+    if numpy:
+        values = numpy.array(values, dtype=numpy.float64).reshape(-1, 16)
+        pairParticles = numpy.repeat(numpy.arange(particleCount), numpy.diff(startIndices))
+        pairPaths = numpy.array(pathIndices, dtype=numpy.int64)
+    else:
+        values = [values[i*16:(i + 1)*16] for i in range(particleCount)]
+        pairParticles = []
+        for particle in range(particleCount):
+            pairParticles.extend( [particle]*(startIndices[particle + 1] - startIndices[particle]) )
+        pairPaths = pathIndices
+
+    return (pathNames, values, pairParticles, pairPaths)
+
+# The matrices of the particles that instance the object with index pathIndex
+def getPathMatrices(matrices, pairParticles, pairPaths, pathIndex):
+    if numpy:
+        return matrices[pairParticles[pairPaths == pathIndex]]
+    return [matrices[particle] for (particle, path) in zip(pairParticles, pairPaths) if path == pathIndex]
+
+# Percent signs are escaped too, as the ids end up in format strings
+def escapeXML(text):
+    return (text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+        .replace('%', '&#37;'))
+
+# Writes a scene holding an instance of a shapegroup per matrix, to be included
+# in the main scene. The instances are written straight to the file, one line
+# each, rather than being built as scene elements.
+def writeInstances(filename, shapeGroupMatrices):
+    with open(filename, 'w') as instancesFile:
+        instancesFile.write( '<?xml version="1.0" encoding="utf-8"?>\n\n<scene version="0.5.0">\n' )
+        for (shapeGroupId, matrices) in shapeGroupMatrices:
+            prefix = '\t<shape type="instance"><ref id="%s"/><transform name="toWorld"><matrix value="' % (
+                escapeXML(shapeGroupId))
+            instanceFormat = prefix + " ".join(["%.9g"]*16) + '"/></transform></shape>'
+
+            # Mitsuba's matrices are the transpose of Maya's
+            if numpy:
+                if len(matrices):
+                    transposed = matrices.reshape(-1, 4, 4).transpose(0, 2, 1).reshape(-1, 16)
+                    numpy.savetxt(instancesFile, transposed, fmt=instanceFormat)
+            else:
+                for matrix in matrices:
+                    transposed = tuple([matrix[column*4 + row] for row in range(4) for column in range(4)])
+                    instancesFile.write( instanceFormat % transposed + "\n" )
+        instancesFile.write( '</scene>\n' )
+
+    return filename
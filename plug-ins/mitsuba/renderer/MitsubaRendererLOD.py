@@ -0,0 +1,298 @@
+import hashlib
+import math
+import os
+
+import maya.cmds as cmds
+import maya.OpenMaya as OpenMaya
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import MitsubaRendererCulling
+import MitsubaRendererMesh
+
+#
+# Level of detail chosen from the size of each mesh on screen
+#
+
+# Meshes with fewer triangles are never decimated
+kLODMinimumTriangles = 1000
+kLODMinimumTargetTriangles = 32
+
+# Grid resolutions tried when searching for the one that meets a triangle budget
+kDecimateSearchSteps = 16
+
+#
+# Artist supplied variants. The children of a lodGroup are its levels, from
+# the most to the least detailed, and its thresholds are the camera distances
+# at which each next level takes over.
+#
+def getLODGroupLevel(transform):
+    child = transform
+    parents = cmds.listRelatives(transform, parent=True, fullPath=True)
+    while parents:
+        parent = parents[0]
+        if cmds.nodeType(parent) == "lodGroup":
+            levels = cmds.listRelatives(parent, children=True, type="transform", fullPath=True) or []
+            if child in levels:
+                return (parent, levels.index(child))
+        child = parent
+        parents = cmds.listRelatives(parent, parent=True, fullPath=True)
+    return (None, None)
+
+def getActiveLODLevel(lodGroup, cameraPosition):
+    (x, y, z) = cmds.xform(lodGroup, query=True, worldSpace=True, rotatePivot=True)
+    distance = math.sqrt(sum([(a - b)**2 for (a, b) in zip((x, y, z), cameraPosition)]))
+
+    level = 0
+    for i in range(cmds.getAttr(lodGroup + ".threshold", size=True)):
+        if distance >= cmds.getAttr("%s.threshold[%d]" % (lodGroup, i)):
+            level = i + 1
+    return level
+
+# Keeps only the level of each lodGroup that the renderable camera would see
+def selectVariants(transforms, cameraShape):
+    cameraPosition = getCameraPosition(cameraShape)
+    activeLevels = {}
+    selected = []
+    for transform in transforms:
+        (lodGroup, level) = getLODGroupLevel(transform)
+        if lodGroup:
+            if lodGroup not in activeLevels:
+                activeLevels[lodGroup] = getActiveLODLevel(lodGroup, cameraPosition)
+            if level != activeLevels[lodGroup]:
+                continue
+        selected.append(transform)
+    return selected
+
+def getCameraPosition(cameraShape):
+    matrix = cmds.getAttr(cameraShape + ".worldMatrix")
+    return (matrix[12], matrix[13], matrix[14])
+
+#
+# Decimation by vertex clustering. The vertices in each cell of a grid are
+# merged into the point that minimizes the sum of the quadric errors of their
+# faces, and the triangles that collapse are dropped.
+#
+def getFaceQuadrics(positions, triangles):
+    corners = positions[triangles]
+    normals = numpy.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    areas = numpy.sqrt((normals*normals).sum(axis=1))
+    valid = areas > 0.0
+    normals[valid] /= areas[valid][:,numpy.newaxis]
+    offsets = -(normals*corners[:,0]).sum(axis=1)
+
+    # Area weighted quadrics, as A, b and c in x.A.x + 2 b.x + c
+    weights = areas*0.5
+    A = weights[:,numpy.newaxis,numpy.newaxis]*normals[:,:,numpy.newaxis]*normals[:,numpy.newaxis,:]
+    b = (weights*offsets)[:,numpy.newaxis]*normals
+    return (A, b)
+
+def getVertexQuadrics(positions, triangles):
+    (faceA, faceB) = getFaceQuadrics(positions, triangles)
+    A = numpy.zeros((len(positions), 3, 3))
+    b = numpy.zeros((len(positions), 3))
+    for corner in range(3):
+        numpy.add.at(A, triangles[:,corner], faceA)
+        numpy.add.at(b, triangles[:,corner], faceB)
+    return (A, b)
+
+def getClusters(positions, resolution):
+    lower = positions.min(axis=0)
+    extent = positions.max(axis=0) - lower
+    cellSize = max(extent.max(), 1e-12)/resolution
+    cells = numpy.minimum(((positions - lower)/cellSize).astype(numpy.int64), resolution - 1)
+    keys = (cells[:,0]*resolution + cells[:,1])*resolution + cells[:,2]
+    (clusterKeys, clusters) = numpy.unique(keys, return_inverse=True)
+    return (clusters.reshape(-1), len(clusterKeys))
+
+# Triangles that still have three distinct vertices, without duplicates
+def getClusterTriangles(triangles, clusters):
+    clustered = clusters[triangles]
+    valid = ((clustered[:,0] != clustered[:,1]) & (clustered[:,1] != clustered[:,2]) &
+        (clustered[:,2] != clustered[:,0]))
+    clustered = clustered[valid]
+    (_, unique) = numpy.unique(numpy.sort(clustered, axis=1), axis=0, return_index=True)
+    return clustered[numpy.sort(unique)]
+
+def getClusterPositions(positions, clusters, clusterCount, A, b):
+    clusterA = numpy.zeros((clusterCount, 3, 3))
+    clusterB = numpy.zeros((clusterCount, 3))
+    numpy.add.at(clusterA, clusters, A)
+    numpy.add.at(clusterB, clusters, b)
+
+    counts = numpy.bincount(clusters, minlength=clusterCount).astype(numpy.float64)
+    means = numpy.zeros((clusterCount, 3))
+    numpy.add.at(means, clusters, positions)
+    means /= counts[:,numpy.newaxis]
+
+    # Solve for the point of least error where the quadric is well conditioned,
+    # keeping it within the bounds of the cluster's vertices
+    result = means.copy()
+    solvable = numpy.abs(numpy.linalg.det(clusterA)) > 1e-12*numpy.maximum(
+        numpy.abs(clusterA).sum(axis=(1,2)), 1e-30)**3
+    if solvable.any():
+        solved = numpy.linalg.solve(clusterA[solvable], -clusterB[solvable][:,:,numpy.newaxis])[:,:,0]
+        lower = numpy.full((clusterCount, 3), numpy.inf)
+        upper = numpy.full((clusterCount, 3), -numpy.inf)
+        numpy.minimum.at(lower, clusters, positions)
+        numpy.maximum.at(upper, clusters, positions)
+        result[solvable] = numpy.clip(solved, lower[solvable], upper[solvable])
+    return result
+
+# Returns the positions and triangles of a mesh decimated to at most
+# targetTriangles, using the finest grid that meets the budget
+def decimateMesh(positions, triangles, targetTriangles):
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+    triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+
+    lowest = 1
+    highest = max(2, int(2*math.sqrt(len(triangles))))
+    for step in range(kDecimateSearchSteps):
+        if lowest >= highest:
+            break
+        resolution = (lowest + highest + 1)//2
+        (clusters, clusterCount) = getClusters(positions, resolution)
+        if len(getClusterTriangles(triangles, clusters)) <= targetTriangles:
+            lowest = resolution
+        else:
+            highest = resolution - 1
+
+    (clusters, clusterCount) = getClusters(positions, lowest)
+    (A, b) = getVertexQuadrics(positions, triangles)
+    clusterPositions = getClusterPositions(positions, clusters, clusterCount, A, b)
+    clusterTriangles = getClusterTriangles(triangles, clusters)
+
+    # Drop the clusters that no triangle uses any more
+    used = numpy.unique(clusterTriangles)
+    remap = numpy.zeros(clusterCount, dtype=numpy.int64)
+    remap[used] = numpy.arange(len(used))
+    return (clusterPositions[used], remap[clusterTriangles])
+
+#
+# Meshes exported at a triangle budget proportional to their area on screen.
+# Decimated meshes are written in object space and cached by the hash of the
+# mesh and the decimation ratio.
+#
+def getMeshArrays(shape):
+    positions = cmds.xform(shape + ".vtx[*]", query=True, objectSpace=True, translation=True)
+
+    selection = OpenMaya.MSelectionList()
+    selection.add(shape)
+    dagPath = OpenMaya.MDagPath()
+    selection.getDagPath(0, dagPath)
+    triangleCounts = OpenMaya.MIntArray()
+    triangleVertices = OpenMaya.MIntArray()
+    OpenMaya.MFnMesh(dagPath).getTriangles(triangleCounts, triangleVertices)
+    triangles = [triangleVertices[i] for i in range(triangleVertices.length())]
+
+    return (numpy.array(positions, dtype=numpy.float64).reshape(-1, 3),
+        numpy.array(triangles, dtype=numpy.int64).reshape(-1, 3))
+
+def hashMesh(positions, triangles):
+    meshHash = hashlib.sha1()
+    meshHash.update(positions.astype(numpy.float32).tobytes())
+    meshHash.update(triangles.astype(numpy.uint32).tobytes())
+    return meshHash.hexdigest()
+
+# Ratios are rounded up to a power of two so small camera moves reuse the
+# cached meshes
+def quantizeRatio(ratio):
+    if ratio <= 0.0:
+        return 0.0
+    return min(1.0, 2.0**math.ceil(math.log(ratio, 2)))
+
+class LevelOfDetail(object):
+    def __init__(self, cameraShape, trianglesPerPixel, cacheDir):
+        self.cameraShape = cameraShape
+        self.trianglesPerPixel = trianglesPerPixel
+        self.cacheDir = cacheDir
+        self.cameraPosition = getCameraPosition(cameraShape)
+        self.imageWidth = cmds.getAttr("defaultResolution.width")
+
+        self.orthographic = cmds.getAttr(cameraShape + ".orthographic")
+        if self.orthographic:
+            self.orthographicWidth = cmds.getAttr(cameraShape + ".orthographicWidth")
+        else:
+            fov = cmds.camera(cameraShape, query=True, horizontalFieldOfView=True)
+            self.tanX = math.tan(math.radians(fov)/2.0)
+
+        self.meshes = 0
+        self.cacheHits = 0
+        self.triangles = 0
+        self.decimatedTriangles = 0
+        self.warned = False
+
+    # Diameter, in pixels, of the mesh's world space bounding sphere
+    def getScreenSize(self, transform, shape):
+        matrix = cmds.getAttr(transform + ".worldMatrix")
+        corners = [MitsubaRendererCulling.transformPoint(matrix, corner)
+            for corner in MitsubaRendererCulling.getBoundingBoxCorners(shape)]
+        center = [sum([corner[axis] for corner in corners])/8.0 for axis in range(3)]
+        radius = max([math.sqrt(sum([(corner[axis] - center[axis])**2 for axis in range(3)]))
+            for corner in corners])
+
+        if self.orthographic:
+            return self.imageWidth*2.0*radius/self.orthographicWidth
+
+        distance = math.sqrt(sum([(center[axis] - self.cameraPosition[axis])**2 for axis in range(3)]))
+        if distance <= radius:
+            return float('inf')
+        return self.imageWidth*radius/(distance*self.tanX)
+
+    # Fraction of the mesh's triangles to keep
+    def getRatio(self, transform, shape, triangles):
+        screenSize = self.getScreenSize(transform, shape)
+        if screenSize == float('inf'):
+            return 1.0
+        area = math.pi*(screenSize/2.0)**2
+        targetTriangles = max(kLODMinimumTargetTriangles, self.trianglesPerPixel*area)
+        return quantizeRatio(targetTriangles/float(triangles))
+
+    # Writes the mesh decimated for its size on screen, and returns the file
+    # name. Returns None when the mesh should be exported at full detail.
+    def exportDecimated(self, transform):
+        shape = cmds.listRelatives(transform, children=True, shapes=True, fullPath=True)[0]
+        triangles = cmds.polyEvaluate(shape, triangle=True)
+        if triangles < kLODMinimumTriangles:
+            return None
+
+        ratio = self.getRatio(transform, shape, triangles)
+        if ratio >= 1.0:
+            return None
+
+        if numpy is None:
+            if not self.warned:
+                print( "Level of detail - NumPy isn't available. Meshes won't be decimated." )
+                self.warned = True
+            return None
+
+        (positions, meshTriangles) = getMeshArrays(shape)
+        key = hashlib.sha1(("%s %r" % (hashMesh(positions, meshTriangles), ratio)).encode('utf-8')).hexdigest()
+        filename = os.path.join(self.cacheDir, key + ".serialized")
+
+        self.meshes += 1
+        self.triangles += len(meshTriangles)
+        if os.path.exists(filename):
+            self.cacheHits += 1
+        else:
+            if not os.path.exists(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            (decimatedPositions, decimatedTriangles) = decimateMesh(positions, meshTriangles,
+                max(1, int(ratio*len(meshTriangles))))
+
+            # Normals are computed from the decimated mesh when it's loaded
+            name = transform.replace(':', '__').replace('|', '__')
+            with MitsubaRendererMesh.SerializedMeshWriter(filename, len(decimatedPositions),
+                len(decimatedTriangles), normals=False, uvs=False, name=name) as writer:
+                writer.addPositions(decimatedPositions.astype(numpy.float32).ravel().tolist())
+                writer.addTriangles(decimatedTriangles.astype(numpy.uint32).ravel().tolist())
+
+        self.decimatedTriangles += MitsubaRendererMesh.readSerializedHeader(filename)[3]
+        return filename
+
+    def formatDecimation(self):
+        return "Level of detail - meshes decimated : %d, cache hits : %d, triangles : %d -> %d" % (
+            self.meshes, self.cacheHits, self.triangles, self.decimatedTriangles)
@@ -0,0 +1,485 @@
+import array
+import os
+import shutil
+import struct
+import sys
+import zlib
+
+#
+# Compaction of the OBJ files written by Maya's exporter
+#
+
+# Parses a face vertex, 'v', 'v/vt', 'v//vn' or 'v/vt/vn', into 1-based,
+# positive indices, None for missing ones
+def parseFaceVertex(token, counts):
+    indices = [None, None, None]
+    for i, value in enumerate(token.split('/')[:3]):
+        if value:
+            index = int(value)
+            # Negative indices are relative to the elements defined so far
+            if index < 0:
+                index += counts[i] + 1
+            indices[i] = index
+    return indices
+
+def formatFaceVertex(position, uv, normal):
+    if normal is not None:
+        if uv is not None:
+            return "%d/%d/%d" % (position, uv, normal)
+        return "%d//%d" % (position, normal)
+    if uv is not None:
+        return "%d/%d" % (position, uv)
+    return "%d" % position
+
+# Maps each element, by its text, to a single index
+class WeldedElements(object):
+    def __init__(self):
+        self.elements = []
+        self.indices = {}
+        self.remap = [None]
+        self.count = 0
+
+    def add(self, values):
+        self.count += 1
+        index = self.indices.get(values)
+        if index is None:
+            self.elements.append(values)
+            index = len(self.elements)
+            self.indices[values] = index
+        self.remap.append(index)
+
+    def get(self, index):
+        if index is None:
+            return None
+        return self.remap[index]
+
+def readOBJ(filename):
+    positions = WeldedElements()
+    uvs = WeldedElements()
+    normals = WeldedElements()
+
+    # Faces and the group, smoothing and material lines around them, in order
+    statements = []
+    with open(filename, 'r') as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            keyword = tokens[0]
+            if keyword == 'v':
+                positions.add(tuple(tokens[1:]))
+            elif keyword == 'vt':
+                uvs.add(tuple(tokens[1:]))
+            elif keyword == 'vn':
+                normals.add(tuple(tokens[1:]))
+            elif keyword == 'f':
+                counts = (positions.count, uvs.count, normals.count)
+                face = [parseFaceVertex(x, counts) for x in tokens[1:]]
+                statements.append(('f', face))
+            elif keyword != '#':
+                statements.append((keyword, line.strip()))
+
+    return positions, uvs, normals, statements
+
+# A mesh is faceted if each face uses the same normal at all of its vertices.
+# Mitsuba's faceNormals option gives the same shading without the normals.
+def isFaceted(normals, statements):
+    faces = 0
+    for keyword, face in statements:
+        if keyword != 'f':
+            continue
+        faceNormals = set([normals.get(x[2]) for x in face])
+        if None in faceNormals or len(faceNormals) != 1:
+            return False
+        faces += 1
+    return faces > 0
+
+def compactOBJ(filename, keepUVs=True, keepNormals=True):
+    """
+    Rewrites an OBJ file with duplicate positions, uvs and normals welded,
+    without uvs if keepUVs is False and without the normals of faceted meshes.
+    Returns a dictionary of statistics. 'faceNormals' is True when the normals
+    were removed and the shape should use face normals.
+    """
+    bytesBefore = os.path.getsize(filename)
+    positions, uvs, normals, statements = readOBJ(filename)
+
+    writeUVs = keepUVs and uvs.elements
+    faceted = isFaceted(normals, statements)
+    writeNormals = normals.elements and keepNormals and not faceted
+
+    compactedName = filename + ".compact"
+    with open(compactedName, 'w') as f:
+        f.write(''.join(["v %s\n" % ' '.join(x) for x in positions.elements]))
+        if writeUVs:
+            f.write(''.join(["vt %s\n" % ' '.join(x) for x in uvs.elements]))
+        if writeNormals:
+            f.write(''.join(["vn %s\n" % ' '.join(x) for x in normals.elements]))
+
+        for keyword, statement in statements:
+            if keyword == 'f':
+                f.write("f %s\n" % ' '.join([formatFaceVertex(
+                    positions.get(position),
+                    uvs.get(uv) if writeUVs else None,
+                    normals.get(normal) if writeNormals else None)
+                    for (position, uv, normal) in statement]))
+            else:
+                f.write(statement + "\n")
+
+    os.remove(filename)
+    os.rename(compactedName, filename)
+    bytesAfter = os.path.getsize(filename)
+
+    return {
+        'bytesBefore' : bytesBefore,
+        'bytesAfter' : bytesAfter,
+        'positionsWelded' : positions.count - len(positions.elements),
+        'uvsWelded' : uvs.count - len(uvs.elements) if writeUVs else 0,
+        'normalsWelded' : normals.count - len(normals.elements) if writeNormals else 0,
+        'uvsRemoved' : bool(uvs.elements and not writeUVs),
+        'normalsRemoved' : bool(normals.elements and not writeNormals),
+        'faceNormals' : bool(faceted and not writeNormals),
+    }
+
+def formatCompaction(meshStatistics):
+    bytesBefore = sum([x['bytesBefore'] for x in meshStatistics])
+    bytesAfter = sum([x['bytesAfter'] for x in meshStatistics])
+    saved = bytesBefore - bytesAfter
+    lines = []
+    lines.append( "Mesh compaction - Meshes           : %d" % len(meshStatistics) )
+    lines.append( "Mesh compaction - Bytes saved      : %d of %d (%.1f%%)" % (
+        saved, bytesBefore, 100.0*saved/bytesBefore if bytesBefore else 0.0) )
+    lines.append( "Mesh compaction - Vertices welded  : %d" % sum(
+        [x['positionsWelded'] for x in meshStatistics]) )
+    lines.append( "Mesh compaction - UVs removed      : %d meshes" % len(
+        [x for x in meshStatistics if x['uvsRemoved']]) )
+    lines.append( "Mesh compaction - Normals removed  : %d meshes" % len(
+        [x for x in meshStatistics if x['normalsRemoved']]) )
+    return '\n'.join(lines)
+
+#
+# Streaming writer for Mitsuba's binary 'serialized' mesh format. Vertex data
+# and triangles are compressed as they're added, so memory use is bounded by
+# the size of the batches passed in, not the size of the mesh.
+#
+kSerializedHeader = 0x041C
+kSerializedVersion = 4
+
+kSerializedVertexNormals = 0x0001
+kSerializedTexCoords = 0x0002
+kSerializedFaceNormals = 0x0010
+kSerializedSinglePrecision = 0x1000
+
+kSerializedCompressionLevel = 6
+
+# Each mesh is a zlib stream. The header is written by hand and the data is
+# compressed as raw deflate, so that previously compressed data can be spliced in.
+kZlibHeader = b'\x78\x9c'
+kAdlerBase = 65521
+
+# Sections in the order they're stored
+kSerializedSections = ['positions', 'normals', 'uvs', 'triangles']
+
+# The sections shared by every frame of a deforming mesh
+kSerializedTopologySections = ['uvs', 'triangles']
+
+def littleEndianBytes(values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    try:
+        return values.tobytes()
+    except AttributeError:
+        return values.tostring()
+
+# The Adler-32 checksum of two pieces of data, from the checksums of each
+# piece and the length of the second. Port of zlib's adler32_combine.
+def adler32Combine(adler1, adler2, length2):
+    remainder = length2 % kAdlerBase
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % kAdlerBase
+    sum1 += (adler2 & 0xffff) + kAdlerBase - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + kAdlerBase - remainder
+    if sum1 >= kAdlerBase:
+        sum1 -= kAdlerBase
+    if sum1 >= kAdlerBase:
+        sum1 -= kAdlerBase
+    if sum2 >= (kAdlerBase << 1):
+        sum2 -= (kAdlerBase << 1)
+    if sum2 >= kAdlerBase:
+        sum2 -= kAdlerBase
+    return sum1 | (sum2 << 16)
+
+# The compressed uvs and triangles of a mesh, kept in a file of their own so
+# later frames with the same topology can splice them in without re-reading or
+# re-compressing them
+class SerializedTopology(object):
+    def __init__(self, filename, key=None):
+        self.filename = filename
+        self.key = key
+        self.adler = 1
+        self.length = 0
+        self.complete = False
+
+class SerializedMeshWriter(object):
+    def __init__(self, filename, vertexCount, triangleCount, 
+        normals=False, uvs=False, faceNormals=False, name="",
+        outFile=None, topology=None, recordTopology=False):
+        """
+        Writes a mesh to filename, or to outFile, an open file, when writing
+        into an archive of meshes. When topology holds complete, compressed
+        uvs and triangles, they're spliced in and the uvs and triangles
+        sections don't have to be written. With recordTopology, the uvs and
+        triangles that are written are also saved in topology.
+        """
+        if vertexCount > 0xFFFFFFFF:
+            raise ValueError("Serialized meshes are limited to 2^32 vertices : %s" % filename)
+
+        self.filename = filename
+        self.vertexCount = vertexCount
+        self.triangleCount = triangleCount
+
+        # Number of values expected in each section
+        self.expected = {
+            'positions' : vertexCount*3,
+            'normals' : vertexCount*3 if normals else 0,
+            'uvs' : vertexCount*2 if uvs else 0,
+            'triangles' : triangleCount*3,
+        }
+        self.written = dict([(x, 0) for x in kSerializedSections])
+        self.section = 0
+
+        self.topology = topology
+        self.spliceTopology = topology is not None and topology.complete
+        self.recordTopology = topology is not None and recordTopology and not self.spliceTopology
+        self.topologyFile = None
+
+        flags = kSerializedSinglePrecision
+        if normals:
+            flags |= kSerializedVertexNormals
+        if uvs:
+            flags |= kSerializedTexCoords
+        if faceNormals:
+            flags |= kSerializedFaceNormals
+
+        self.ownsFile = outFile is None
+        if self.ownsFile:
+            self.file = open(filename, 'wb')
+        else:
+            self.file = outFile
+        self.file.write(struct.pack('<HH', kSerializedHeader, kSerializedVersion))
+        self.file.write(kZlibHeader)
+        self.compressor = self.createCompressor()
+        self.adler = 1
+        self.length = 0
+
+        self.write(struct.pack('<I', flags))
+        self.write(name.encode('utf-8') + b'\0')
+        self.write(struct.pack('<QQ', vertexCount, triangleCount))
+
+    def createCompressor(self):
+        return zlib.compressobj(kSerializedCompressionLevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def write(self, data):
+        self.adler = zlib.adler32(data, self.adler) & 0xffffffff
+        self.length += len(data)
+        compressed = self.compressor.compress(data)
+        self.file.write(compressed)
+        if self.topologyFile:
+            self.topologyFile.write(compressed)
+
+    # Ends the deflate blocks of the vertex data so the topology can follow
+    # without refering back to it
+    def beginTopology(self):
+        self.file.write(self.compressor.flush(zlib.Z_FULL_FLUSH))
+        self.vertexAdler = self.adler
+        self.vertexLength = self.length
+
+        if self.spliceTopology:
+            with open(self.topology.filename, 'rb') as topologyFile:
+                shutil.copyfileobj(topologyFile, self.file)
+            self.adler = adler32Combine(self.adler, self.topology.adler, self.topology.length)
+            self.length += self.topology.length
+            for sectionName in kSerializedTopologySections:
+                self.written[sectionName] = self.expected[sectionName]
+        elif self.recordTopology:
+            self.compressor = self.createCompressor()
+            self.topologyFile = open(self.topology.filename, 'wb')
+            self.adler = 1
+            self.length = 0
+
+    def endTopology(self):
+        if self.recordTopology:
+            compressed = self.compressor.flush(zlib.Z_FULL_FLUSH)
+            self.file.write(compressed)
+            self.topologyFile.write(compressed)
+            self.topologyFile.close()
+            self.topologyFile = None
+
+            self.topology.adler = self.adler
+            self.topology.length = self.length
+            self.topology.complete = True
+            self.adler = adler32Combine(self.vertexAdler, self.adler, self.length)
+            self.length += self.vertexLength
+
+            # The topology ends on a full flush, the stream still needs its last block
+            self.compressor = self.createCompressor()
+        elif self.spliceTopology:
+            self.compressor = self.createCompressor()
+
+    # Sections have to be written in order, and completely
+    def beginSection(self, sectionName):
+        index = kSerializedSections.index(sectionName)
+        while self.section < index:
+            self.endSection(kSerializedSections[self.section])
+            self.section += 1
+            if kSerializedSections[self.section] == kSerializedTopologySections[0]:
+                self.beginTopology()
+        if self.section != index:
+            raise ValueError("Serialized mesh %s written after %s : %s" % (
+                sectionName, kSerializedSections[self.section], self.filename))
+
+    def endSection(self, sectionName):
+        if self.written[sectionName] != self.expected[sectionName]:
+            raise ValueError("Serialized mesh %s has %d values, expected %d : %s" % (
+                sectionName, self.written[sectionName], self.expected[sectionName], self.filename))
+
+    def addValues(self, sectionName, values):
+        if self.spliceTopology and sectionName in kSerializedTopologySections:
+            raise ValueError("Serialized mesh %s are spliced from the topology : %s" % (
+                sectionName, self.filename))
+        self.beginSection(sectionName)
+        self.written[sectionName] += len(values)
+        if self.written[sectionName] > self.expected[sectionName]:
+            raise ValueError("Serialized mesh has too many %s : %s" % (sectionName, self.filename))
+        self.write(littleEndianBytes(values))
+
+    # Batches are flat sequences of x, y, z or u, v values, and of triangle
+    # vertex indices
+    def addPositions(self, values):
+        self.addValues('positions', array.array('f', values))
+
+    def addNormals(self, values):
+        self.addValues('normals', array.array('f', values))
+
+    def addUVs(self, values):
+        self.addValues('uvs', array.array('f', values))
+
+    def addTriangles(self, indices):
+        self.addValues('triangles', array.array('I', indices))
+
+    def close(self):
+        try:
+            while self.section < len(kSerializedSections) - 1:
+                self.beginSection(kSerializedSections[self.section + 1])
+            self.endSection(kSerializedSections[self.section])
+            self.endTopology()
+
+            self.file.write(self.compressor.flush(zlib.Z_FINISH))
+            self.file.write(struct.pack('>I', self.adler))
+
+            # Dictionary of the offsets of the meshes in the file
+            if self.ownsFile:
+                self.file.write(struct.pack('<QI', 0, 1))
+        finally:
+            if self.ownsFile:
+                self.file.close()
+
+    def abort(self):
+        if self.topologyFile:
+            self.topologyFile.close()
+            os.remove(self.topology.filename)
+        if self.ownsFile:
+            self.file.close()
+            os.remove(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+#
+# A file holding several meshes, like the frames of an animation or the parts
+# of a mesh with several materials, selected in the scene with the serialized
+# shape's shapeIndex. Meshes are appended and the offset dictionary at the end
+# of the file is rewritten after each one.
+#
+class SerializedArchive(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.offsets = []
+        self.end = 0
+        self.topology = SerializedTopology(filename + ".topology")
+
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    # Returns a writer for the next mesh and its shape index. The writer
+    # reuses the archive's topology when topologyKey matches the last one.
+    def appendMesh(self, vertexCount, triangleCount, normals=False, uvs=False, 
+        faceNormals=False, name="", topologyKey=None):
+        if topologyKey is None or topologyKey != self.topology.key:
+            self.topology = SerializedTopology(self.topology.filename, topologyKey)
+
+        outFile = open(self.filename, 'r+b' if os.path.exists(self.filename) else 'wb')
+        outFile.seek(self.end)
+        writer = SerializedMeshWriter(self.filename, vertexCount, triangleCount, normals, uvs,
+            faceNormals, name, outFile=outFile, topology=self.topology, 
+            recordTopology=topologyKey is not None)
+        return SerializedArchiveMesh(self, writer, outFile), len(self.offsets)
+
+    def finishMesh(self, outFile):
+        self.offsets.append(self.end)
+        self.end = outFile.tell()
+        outFile.write(struct.pack('<%dQI' % len(self.offsets), *(self.offsets + [len(self.offsets)])))
+        outFile.truncate()
+
+    def remove(self):
+        for filename in [self.filename, self.topology.filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+class SerializedArchiveMesh(object):
+    def __init__(self, archive, writer, outFile):
+        self.archive = archive
+        self.writer = writer
+        self.outFile = outFile
+
+    def __enter__(self):
+        return self.writer
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if excType is None:
+                self.writer.close()
+                self.archive.finishMesh(self.outFile)
+            else:
+                self.writer.abort()
+                self.archive.topology = SerializedTopology(self.archive.topology.filename)
+        finally:
+            self.outFile.close()
+        return False
+
+# The flags, name, vertex and triangle counts of the first mesh in a file
+def readSerializedHeader(filename, headerBytes=4096):
+    with open(filename, 'rb') as f:
+        data = f.read(headerBytes)
+    (header, version) = struct.unpack('<HH', data[:4])
+    if header != kSerializedHeader:
+        raise ValueError("Not a serialized mesh : %s" % filename)
+
+    stream = zlib.decompressobj().decompress(data[4:])
+    (flags,) = struct.unpack('<I', stream[:4])
+    offset = 4
+    name = ""
+    if version >= 4:
+        nameEnd = stream.index(b'\0', offset)
+        name = stream[offset:nameEnd].decode('utf-8')
+        offset = nameEnd + 1
+    (vertexCount, triangleCount) = struct.unpack('<QQ', stream[offset:offset+16])
+    return (flags, name, vertexCount, triangleCount)
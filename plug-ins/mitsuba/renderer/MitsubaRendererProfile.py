@@ -0,0 +1,148 @@
+import cProfile
+import gc
+import os
+import pstats
+import sys
+
+kProfileFunctions = 20
+kProfileObjectTypes = 15
+
+# Types always listed in the memory report, as they make up the scene
+# element tree
+kProfileSceneTypes = ['SceneElement', 'dict', 'list']
+
+# Peak resident size of this process so far, in bytes, or None where the
+# resource module isn't available
+def getPeakMemory():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+# The objects tracked by the garbage collector, counted by type name
+def countObjects():
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def formatBytes(value):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(value) < 1024.0:
+            return "%.1f %s" % (value, unit)
+        value /= 1024.0
+    return "%.1f TB" % value
+
+#
+# Python profiles of a frame's export and render : cProfile statistics and,
+# optionally, the process's peak memory and the objects alive at the end of
+# the frame, by type
+#
+class RenderProfile(object):
+    def __init__(self, profileMemory=False):
+        self.profile = cProfile.Profile()
+        self.profileMemory = profileMemory
+        self.peakMemoryStart = None
+        self.peakMemory = None
+        self.objectsStart = None
+        self.objects = None
+
+    def __enter__(self):
+        if self.profileMemory:
+            self.peakMemoryStart = getPeakMemory()
+            self.objectsStart = countObjects()
+        self.profile.enable()
+        return self
+
+    # The scene element tree is still referenced by the caller here, so it's
+    # included in the object counts
+    def __exit__(self, excType, excValue, traceback):
+        self.profile.disable()
+        if self.profileMemory:
+            self.peakMemory = getPeakMemory()
+            self.objects = countObjects()
+        return False
+
+    def writeProfile(self, filename):
+        try:
+            self.profile.dump_stats(filename)
+        except (IOError, OSError):
+            print( "Unable to write render profile : %s" % filename )
+            return False
+        return True
+
+    def formatFunctions(self, count=kProfileFunctions):
+        try:
+            from StringIO import StringIO
+        except ImportError:
+            from io import StringIO
+
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(count)
+        return stream.getvalue()
+
+    def formatMemory(self, count=kProfileObjectTypes):
+        lines = []
+        if self.peakMemory is None:
+            lines.append( "Peak resident memory : unavailable" )
+        else:
+            lines.append( "Peak resident memory : %s, %s more than before the frame" % (
+                formatBytes(self.peakMemory), formatBytes(self.peakMemory - self.peakMemoryStart)) )
+        lines.append( "" )
+
+        changes = [(self.objects.get(name, 0) - self.objectsStart.get(name, 0), name) for name in self.objects]
+        names = kProfileSceneTypes + [name for (change, name) in sorted(changes, reverse=True)
+            if name not in kProfileSceneTypes][:count]
+        lines.append( "%-32s %12s %12s" % ("Objects by type", "Count", "Change") )
+        for name in names:
+            objectCount = self.objects.get(name, 0)
+            lines.append( "%-32s %12d %+12d" % (name, objectCount, objectCount - self.objectsStart.get(name, 0)) )
+        return '\n'.join(lines) + '\n'
+
+    def writeMemory(self, filename):
+        if self.objects is None:
+            return False
+        try:
+            with open(filename, 'w') as f:
+                f.write(self.formatMemory())
+        except (IOError, OSError):
+            print( "Unable to write memory report : %s" % filename )
+            return False
+        return True
+
+    # Written next to the frame's log
+    def write(self, logName):
+        prefix = os.path.splitext(logName)[0]
+
+        profileName = prefix + ".prof"
+        if self.writeProfile(profileName):
+            print( "Render profile : %s" % profileName )
+        print( self.formatFunctions() )
+
+        if self.objects is not None:
+            memoryName = prefix + ".memory.txt"
+            if self.writeMemory(memoryName):
+                print( "Render memory : %s" % memoryName )
+
+# Stands in for a profile when profiling is off
+class NullRenderProfile(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+    def write(self, logName):
+        pass
+
+def renderProfile(enabled, profileMemory=False):
+    if enabled:
+        return RenderProfile(profileMemory)
+    return NullRenderProfile()
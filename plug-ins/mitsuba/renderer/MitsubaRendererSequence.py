@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import maya.cmds as cmds
+
+import MitsubaRendererMesh
+
+#
+# Geometry shared by the frames of an animation
+#
+kStatic = "static"
+kRigid = "rigid"
+kDeforming = "deforming"
+
+# History node types that change a mesh's points over time
+kDeformingHistoryTypes = ["geometryFilter", "animCurve", "expression", "time"]
+
+def isDeforming(shape):
+    history = cmds.listHistory(shape, pruneDagObjects=True) or []
+    for node in history:
+        nodeTypes = cmds.nodeType(node, inherited=True) or []
+        for nodeType in kDeformingHistoryTypes:
+            if nodeType in nodeTypes:
+                return True
+    return False
+
+# Static meshes don't move, rigid meshes only move with their transforms and
+# deforming meshes change shape
+def classifyMotion(transform, frames):
+    shape = cmds.listRelatives(transform, children=True, shapes=True, fullPath=True)[0]
+    if isDeforming(shape):
+        return kDeforming
+
+    firstMatrix = None
+    for frame in frames:
+        matrix = cmds.getAttr(transform + ".worldMatrix", time=frame)
+        if firstMatrix is None:
+            firstMatrix = matrix
+        elif matrix != firstMatrix:
+            return kRigid
+    return kStatic
+
+# Static and rigid meshes are written once when rigidMeshes is set. Deforming
+# meshes are appended to an archive, one mesh per frame, when deformingMeshes is.
+class SequenceCache(object):
+    def __init__(self, cacheDir, frames, rigidMeshes=True, deformingMeshes=False):
+        self.cacheDir = cacheDir
+        self.frames = list(frames)
+        self.rigidMeshes = rigidMeshes
+        self.deformingMeshes = deformingMeshes
+        self.motion = {}
+        self.files = {}
+        self.archives = {}
+
+    def getMotion(self, transform):
+        if transform not in self.motion:
+            self.motion[transform] = classifyMotion(transform, self.frames)
+        return self.motion[transform]
+
+    def getFile(self, key):
+        filename = self.files.get(key)
+        if filename and os.path.exists(filename):
+            return filename
+        return None
+
+    def setFile(self, key, filename):
+        self.files[key] = filename
+
+    def getArchive(self, geom):
+        if geom not in self.archives:
+            name = geom.replace(':', '__').replace('|', '__')
+            self.archives[geom] = MitsubaRendererMesh.SerializedArchive(
+                os.path.join(self.getDirectory(), name + ".serialized"))
+        return self.archives[geom]
+
+    def getDirectory(self):
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        return self.cacheDir
+
+    def formatMotion(self):
+        counts = {}
+        for motion in self.motion.values():
+            counts[motion] = counts.get(motion, 0) + 1
+        return "Sequence geometry - static : %d, rigid : %d, deforming : %d" % (
+            counts.get(kStatic, 0), counts.get(kRigid, 0), counts.get(kDeforming, 0))
+
+    def cleanup(self):
+        if os.path.exists(self.cacheDir):
+            shutil.rmtree(self.cacheDir, ignore_errors=True)
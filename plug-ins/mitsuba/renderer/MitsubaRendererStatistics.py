@@ -0,0 +1,167 @@
+import json
+import os
+import time
+
+import chrometrace
+
+#
+# Per-stage export statistics : wall time, maya.cmds calls, scene elements
+# produced and bytes written
+#
+class ExportStage(object):
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.time = 0.0
+        self.cmdsCalls = 0
+        self.elements = 0
+        self.bytesWritten = 0
+
+    def addElements(self, elements):
+        self.elements += countElements(elements)
+
+    def addFile(self, filename):
+        try:
+            self.bytesWritten += os.path.getsize(filename)
+        except (IOError, OSError):
+            pass
+
+    def toDict(self):
+        return {
+            'name' : self.name,
+            'depth' : self.depth,
+            'calls' : self.calls,
+            'time' : self.time,
+            'cmdsCalls' : self.cmdsCalls,
+            'elements' : self.elements,
+            'bytesWritten' : self.bytesWritten,
+        }
+
+class ExportStageTimer(object):
+    def __init__(self, statistics, name):
+        self.statistics = statistics
+        self.name = name
+
+    def __enter__(self):
+        self.traceSpan = chrometrace.span(self.name, 'export')
+        self.traceSpan.__enter__()
+
+        statistics = self.statistics
+        self.stage = statistics.getStage(self.name, statistics.depth)
+        self.stage.calls += 1
+        statistics.depth += 1
+
+        self.cmdsCallsStart = statistics.cmdsCalls
+        self.start = time.time()
+        return self.stage
+
+    def __exit__(self, excType, excValue, traceback):
+        statistics = self.statistics
+        self.stage.time += time.time() - self.start
+        self.stage.cmdsCalls += statistics.cmdsCalls - self.cmdsCallsStart
+        statistics.depth -= 1
+
+        self.traceSpan.__exit__(excType, excValue, traceback)
+        return False
+
+# Still traces the stage when statistics are off
+class NullExportStage(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.traceSpan = chrometrace.span(self.name, 'export')
+        self.traceSpan.__enter__()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.traceSpan.__exit__(excType, excValue, traceback)
+        return False
+
+    def addElements(self, elements):
+        pass
+
+    def addFile(self, filename):
+        pass
+
+class ExportStatistics(object):
+    def __init__(self):
+        self.stages = []
+        self.depth = 0
+        self.cmdsCalls = 0
+        self.cmdsCallsByCommand = {}
+        self.cmdsModule = None
+        self.wrappedCommands = {}
+
+    def getStage(self, name, depth):
+        for stage in self.stages:
+            if stage.name == name and stage.depth == depth:
+                return stage
+        stage = ExportStage(name, depth)
+        self.stages.append(stage)
+        return stage
+
+    def stage(self, name):
+        return ExportStageTimer(self, name)
+
+    # Count calls by replacing the module's commands with counting wrappers
+    def countCommands(self, cmdsModule):
+        self.cmdsModule = cmdsModule
+        for name in dir(cmdsModule):
+            command = getattr(cmdsModule, name)
+            if name.startswith('_') or not callable(command) or isinstance(command, type):
+                continue
+            self.wrappedCommands[name] = command
+            setattr(cmdsModule, name, self.countingCommand(name, command))
+
+    def countingCommand(self, name, command):
+        def countedCommand(*args, **kwargs):
+            self.cmdsCalls += 1
+            self.cmdsCallsByCommand[name] = self.cmdsCallsByCommand.get(name, 0) + 1
+            return command(*args, **kwargs)
+        return countedCommand
+
+    def restoreCommands(self):
+        for name, command in self.wrappedCommands.items():
+            setattr(self.cmdsModule, name, command)
+        self.wrappedCommands = {}
+
+    def toDict(self):
+        return {
+            'stages' : [x.toDict() for x in self.stages],
+            'cmdsCalls' : self.cmdsCalls,
+            'cmdsCallsByCommand' : self.cmdsCallsByCommand,
+        }
+
+    def writeJSON(self, filename):
+        try:
+            with open(filename, 'w') as f:
+                json.dump(self.toDict(), f, indent=2, sort_keys=True)
+        except (IOError, OSError):
+            print( "Unable to write export statistics : %s" % filename )
+
+    def formatTable(self):
+        lines = []
+        lines.append( "%-32s %6s %10s %10s %9s %12s" % (
+            "Export Stage", "Calls", "Seconds", "cmds Calls", "Elements", "Bytes") )
+        for stage in self.stages:
+            lines.append( "%-32s %6d %10.3f %10d %9d %12d" % (
+                '  '*stage.depth + stage.name, stage.calls, stage.time,
+                stage.cmdsCalls, stage.elements, stage.bytesWritten) )
+        return '\n'.join(lines)
+
+def exportStage(statistics, name):
+    if statistics:
+        return statistics.stage(name)
+    return NullExportStage(name)
+
+def countElements(elements):
+    if elements in [None, {}]:
+        return 0
+    if isinstance(elements, list):
+        return sum([countElements(x) for x in elements])
+    return 1 + sum([countElements(x) for x in elements['children']])
+
+def getStatisticsFileName(logName):
+    return os.path.splitext(logName)[0] + ".export.json"
@@ -0,0 +1,167 @@
+import hashlib
+import os
+
+import maya.cmds as cmds
+import maya.OpenMaya as OpenMaya
+
+#
+# NURBS surfaces and meshes with smooth mesh preview are tessellated at their
+# render level before they're exported. The tessellated meshes are written in
+# object space and cached by a hash of their input and level.
+#
+kTessellateNurbs = "nurbs"
+kTessellateSmoothMesh = "smoothMesh"
+
+# Mesh attributes that change the smoothed result
+kSmoothMeshAttributes = ["smoothDrawType", "keepBorder", "keepHardEdge", "propagateEdgeHardness",
+    "smoothUVs", "boundaryRule", "continuity", "osdVertBoundary", "osdFvarBoundary",
+    "osdFvarPropagateCorners", "osdSmoothTriangles", "osdCreaseMethod"]
+
+def getShape(transform):
+    return cmds.listRelatives(transform, children=True, shapes=True, noIntermediate=True, fullPath=True)[0]
+
+def getDagPath(node):
+    selection = OpenMaya.MSelectionList()
+    selection.add(node)
+    dagPath = OpenMaya.MDagPath()
+    selection.getDagPath(0, dagPath)
+    return dagPath
+
+# The kind of tessellation a transform's shape needs and its level, or None
+def getTessellation(transform):
+    shape = getShape(transform)
+    nodeType = cmds.nodeType(shape)
+    if nodeType == "nurbsSurface":
+        return (kTessellateNurbs, (cmds.getAttr(shape + ".numberU"), cmds.getAttr(shape + ".numberV")))
+
+    if nodeType == "mesh" and cmds.getAttr(shape + ".displaySmoothMesh"):
+        if cmds.getAttr(shape + ".useSmoothPreviewForRender"):
+            level = cmds.getAttr(shape + ".smoothLevel")
+        else:
+            level = cmds.getAttr(shape + ".renderSmoothLevel")
+        if level > 0:
+            return (kTessellateSmoothMesh, level)
+
+    return None
+
+def hashArray(inputHash, values, length):
+    inputHash.update( repr([values[i] for i in range(length)]).encode('utf-8') )
+
+def hashMeshInput(shape):
+    inputHash = hashlib.sha1()
+    points = cmds.xform(shape + ".vtx[*]", query=True, objectSpace=True, translation=True)
+    inputHash.update( repr(points).encode('utf-8') )
+
+    mesh = OpenMaya.MFnMesh(getDagPath(shape))
+    counts = OpenMaya.MIntArray()
+    vertices = OpenMaya.MIntArray()
+    mesh.getVertices(counts, vertices)
+    hashArray(inputHash, counts, counts.length())
+    hashArray(inputHash, vertices, vertices.length())
+
+    us = OpenMaya.MFloatArray()
+    vs = OpenMaya.MFloatArray()
+    mesh.getUVs(us, vs)
+    hashArray(inputHash, us, us.length())
+    hashArray(inputHash, vs, vs.length())
+    uvCounts = OpenMaya.MIntArray()
+    uvIds = OpenMaya.MIntArray()
+    mesh.getAssignedUVs(uvCounts, uvIds)
+    hashArray(inputHash, uvIds, uvIds.length())
+
+    edges = OpenMaya.MUintArray()
+    creases = OpenMaya.MDoubleArray()
+    try:
+        mesh.getCreaseEdges(edges, creases)
+        hashArray(inputHash, edges, edges.length())
+        hashArray(inputHash, creases, creases.length())
+    except RuntimeError:
+        pass
+
+    for attribute in kSmoothMeshAttributes:
+        if cmds.attributeQuery(attribute, node=shape, exists=True):
+            inputHash.update( ("%s %r" % (attribute, cmds.getAttr(shape + "." + attribute))).encode('utf-8') )
+    return inputHash
+
+def hashNurbsInput(shape):
+    inputHash = hashlib.sha1()
+    inputHash.update( repr(cmds.getAttr(shape + ".cv[*]")).encode('utf-8') )
+
+    surface = OpenMaya.MFnNurbsSurface(getDagPath(shape))
+    knots = OpenMaya.MDoubleArray()
+    surface.getKnotsInU(knots)
+    hashArray(inputHash, knots, knots.length())
+    surface.getKnotsInV(knots)
+    hashArray(inputHash, knots, knots.length())
+
+    for attribute in ["degreeU", "degreeV", "formU", "formV"]:
+        inputHash.update( ("%s %r" % (attribute, cmds.getAttr(shape + "." + attribute))).encode('utf-8') )
+    return inputHash
+
+# Creates the tessellated mesh under a new transform and returns the transform
+def tessellate(shape, tessellation):
+    (kind, level) = tessellation
+    transform = cmds.createNode("transform", name="mitsubaTessellated#", skipSelect=True)
+    selection = OpenMaya.MSelectionList()
+    selection.add(transform)
+    parent = OpenMaya.MObject()
+    selection.getDependNode(0, parent)
+
+    if kind == kTessellateNurbs:
+        params = OpenMaya.MTesselationParams(OpenMaya.MTesselationParams.kGeneralFormat,
+            OpenMaya.MTesselationParams.kQuads)
+        params.setUIsoparmType(OpenMaya.MTesselationParams.kSpanEquiSpaced)
+        params.setVIsoparmType(OpenMaya.MTesselationParams.kSpanEquiSpaced)
+        params.setUNumber(level[0])
+        params.setVNumber(level[1])
+        OpenMaya.MFnNurbsSurface(getDagPath(shape)).tesselate(params, parent)
+    else:
+        mesh = OpenMaya.MFnMesh(getDagPath(shape))
+        options = OpenMaya.MMeshSmoothOptions()
+        mesh.getSmoothMeshDisplayOptions(options)
+        options.setDivisions(level)
+        mesh.generateSmoothMesh(parent, options)
+
+    return cmds.ls(transform, long=True)[0]
+
+class TessellationCache(object):
+    # exportGeometry writes a transform's mesh in object space to a directory,
+    # with uvs if asked to, and returns the file written
+    def __init__(self, cacheDir, exportGeometry):
+        self.cacheDir = cacheDir
+        self.exportGeometry = exportGeometry
+        self.tessellated = 0
+        self.cacheHits = 0
+
+    def getKey(self, shape, tessellation, uvs):
+        (kind, level) = tessellation
+        if kind == kTessellateNurbs:
+            inputHash = hashNurbsInput(shape)
+        else:
+            inputHash = hashMeshInput(shape)
+        inputHash.update( ("%s %r %r" % (kind, level, bool(uvs))).encode('utf-8') )
+        return inputHash.hexdigest()
+
+    # Returns the tessellated mesh's file, writing it if it isn't cached
+    def export(self, transform, tessellation, uvs=True):
+        shape = getShape(transform)
+        filename = os.path.join(self.cacheDir, self.getKey(shape, tessellation, uvs) + ".serialized")
+        if os.path.exists(filename):
+            self.cacheHits += 1
+            return filename
+
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        tessellated = tessellate(shape, tessellation)
+        try:
+            exported = self.exportGeometry(tessellated, self.cacheDir, uvs)
+            os.rename(exported, filename)
+        finally:
+            cmds.delete(tessellated)
+
+        self.tessellated += 1
+        return filename
+
+    def formatTessellation(self):
+        return "Tessellation - surfaces tessellated : %d, cache hits : %d" % (self.tessellated, self.cacheHits)
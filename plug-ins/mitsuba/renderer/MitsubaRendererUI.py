@@ -10,7 +10,7 @@ import maya.mel as mel
 
 ##################################################
 
-from MitsubaRenderer import createRenderSettingsNode, getRenderSettingsNode
+from MitsubaRenderer import createRenderSettingsNode, getRenderSettingsNode, estimateRender
 
 global renderSettings
 
@@ -1172,6 +1172,58 @@ def createRenderSettingsUI():
     cmds.setParent('..')
     cmds.setParent('..')
 
+    # Progressive rendering controls
+    cmds.frameLayout(label='Progressive', collapsable=True, collapse=True)
+    cmds.columnLayout(adjustableColumn=True)
+
+    existingProgressive = cmds.getAttr( "%s.%s" % (renderSettings, "progressive"))
+    cmds.checkBox(label="Progressive", value=existingProgressive,
+        changeCommand=lambda (x): getCheckBox(None, "progressive", x))
+
+    existingProgressiveInitialSampleCount = cmds.getAttr( "%s.%s" % (renderSettings, "progressiveInitialSampleCount"))
+    changeProgressiveInitialSampleCount = lambda (x): getIntFieldGroup(None, "progressiveInitialSampleCount", x)
+    progressiveInitialSampleCountGroup = cmds.intFieldGrp(numberOfFields=1, label="First pass sampleCount", value1=existingProgressiveInitialSampleCount)
+    cmds.intFieldGrp(progressiveInitialSampleCountGroup, edit=1, changeCommand=changeProgressiveInitialSampleCount)    
+
+    existingProgressiveTimeBudget = cmds.getAttr( "%s.%s" % (renderSettings, "progressiveTimeBudget"))
+    changeProgressiveTimeBudget = lambda (x): getFloatFieldGroup(None, "progressiveTimeBudget", x)
+    progressiveTimeBudgetGroup = cmds.floatFieldGrp(numberOfFields=1, label="Time budget (seconds)", value1=existingProgressiveTimeBudget)
+    cmds.floatFieldGrp(progressiveTimeBudgetGroup, edit=1, changeCommand=changeProgressiveTimeBudget)    
+
+    cmds.setParent('..')
+    cmds.setParent('..')
+
+    # Adaptive sampling controls
+    cmds.frameLayout(label='Adaptive Sampling', collapsable=True, collapse=True)
+    cmds.columnLayout(adjustableColumn=True)
+
+    existingAdaptiveSampling = cmds.getAttr( "%s.%s" % (renderSettings, "adaptiveSampling"))
+    cmds.checkBox(label="Adaptive sampleCount per frame", value=existingAdaptiveSampling,
+        changeCommand=lambda (x): getCheckBox(None, "adaptiveSampling", x))
+
+    existingAdaptiveSamplingPilotSampleCount = cmds.getAttr( "%s.%s" % (renderSettings, "adaptiveSamplingPilotSampleCount"))
+    changeAdaptiveSamplingPilotSampleCount = lambda (x): getIntFieldGroup(None, "adaptiveSamplingPilotSampleCount", x)
+    adaptiveSamplingPilotSampleCountGroup = cmds.intFieldGrp(numberOfFields=1, label="Pilot sampleCount", value1=existingAdaptiveSamplingPilotSampleCount)
+    cmds.intFieldGrp(adaptiveSamplingPilotSampleCountGroup, edit=1, changeCommand=changeAdaptiveSamplingPilotSampleCount)    
+
+    existingAdaptiveSamplingTargetNoise = cmds.getAttr( "%s.%s" % (renderSettings, "adaptiveSamplingTargetNoise"))
+    changeAdaptiveSamplingTargetNoise = lambda (x): getFloatFieldGroup(None, "adaptiveSamplingTargetNoise", x)
+    adaptiveSamplingTargetNoiseGroup = cmds.floatFieldGrp(numberOfFields=1, label="Target noise", value1=existingAdaptiveSamplingTargetNoise)
+    cmds.floatFieldGrp(adaptiveSamplingTargetNoiseGroup, edit=1, changeCommand=changeAdaptiveSamplingTargetNoise)    
+
+    existingAdaptiveSamplingMinSampleCount = cmds.getAttr( "%s.%s" % (renderSettings, "adaptiveSamplingMinSampleCount"))
+    changeAdaptiveSamplingMinSampleCount = lambda (x): getIntFieldGroup(None, "adaptiveSamplingMinSampleCount", x)
+    adaptiveSamplingMinSampleCountGroup = cmds.intFieldGrp(numberOfFields=1, label="Minimum sampleCount", value1=existingAdaptiveSamplingMinSampleCount)
+    cmds.intFieldGrp(adaptiveSamplingMinSampleCountGroup, edit=1, changeCommand=changeAdaptiveSamplingMinSampleCount)    
+
+    existingAdaptiveSamplingMaxSampleCount = cmds.getAttr( "%s.%s" % (renderSettings, "adaptiveSamplingMaxSampleCount"))
+    changeAdaptiveSamplingMaxSampleCount = lambda (x): getIntFieldGroup(None, "adaptiveSamplingMaxSampleCount", x)
+    adaptiveSamplingMaxSampleCountGroup = cmds.intFieldGrp(numberOfFields=1, label="Maximum sampleCount", value1=existingAdaptiveSamplingMaxSampleCount)
+    cmds.intFieldGrp(adaptiveSamplingMaxSampleCountGroup, edit=1, changeCommand=changeAdaptiveSamplingMaxSampleCount)    
+
+    cmds.setParent('..')
+    cmds.setParent('..')
+
     # Film controls
     cmds.frameLayout(label='Film', collapsable=True, collapse=True)
     cmds.columnLayout(adjustableColumn=True)
@@ -1335,6 +1387,143 @@ def createRenderSettingsUI():
     blockSizeGroup = cmds.intFieldGrp(numberOfFields=1, label="Block size", value1=existingBlockSize)
     cmds.intFieldGrp(blockSizeGroup, edit=1, changeCommand=changeBlockSize)    
 
+    existingRegionComposite = cmds.getAttr( "%s.%s" % (renderSettings, "regionComposite"))
+    regionComposite = cmds.checkBox(label="Composite render regions into last full frame", value=existingRegionComposite)
+    cmds.checkBox(regionComposite, edit=1,
+        changeCommand=lambda (x): getCheckBox(regionComposite, "regionComposite", x))
+
+    existingRenderEstimate = cmds.getAttr( "%s.%s" % (renderSettings, "renderEstimate"))
+    renderEstimate = cmds.checkBox(label="Estimate render time and memory", value=existingRenderEstimate)
+    cmds.checkBox(renderEstimate, edit=1,
+        changeCommand=lambda (x): getCheckBox(renderEstimate, "renderEstimate", x))
+
+    cmds.button(label="Estimate Render", command=showRenderEstimate)
+
+    existingExportStatistics = cmds.getAttr( "%s.%s" % (renderSettings, "exportStatistics"))
+    exportStatistics = cmds.checkBox(label="Export statistics", value=existingExportStatistics)
+    cmds.checkBox(exportStatistics, edit=1,
+        changeCommand=lambda (x): getCheckBox(exportStatistics, "exportStatistics", x))
+
+    existingRenderTrace = cmds.getAttr( "%s.%s" % (renderSettings, "renderTrace"))
+    renderTrace = cmds.checkBox(label="Write render trace", value=existingRenderTrace)
+    cmds.checkBox(renderTrace, edit=1,
+        changeCommand=lambda (x): getCheckBox(renderTrace, "renderTrace", x))
+
+    existingRenderProfile = cmds.getAttr( "%s.%s" % (renderSettings, "renderProfile"))
+    renderProfile = cmds.checkBox(label="Profile export and render", value=existingRenderProfile)
+    cmds.checkBox(renderProfile, edit=1,
+        changeCommand=lambda (x): getCheckBox(renderProfile, "renderProfile", x))
+
+    existingRenderProfileMemory = cmds.getAttr( "%s.%s" % (renderSettings, "renderProfileMemory"))
+    renderProfileMemory = cmds.checkBox(label="Profile memory", value=existingRenderProfileMemory)
+    cmds.checkBox(renderProfileMemory, edit=1,
+        changeCommand=lambda (x): getCheckBox(renderProfileMemory, "renderProfileMemory", x))
+
+    existingRenderCache = cmds.getAttr( "%s.%s" % (renderSettings, "renderCache"))
+    renderCache = cmds.checkBox(label="Cache renders", value=existingRenderCache)
+    cmds.checkBox(renderCache, edit=1,
+        changeCommand=lambda (x): getCheckBox(renderCache, "renderCache", x))
+
+    existingRenderCacheSize = cmds.getAttr( "%s.%s" % (renderSettings, "renderCacheSize"))
+    changeRenderCacheSize = lambda (x): getIntFieldGroup(None, "renderCacheSize", x)
+    renderCacheSizeGroup = cmds.intFieldGrp(numberOfFields=1, label="Render cache size (MB)", value1=existingRenderCacheSize)
+    cmds.intFieldGrp(renderCacheSizeGroup, edit=1, changeCommand=changeRenderCacheSize)
+
+    existingCompactMeshes = cmds.getAttr( "%s.%s" % (renderSettings, "compactMeshes"))
+    compactMeshes = cmds.checkBox(label="Compact exported meshes", value=existingCompactMeshes)
+    cmds.checkBox(compactMeshes, edit=1,
+        changeCommand=lambda (x): getCheckBox(compactMeshes, "compactMeshes", x))
+
+    existingBinaryMeshes = cmds.getAttr( "%s.%s" % (renderSettings, "binaryMeshes"))
+    binaryMeshes = cmds.checkBox(label="Export binary meshes", value=existingBinaryMeshes)
+    cmds.checkBox(binaryMeshes, edit=1,
+        changeCommand=lambda (x): getCheckBox(binaryMeshes, "binaryMeshes", x))
+
+    existingCacheRigidMeshes = cmds.getAttr( "%s.%s" % (renderSettings, "cacheRigidMeshes"))
+    cacheRigidMeshes = cmds.checkBox(label="Export rigid meshes once per animation", value=existingCacheRigidMeshes)
+    cmds.checkBox(cacheRigidMeshes, edit=1,
+        changeCommand=lambda (x): getCheckBox(cacheRigidMeshes, "cacheRigidMeshes", x))
+
+    existingArchiveDeformingMeshes = cmds.getAttr( "%s.%s" % (renderSettings, "archiveDeformingMeshes"))
+    archiveDeformingMeshes = cmds.checkBox(label="Archive deforming meshes per animation", value=existingArchiveDeformingMeshes)
+    cmds.checkBox(archiveDeformingMeshes, edit=1,
+        changeCommand=lambda (x): getCheckBox(archiveDeformingMeshes, "archiveDeformingMeshes", x))
+
+    existingCullGeometry = cmds.getAttr( "%s.%s" % (renderSettings, "cullGeometry"))
+    cullGeometry = cmds.checkBox(label="Cull geometry outside the camera view", value=existingCullGeometry)
+    cmds.checkBox(cullGeometry, edit=1,
+        changeCommand=lambda (x): getCheckBox(cullGeometry, "cullGeometry", x))
+
+    existingCullMargin = cmds.getAttr( "%s.%s" % (renderSettings, "cullMargin"))
+    changeCullMargin = lambda (x): getFloatFieldGroup(None, "cullMargin", x)
+    cullMarginGroup = cmds.floatFieldGrp(numberOfFields=1, label="Culling view margin", value1=existingCullMargin)
+    cmds.floatFieldGrp(cullMarginGroup, edit=1, changeCommand=changeCullMargin)    
+
+    existingCullGIDistance = cmds.getAttr( "%s.%s" % (renderSettings, "cullGIDistance"))
+    changeCullGIDistance = lambda (x): getFloatFieldGroup(None, "cullGIDistance", x)
+    cullGIDistanceGroup = cmds.floatFieldGrp(numberOfFields=1, label="Culling GI distance", value1=existingCullGIDistance)
+    cmds.floatFieldGrp(cullGIDistanceGroup, edit=1, changeCommand=changeCullGIDistance)    
+
+    existingCullDistance = cmds.getAttr( "%s.%s" % (renderSettings, "cullDistance"))
+    changeCullDistance = lambda (x): getFloatFieldGroup(None, "cullDistance", x)
+    cullDistanceGroup = cmds.floatFieldGrp(numberOfFields=1, label="Culling distance", value1=existingCullDistance)
+    cmds.floatFieldGrp(cullDistanceGroup, edit=1, changeCommand=changeCullDistance)    
+
+    existingLevelOfDetail = cmds.getAttr( "%s.%s" % (renderSettings, "levelOfDetail"))
+    levelOfDetail = cmds.checkBox(label="Level of detail from screen size", value=existingLevelOfDetail)
+    cmds.checkBox(levelOfDetail, edit=1,
+        changeCommand=lambda (x): getCheckBox(levelOfDetail, "levelOfDetail", x))
+
+    existingLODTrianglesPerPixel = cmds.getAttr( "%s.%s" % (renderSettings, "lodTrianglesPerPixel"))
+    changeLODTrianglesPerPixel = lambda (x): getFloatFieldGroup(None, "lodTrianglesPerPixel", x)
+    lodTrianglesPerPixelGroup = cmds.floatFieldGrp(numberOfFields=1, label="Triangles per pixel", value1=existingLODTrianglesPerPixel)
+    cmds.floatFieldGrp(lodTrianglesPerPixelGroup, edit=1, changeCommand=changeLODTrianglesPerPixel)    
+
+    existingMergeSmallMeshes = cmds.getAttr( "%s.%s" % (renderSettings, "mergeSmallMeshes"))
+    mergeSmallMeshes = cmds.checkBox(label="Merge small meshes sharing materials", value=existingMergeSmallMeshes)
+    cmds.checkBox(mergeSmallMeshes, edit=1,
+        changeCommand=lambda (x): getCheckBox(mergeSmallMeshes, "mergeSmallMeshes", x))
+
+    existingMergeMeshTriangles = cmds.getAttr( "%s.%s" % (renderSettings, "mergeMeshTriangles"))
+    changeMergeMeshTriangles = lambda (x): getIntFieldGroup(None, "mergeMeshTriangles", x)
+    mergeMeshTrianglesGroup = cmds.intFieldGrp(numberOfFields=1, label="Merged mesh triangles", value1=existingMergeMeshTriangles)
+    cmds.intFieldGrp(mergeMeshTrianglesGroup, edit=1, changeCommand=changeMergeMeshTriangles)
+
+    existingExportCurves = cmds.getAttr( "%s.%s" % (renderSettings, "exportCurves"))
+    exportCurves = cmds.checkBox(label="Export curves as hair", value=existingExportCurves)
+    cmds.checkBox(exportCurves, edit=1,
+        changeCommand=lambda (x): getCheckBox(exportCurves, "exportCurves", x))
+
+    existingHairRadius = cmds.getAttr( "%s.%s" % (renderSettings, "hairRadius"))
+    changeHairRadius = lambda (x): getFloatFieldGroup(None, "hairRadius", x)
+    hairRadiusGroup = cmds.floatFieldGrp(numberOfFields=1, label="Hair radius", value1=existingHairRadius)
+    cmds.floatFieldGrp(hairRadiusGroup, edit=1, changeCommand=changeHairRadius)    
+
+    existingHairSubdivisions = cmds.getAttr( "%s.%s" % (renderSettings, "hairSubdivisions"))
+    changeHairSubdivisions = lambda (x): getIntFieldGroup(None, "hairSubdivisions", x)
+    hairSubdivisionsGroup = cmds.intFieldGrp(numberOfFields=1, label="Hair span subdivisions", value1=existingHairSubdivisions)
+    cmds.intFieldGrp(hairSubdivisionsGroup, edit=1, changeCommand=changeHairSubdivisions)
+
+    existingTessellateSurfaces = cmds.getAttr( "%s.%s" % (renderSettings, "tessellateSurfaces"))
+    tessellateSurfaces = cmds.checkBox(label="Tessellate NURBS and smooth preview meshes", value=existingTessellateSurfaces)
+    cmds.checkBox(tessellateSurfaces, edit=1,
+        changeCommand=lambda (x): getCheckBox(tessellateSurfaces, "tessellateSurfaces", x))
+
+    existingExportFluids = cmds.getAttr( "%s.%s" % (renderSettings, "exportFluids"))
+    exportFluids = cmds.checkBox(label="Export fluids", value=existingExportFluids)
+    cmds.checkBox(exportFluids, edit=1,
+        changeCommand=lambda (x): getCheckBox(exportFluids, "exportFluids", x))
+
+    existingCropVolumes = cmds.getAttr( "%s.%s" % (renderSettings, "cropVolumes"))
+    cropVolumes = cmds.checkBox(label="Crop volumes to their density", value=existingCropVolumes)
+    cmds.checkBox(cropVolumes, edit=1,
+        changeCommand=lambda (x): getCheckBox(cropVolumes, "cropVolumes", x))
+
+    existingVolumeVoxelSize = cmds.getAttr( "%s.%s" % (renderSettings, "volumeVoxelSize"))
+    changeVolumeVoxelSize = lambda (x): getFloatFieldGroup(None, "volumeVoxelSize", x)
+    volumeVoxelSizeGroup = cmds.floatFieldGrp(numberOfFields=1, label="Volume voxel size", value1=existingVolumeVoxelSize)
+    cmds.floatFieldGrp(volumeVoxelSizeGroup, edit=1, changeCommand=changeVolumeVoxelSize)
+
     cmds.setParent('..')
     cmds.setParent('..')
 
@@ -1390,6 +1579,10 @@ def showRenderWindow(filename):
     cmds.showWindow(renderWindow)
     cmds.renderWindowEditor()
 
+def showRenderEstimate(self):
+    estimateText = estimateRender()
+    cmds.confirmDialog(title="Mitsuba Render Estimate", message=estimateText, button=["OK"])
+
 #Mel command to render with Mitsuba
 def callMitsuba(self):
     cmds.mitsuba()
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import threading
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyopenvdb as openvdb
+except ImportError:
+    openvdb = None
+
+from MitsubaRendererCache import hashFile
+import MitsubaRendererVolume
+
+#
+# OpenVDB files, converted to Mitsuba grid volumes. The conversion covers the
+# grid's active voxels, and a voxel of background on each side. The grid is
+# loaded whole by OpenVDB, and copied out to the volume file a slab at a time.
+# Grids are assumed to be axis aligned, as Mitsuba's grids are.
+#
+
+# Bump when the conversion changes, so earlier conversions aren't reused
+kVDBConversionVersion = 1
+
+# The grids read for each volume parameter, in order of preference. Files with
+# a single grid use it whatever its name.
+kVDBGridNames = {
+    'density' : ['density'],
+    'albedo' : ['albedo', 'Cd', 'color'],
+}
+
+# The channels of the grid volume written for each volume parameter
+kVDBChannels = {
+    'density' : 1,
+    'albedo' : 3,
+}
+
+def isVDBFile(filename):
+    return filename.lower().endswith(".vdb")
+
+def getGridName(filename, parameter):
+    gridNames = [grid.name for grid in openvdb.readAllGridMetadata(filename)]
+    for gridName in kVDBGridNames.get(parameter, []):
+        if gridName in gridNames:
+            return gridName
+    if len(gridNames) == 1:
+        return gridNames[0]
+    raise ValueError("No %s grid in %s, grids : %s" % (parameter, filename, ", ".join(gridNames)))
+
+def convertVDB(filename, volumeFilename, gridName, channels):
+    grid = openvdb.read(filename, gridName)
+    vector = grid.valueTypeName.startswith("vec3")
+    if vector and channels != 3:
+        raise ValueError("Grid %s in %s holds vectors, not values" % (gridName, filename))
+
+    if grid.empty():
+        bounds = ((0, 0, 0), (0, 0, 0))
+    else:
+        bounds = grid.evalActiveVoxelBoundingBox()
+    low = [x - 1 for x in bounds[0]]
+    high = [x + 1 for x in bounds[1]]
+    resolution = [high[axis] - low[axis] + 1 for axis in range(3)]
+
+    corners = [grid.transform.indexToWorld(tuple(low)), grid.transform.indexToWorld(tuple(high))]
+    bbox = ([min(corners[0][axis], corners[1][axis]) for axis in range(3)] +
+        [max(corners[0][axis], corners[1][axis]) for axis in range(3)])
+
+    with open(volumeFilename, 'wb') as volumeFile:
+        volumeFile.write(MitsubaRendererVolume.packVolumeHeader(resolution, channels, bbox))
+
+        # OpenVDB arrays are indexed by x, y, z, and Mitsuba's by z, y, x
+        for z in range(low[2], high[2] + 1, MitsubaRendererVolume.kVolumeSlabDepth):
+            depth = min(MitsubaRendererVolume.kVolumeSlabDepth, high[2] + 1 - z)
+            shape = (resolution[0], resolution[1], depth)
+            if vector:
+                shape += (3,)
+            slab = numpy.zeros(shape, dtype=numpy.float32)
+            grid.copyToArray(slab, ijk=(low[0], low[1], z))
+
+            if vector:
+                slab = slab.transpose(2, 1, 0, 3)
+            else:
+                slab = slab.transpose(2, 1, 0)[..., numpy.newaxis]
+            if slab.shape[3] != channels:
+                slab = numpy.repeat(slab, channels, axis=3)
+            numpy.ascontiguousarray(slab, dtype='<f4').tofile(volumeFile)
+
+    return volumeFilename
+
+# Converts OpenVDB files on a worker thread, while the rest of the scene is
+# exported. Conversions are named after the content of the file, the grid and
+# the channels, so a sequence is converted once and reused by later renders.
+class VDBConverter(object):
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.requests = Queue()
+        self.results = {}
+        self.thread = None
+        self.converted = 0
+        self.cacheHits = 0
+        self.failures = []
+
+    def isAvailable(self):
+        return bool(openvdb and numpy)
+
+    def submit(self, filename, parameter):
+        request = (filename, parameter)
+        if request in self.results:
+            return
+        self.results[request] = filename
+
+        if not self.thread:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        self.requests.put(request)
+
+    # Once the files are submitted, the worker stops after converting them.
+    # Files submitted later start another worker.
+    def close(self):
+        if self.thread:
+            self.requests.put(None)
+            self.thread = None
+
+    # Any failure is recorded and the worker moves on, as a request that's
+    # never marked done would leave getResult waiting forever
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                self.requests.task_done()
+                return
+
+            (filename, parameter) = request
+            try:
+                self.results[(filename, parameter)] = self.convert(filename, parameter)
+            except Exception as e:
+                self.failures.append( "%s : %s %s" % (filename, type(e).__name__, e) )
+            finally:
+                self.requests.task_done()
+
+    def convert(self, filename, parameter):
+        gridName = getGridName(filename, parameter)
+        channels = kVDBChannels.get(parameter, 1)
+
+        key = hashlib.sha1()
+        key.update( ("%s %s %d %d" % (hashFile(filename), gridName, channels,
+            kVDBConversionVersion)).encode('utf-8') )
+        volumeFilename = os.path.join(self.cacheDir, key.hexdigest() + ".vol")
+        if os.path.exists(volumeFilename):
+            self.cacheHits += 1
+            return volumeFilename
+
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        partialFilename = volumeFilename + ".partial"
+        try:
+            convertVDB(filename, partialFilename, gridName, channels)
+            os.rename(partialFilename, volumeFilename)
+        except Exception:
+            if os.path.exists(partialFilename):
+                os.remove(partialFilename)
+            raise
+        self.converted += 1
+        return volumeFilename
+
+    # Waits for the submitted files to be converted. Files that couldn't be
+    # converted are returned as they are.
+    def getResult(self, filename, parameter):
+        self.requests.join()
+        return self.results[(filename, parameter)]
+
+    def formatReport(self):
+        report = "OpenVDB - files converted : %d, cache hits : %d, failures : %d" % (
+            self.converted, self.cacheHits, len(self.failures))
+        for failure in self.failures:
+            report += "\n\t" + failure
+        return report
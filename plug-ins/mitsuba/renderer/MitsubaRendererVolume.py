@@ -0,0 +1,210 @@
+import hashlib
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from MitsubaRendererCache import hashFile
+
+#
+# Mitsuba's binary grid volume format : 'VOL', version 3, the encoding, the
+# resolution, the number of channels and the bounding box, then the voxels as
+# little endian floats. x varies fastest, then y, then z, with the channels of
+# each voxel together.
+#
+kVolumeHeaderFormat = '<3sBiiiii6f'
+kVolumeHeaderSize = struct.calcsize(kVolumeHeaderFormat)
+kVolumeVersion = 3
+kVolumeEncodingFloat32 = 1
+
+# Slices of a grid read at a time while it's scanned or resampled
+kVolumeSlabDepth = 16
+
+# bbox is the minimum x, y, z then the maximum x, y, z
+def packVolumeHeader(resolution, channels, bbox):
+    return struct.pack(kVolumeHeaderFormat, b"VOL", kVolumeVersion, kVolumeEncodingFloat32,
+        resolution[0], resolution[1], resolution[2], channels, *bbox)
+
+def packVoxels(values):
+    if numpy:
+        return numpy.asarray(values, dtype='<f4').tobytes()
+    return struct.pack('<%df' % len(values), *values)
+
+def writeVolume(filename, resolution, channels, bbox, voxels):
+    with open(filename, 'wb') as volumeFile:
+        volumeFile.write(packVolumeHeader(resolution, channels, bbox))
+        volumeFile.write(voxels)
+    return filename
+
+# The resolution, channels and bounding box of a volume file, or None for
+# files in other versions or encodings
+def readVolumeHeader(filename):
+    with open(filename, 'rb') as volumeFile:
+        header = volumeFile.read(kVolumeHeaderSize)
+    if len(header) < kVolumeHeaderSize:
+        return None
+
+    values = struct.unpack(kVolumeHeaderFormat, header)
+    if values[0] != b"VOL" or values[1] != kVolumeVersion or values[2] != kVolumeEncodingFloat32:
+        return None
+    return (tuple(values[3:6]), values[6], tuple(values[7:13]))
+
+# The voxels of a volume file, memory mapped and indexed by z, y, x, channel
+def mapVolume(filename, resolution, channels, mode='r'):
+    return numpy.memmap(filename, dtype='<f4', mode=mode, offset=kVolumeHeaderSize,
+        shape=(resolution[2], resolution[1], resolution[0], channels))
+
+#
+# Sparse bounding and resampling. Mitsuba places the first and last voxels on
+# each axis at the faces of the bounding box, so voxel i of n is at
+# min + i*(max - min)/(n - 1).
+#
+
+# The start and end indices on the x, y and z axes of the voxels that aren't
+# zero, with a voxel of zeros on either side so interpolation still falls off
+# to zero at the edges. None for grids that are all zeros.
+def getOccupiedRanges(grid):
+    (zres, yres, xres) = grid.shape[:3]
+    occupied = [numpy.zeros(xres, dtype=bool), numpy.zeros(yres, dtype=bool), numpy.zeros(zres, dtype=bool)]
+    for z in range(0, zres, kVolumeSlabDepth):
+        slab = numpy.any(grid[z:z + kVolumeSlabDepth] != 0, axis=3)
+        occupied[0] |= slab.any(axis=(0, 1))
+        occupied[1] |= slab.any(axis=(0, 2))
+        occupied[2][z:z + kVolumeSlabDepth] = slab.any(axis=(1, 2))
+
+    if not occupied[2].any():
+        return None
+
+    ranges = []
+    for axisOccupied in occupied:
+        indices = numpy.nonzero(axisOccupied)[0]
+        ranges.append( (max(int(indices[0]) - 1, 0), min(int(indices[-1]) + 2, len(axisOccupied))) )
+    return ranges
+
+# Averages blocks of voxels, factors voxels on a side along x, y and z. The
+# block is padded with its edge voxels to a multiple of the factors.
+def downsampleBlock(block, factors):
+    (kx, ky, kz) = factors
+    padding = [(0, -block.shape[0] % kz), (0, -block.shape[1] % ky), (0, -block.shape[2] % kx), (0, 0)]
+    if any([after for (before, after) in padding]):
+        block = numpy.pad(block, padding, mode='edge')
+    (zres, yres, xres, channels) = block.shape
+    return block.reshape(zres//kz, kz, yres//ky, ky, xres//kx, kx, channels).mean(axis=(1, 3, 5))
+
+# Writes a volume file cropped to its non-zero voxels, when crop is set, and
+# averaged down to voxels of about voxelSize, when it's set. Returns the
+# resolutions before and after, or None when the grid wouldn't change.
+def resampleVolume(filename, resampledFilename, crop=False, voxelSize=0.0):
+    header = readVolumeHeader(filename)
+    if not header:
+        return None
+    (resolution, channels, bbox) = header
+
+    grid = mapVolume(filename, resolution, channels)
+    ranges = [(0, resolution[axis]) for axis in range(3)]
+    if crop:
+        ranges = getOccupiedRanges(grid) or ranges
+
+    steps = []
+    factors = []
+    for axis in range(3):
+        step = 0.0
+        if resolution[axis] > 1:
+            step = (bbox[axis + 3] - bbox[axis])/(resolution[axis] - 1)
+        steps.append(step)
+
+        # At least two voxels are kept on each axis, so the bounding box isn't
+        # flat
+        factor = 1
+        size = ranges[axis][1] - ranges[axis][0]
+        if voxelSize > 0.0 and step > 0.0 and size > 2:
+            factor = max(1, min(int(voxelSize/step), size - 1))
+        factors.append(factor)
+
+    if ranges == [(0, resolution[axis]) for axis in range(3)] and factors == [1, 1, 1]:
+        return None
+
+    resampledResolution = []
+    resampledBBox = [0.0]*6
+    for axis in range(3):
+        (start, end) = ranges[axis]
+        size = (end - start + factors[axis] - 1)//factors[axis]
+        resampledResolution.append(size)
+
+        # Averaged voxels sit at the center of the voxels they average
+        resampledBBox[axis] = bbox[axis] + (start + (factors[axis] - 1)/2.0)*steps[axis]
+        resampledBBox[axis + 3] = resampledBBox[axis] + (size - 1)*factors[axis]*steps[axis]
+
+    cropped = grid[ranges[2][0]:ranges[2][1], ranges[1][0]:ranges[1][1], ranges[0][0]:ranges[0][1]]
+    resampled = mapVolume(resampledFilename, resampledResolution, channels, mode='w+')
+    kz = factors[2]
+    for z in range(0, resampledResolution[2], kVolumeSlabDepth):
+        block = numpy.asarray(cropped[z*kz:(z + kVolumeSlabDepth)*kz], dtype=numpy.float32)
+        if factors != [1, 1, 1]:
+            block = downsampleBlock(block, factors)
+        resampled[z:z + kVolumeSlabDepth] = block
+    resampled.flush()
+    del resampled
+    del grid
+
+    with open(resampledFilename, 'r+b') as volumeFile:
+        volumeFile.write(packVolumeHeader(resampledResolution, channels, resampledBBox))
+
+    return (resolution, tuple(resampledResolution))
+
+# Resampled volumes, named after the content of the volume they came from and
+# the settings used. Volumes that wouldn't change are marked, so they aren't
+# scanned again. Without NumPy, volumes are used as they are.
+class VolumeCache(object):
+    def __init__(self, cacheDir, crop=False, voxelSize=0.0):
+        self.cacheDir = cacheDir
+        self.crop = crop
+        self.voxelSize = voxelSize
+        self.resampled = 0
+        self.cacheHits = 0
+        self.voxelsBefore = 0
+        self.voxelsAfter = 0
+
+    def getKey(self, filename, crop):
+        key = hashlib.sha1()
+        key.update( ("%s %r %r" % (hashFile(filename), crop, self.voxelSize)).encode('utf-8') )
+        return key.hexdigest()
+
+    # Returns the file to render in place of a volume file. Only density grids
+    # are cropped, as zero is a meaningful value for other parameters.
+    def preprocess(self, filename, crop=True):
+        crop = crop and self.crop
+        if not numpy or not (crop or self.voxelSize > 0.0) or not os.path.exists(filename):
+            return filename
+
+        key = self.getKey(filename, crop)
+        resampledFilename = os.path.join(self.cacheDir, key + ".vol")
+        unchangedFilename = os.path.join(self.cacheDir, key + ".unchanged")
+        if os.path.exists(resampledFilename):
+            self.cacheHits += 1
+            return resampledFilename
+        if os.path.exists(unchangedFilename):
+            return filename
+
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        partialFilename = resampledFilename + ".partial"
+        resolutions = resampleVolume(filename, partialFilename, crop, self.voxelSize)
+        if not resolutions:
+            open(unchangedFilename, 'w').close()
+            return filename
+        os.rename(partialFilename, resampledFilename)
+
+        (before, after) = resolutions
+        self.resampled += 1
+        self.voxelsBefore += before[0]*before[1]*before[2]
+        self.voxelsAfter += after[0]*after[1]*after[2]
+        return resampledFilename
+
+    def formatReport(self):
+        return "Volumes - resampled : %d, voxels : %d to %d, cache hits : %d" % (
+            self.resampled, self.voxelsBefore, self.voxelsAfter, self.cacheHits)
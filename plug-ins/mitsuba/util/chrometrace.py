@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Collects timed spans as Chrome trace events. The JSON written by
+*stopTracing* can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Spans are only recorded between *startTracing* and *stopTracing*. Outside of
+that, *span* returns a context manager that does nothing, so instrumented code
+doesn't have to check whether tracing is on.
+"""
+
+import json
+import os
+import threading
+import time
+
+__author__ = 'Haarm-Pieter Duiker'
+__copyright__ = 'Copyright (C) 2015 - Duiker Research Corp'
+__license__ = ''
+__maintainer__ = 'Haarm-Pieter Duiker'
+__email__ = 'support@duikerresearch.org'
+__status__ = 'Production'
+
+__all__ = ['Tracer',
+           'startTracing',
+           'stopTracing',
+           'getTracer',
+           'span',
+           'traced',
+           'recordSpan',
+           'nameThread']
+
+
+def toMicroseconds(seconds):
+    return int(seconds * 1e6)
+
+
+class Span(object):
+    """
+    Records a complete event for the time spent in a *with* block.
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is not None:
+            self.args['exception'] = excType.__name__
+        self.tracer.addComplete(self.name, self.category, self.start,
+                                time.time(), args=self.args)
+        return False
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+class Tracer(object):
+    """
+    A thread safe list of trace events for the current process.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def addEvent(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def addComplete(self, name, category, start, end, tid=None, args=None):
+        """
+        Adds a complete event.
+
+        Parameters
+        ----------
+        name : unicode
+            Event name.
+        category : unicode
+            Event category, used for filtering in the viewer.
+        start : float
+            Start time in seconds since the epoch.
+        end : float
+            End time in seconds since the epoch.
+        tid : int, optional
+            Thread lane. Defaults to the calling thread.
+        args : dict, optional
+            Values shown with the selected event.
+        """
+
+        if tid is None:
+            tid = threading.current_thread().ident
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': toMicroseconds(start),
+                 'dur': max(0, toMicroseconds(end) - toMicroseconds(start)),
+                 'pid': self.pid,
+                 'tid': tid}
+        if args:
+            event['args'] = args
+        self.addEvent(event)
+
+    def nameThread(self, tid, name):
+        self.addEvent({'name': 'thread_name',
+                       'ph': 'M',
+                       'pid': self.pid,
+                       'tid': tid,
+                       'args': {'name': name}})
+
+    def span(self, name, category, args=None):
+        return Span(self, name, category, args or {})
+
+    def write(self, filename):
+        """
+        Writes the events in the Chrome trace event JSON object format.
+        """
+
+        with self.lock:
+            events = list(self.events)
+        events.sort(key=lambda x: x.get('ts', 0))
+
+        try:
+            with open(filename, 'w') as f:
+                json.dump({'traceEvents': events,
+                           'displayTimeUnit': 'ms'}, f)
+        except (IOError, OSError):
+            print('Unable to write trace : %s' % filename)
+            return False
+        return True
+
+
+_tracer = None
+
+
+def startTracing():
+    """
+    Starts recording spans, discarding any recorded earlier.
+    """
+
+    global _tracer
+    _tracer = Tracer()
+    _tracer.nameThread(threading.current_thread().ident, 'main')
+    return _tracer
+
+
+def stopTracing(filename=None):
+    """
+    Stops recording spans and writes them to *filename*, if specified.
+    """
+
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    if tracer and filename:
+        tracer.write(filename)
+    return tracer
+
+
+def getTracer():
+    return _tracer
+
+
+def span(name, category='mitsuba', **args):
+    """
+    Returns a context manager that records the time spent in its block.
+    """
+
+    tracer = _tracer
+    if tracer is None:
+        return NullSpan()
+    return tracer.span(name, category, args)
+
+
+def traced(category='mitsuba'):
+    """
+    Decorator recording a span for each call of the decorated function.
+    """
+
+    def decorator(function):
+        def tracedFunction(*args, **kwargs):
+            with span(function.__name__, category):
+                return function(*args, **kwargs)
+        tracedFunction.__name__ = function.__name__
+        tracedFunction.__doc__ = function.__doc__
+        return tracedFunction
+    return decorator
+
+
+def recordSpan(name, category, start, end, tid=None, args=None):
+    """
+    Records a span whose start and end, in seconds since the epoch, were
+    measured elsewhere. Used for the lifetime of child processes.
+    """
+
+    tracer = _tracer
+    if tracer is not None:
+        tracer.addComplete(name, category, start, end, tid, args)
+
+
+def nameThread(tid, name):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.nameThread(tid, name)
@@ -0,0 +1,734 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight, dependency free manipulation of the image files written by
+Mitsuba. Used to place cropped render region images back into the full frame
+without round tripping the pixels through an external tool.
+"""
+
+import array
+import os
+import struct
+import sys
+import zlib
+
+__author__ = 'Haarm-Pieter Duiker'
+__copyright__ = 'Copyright (C) 2015 - Duiker Research Corp'
+__license__ = ''
+__maintainer__ = 'Haarm-Pieter Duiker'
+__email__ = 'support@duikerresearch.org'
+__status__ = 'Production'
+
+__all__ = ['readEXRHeader',
+           'setEXRWindows',
+           'readPFM',
+           'writePFM',
+           'padPFM',
+           'pastePFM',
+           'blendPFM',
+           'differencePFM',
+           'readPNG',
+           'writePNG',
+           'padPNG',
+           'pastePNG',
+           'getImageResolution',
+           'pasteImage',
+           'resetDataWindow']
+
+#
+# OpenEXR
+#
+kEXRMagic = 20000630
+
+kEXRFlagTiled = 0x200
+kEXRFlagLongNames = 0x400
+kEXRFlagNonImage = 0x800
+kEXRFlagMultiPart = 0x1000
+
+# Number of scanlines stored in each chunk, indexed by compression type
+kEXRScanlinesPerChunk = {
+    0 : 1,   # NONE
+    1 : 1,   # RLE
+    2 : 1,   # ZIPS
+    3 : 16,  # ZIP
+    4 : 32,  # PIZ
+    5 : 16,  # PXR24
+    6 : 32,  # B44
+    7 : 32,  # B44A
+    8 : 32,  # DWAA
+    9 : 256, # DWAB
+}
+
+def _readNullTerminated(f):
+    chars = []
+    while True:
+        c = f.read(1)
+        if c in [b'', b'\x00']:
+            break
+        chars.append(c)
+    return b''.join(chars).decode('ascii')
+
+def readEXRHeader(filename):
+    """
+    Reads the header of a single part OpenEXR file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the OpenEXR file.
+
+    Returns
+    -------
+    dict or None
+        The version flags, the end of the header and, for each attribute,
+        its type, size and file offset. None if the file isn't an OpenEXR
+        file.
+    """
+
+    with open(filename, 'rb') as f:
+        magic, version = struct.unpack('<ii', f.read(8))
+        if magic != kEXRMagic:
+            return None
+
+        attributes = {}
+        while True:
+            name = _readNullTerminated(f)
+            if name == '':
+                break
+            typeName = _readNullTerminated(f)
+            size = struct.unpack('<i', f.read(4))[0]
+            attributes[name] = (typeName, size, f.tell())
+            f.seek(size, os.SEEK_CUR)
+
+        header = {
+            'flags' : version & ~0xff,
+            'headerEnd' : f.tell(),
+            'attributes' : attributes
+        }
+
+    return header
+
+def _readEXRAttribute(f, header, name, fmt):
+    typeName, size, offset = header['attributes'][name]
+    f.seek(offset)
+    return struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+
+def setEXRWindows(filename, dataWindow, displayWindow):
+    """
+    Rewrites the data and display windows of an OpenEXR file in place. The
+    pixel data isn't decoded. Scanline files have the y coordinate stored in
+    each chunk shifted to match the new data window.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the OpenEXR file.
+    dataWindow : tuple
+        xMin, yMin, xMax, yMax. Must have the size of the existing data window.
+    displayWindow : tuple
+        xMin, yMin, xMax, yMax.
+
+    Returns
+    -------
+    bool
+        True if the file was updated, False if the file layout isn't
+        supported.
+    """
+
+    header = readEXRHeader(filename)
+    if not header:
+        return False
+
+    if header['flags'] & (kEXRFlagNonImage | kEXRFlagMultiPart):
+        return False
+
+    attributes = header['attributes']
+    for name in ['dataWindow', 'displayWindow', 'compression']:
+        if name not in attributes:
+            return False
+
+    with open(filename, 'r+b') as f:
+        oldDataWindow = _readEXRAttribute(f, header, 'dataWindow', '<4i')
+        compression = _readEXRAttribute(f, header, 'compression', '<B')[0]
+
+        if ((oldDataWindow[2] - oldDataWindow[0]) != (dataWindow[2] - dataWindow[0]) or
+            (oldDataWindow[3] - oldDataWindow[1]) != (dataWindow[3] - dataWindow[1])):
+            return False
+
+        # Scanline chunks store their absolute y coordinate
+        if not (header['flags'] & kEXRFlagTiled):
+            if compression not in kEXRScanlinesPerChunk:
+                return False
+
+            deltaY = dataWindow[1] - oldDataWindow[1]
+            if deltaY != 0:
+                linesPerChunk = kEXRScanlinesPerChunk[compression]
+                lineCount = oldDataWindow[3] - oldDataWindow[1] + 1
+                chunkCount = (lineCount + linesPerChunk - 1) // linesPerChunk
+
+                f.seek(header['headerEnd'])
+                offsets = struct.unpack('<%dQ' % chunkCount, f.read(8*chunkCount))
+                for offset in offsets:
+                    f.seek(offset)
+                    y = struct.unpack('<i', f.read(4))[0]
+                    f.seek(offset)
+                    f.write(struct.pack('<i', y + deltaY))
+
+        f.seek(attributes['dataWindow'][2])
+        f.write(struct.pack('<4i', *dataWindow))
+        f.seek(attributes['displayWindow'][2])
+        f.write(struct.pack('<4i', *displayWindow))
+
+    return True
+
+#
+# Portable Float Map
+#
+def readPFM(filename):
+    """
+    Reads a Portable Float Map without decoding the pixel values.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the PFM file.
+
+    Returns
+    -------
+    tuple
+        width, height, channel count, scale and the raw, bottom to top
+        ordered, pixel data.
+    """
+
+    with open(filename, 'rb') as f:
+        tokens = []
+        while len(tokens) < 4:
+            line = f.readline()
+            if not line:
+                raise ValueError("Truncated PFM header : %s" % filename)
+            tokens.extend(line.split())
+        data = f.read()
+
+    identifier = tokens[0].decode('ascii')
+    if identifier == 'PF':
+        channels = 3
+    elif identifier == 'Pf':
+        channels = 1
+    else:
+        raise ValueError("Not a PFM file : %s" % filename)
+
+    width, height = int(tokens[1]), int(tokens[2])
+    scale = float(tokens[3])
+
+    return width, height, channels, scale, data
+
+def writePFM(filename, width, height, channels, scale, data):
+    """
+    Writes a Portable Float Map from raw, bottom to top ordered, pixel data.
+    """
+
+    identifier = 'PF' if channels == 3 else 'Pf'
+    with open(filename, 'wb') as f:
+        f.write(("%s\n%d %d\n%s\n" % (identifier, width, height, scale)).encode('ascii'))
+        f.write(data)
+
+def padPFM(filename, width, height, left, top):
+    """
+    Pads a cropped Portable Float Map to the full frame, in memory.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the PFM file.
+    width, height : int
+        Full frame resolution.
+    left, top : int
+        Position of the cropped image's top left pixel in the full frame.
+
+    Returns
+    -------
+    bool
+        True if the file was updated.
+    """
+
+    cropWidth, cropHeight, channels, scale, data = readPFM(filename)
+
+    pixelSize = 4*channels
+    cropStride = cropWidth*pixelSize
+    stride = width*pixelSize
+
+    # Only the columns of the cropped image that fall inside the frame
+    firstColumn = max(left, 0)
+    copyStride = (min(left + cropWidth, width) - firstColumn)*pixelSize
+    skip = (firstColumn - left)*pixelSize
+
+    padded = bytearray(stride*height)
+    for row in range(cropHeight):
+        if copyStride <= 0:
+            break
+        # Rows are stored bottom to top
+        sourceRow = cropHeight - 1 - row
+        targetRow = height - 1 - (top + row)
+        if targetRow < 0 or targetRow >= height:
+            continue
+        source = sourceRow*cropStride + skip
+        target = targetRow*stride + firstColumn*pixelSize
+        padded[target:target+copyStride] = data[source:source+copyStride]
+
+    writePFM(filename, width, height, channels, scale, bytes(padded))
+
+    return True
+
+def pastePFM(backgroundFilename, foregroundFilename, left, top, outputFilename):
+    """
+    Pastes one Portable Float Map over another, in memory. Both images must
+    have the same number of channels.
+
+    Returns
+    -------
+    bool
+        True if the output was written, False if the images don't match.
+    """
+
+    width, height, channels, scale, data = readPFM(backgroundFilename)
+    cropWidth, cropHeight, cropChannels, cropScale, cropData = readPFM(foregroundFilename)
+    if channels != cropChannels or (scale < 0) != (cropScale < 0):
+        return False
+
+    pixelSize = 4*channels
+    stride = width*pixelSize
+    cropStride = cropWidth*pixelSize
+    copyStride = min(cropWidth, width - left)*pixelSize
+    if copyStride <= 0:
+        return False
+
+    composite = bytearray(data)
+    for row in range(cropHeight):
+        sourceRow = cropHeight - 1 - row
+        targetRow = height - 1 - (top + row)
+        if targetRow < 0 or targetRow >= height:
+            continue
+        source = sourceRow*cropStride
+        target = targetRow*stride + left*pixelSize
+        composite[target:target+copyStride] = cropData[source:source+copyStride]
+
+    writePFM(outputFilename, width, height, channels, scale, bytes(composite))
+
+    return True
+
+def _floatArray(data, littleEndian):
+    values = array.array('f')
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if littleEndian != (sys.byteorder == 'little'):
+        values.byteswap()
+    return values
+
+def _floatBytes(values, littleEndian):
+    if littleEndian != (sys.byteorder == 'little'):
+        values = array.array('f', values)
+        values.byteswap()
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+def blendPFM(filenameA, filenameB, weightA, weightB, outputFilename):
+    """
+    Writes the weighted sum of two Portable Float Maps of the same layout.
+
+    Returns
+    -------
+    bool
+        True if the output was written, False if the images don't match.
+    """
+
+    width, height, channels, scale, data = readPFM(filenameA)
+    widthB, heightB, channelsB, scaleB, dataB = readPFM(filenameB)
+    if (width, height, channels) != (widthB, heightB, channelsB):
+        return False
+
+    valuesA = _floatArray(data, scale < 0)
+    valuesB = _floatArray(dataB, scaleB < 0)
+    blended = array.array('f', [a*weightA + b*weightB for (a, b) in zip(valuesA, valuesB)])
+
+    writePFM(outputFilename, width, height, channels, scale, _floatBytes(blended, scale < 0))
+
+    return True
+
+def differencePFM(filenameA, filenameB):
+    """
+    Compares two Portable Float Maps of the same layout.
+
+    Returns
+    -------
+    tuple or None
+        The mean of the squared differences and the mean of the two images,
+        over all pixels and channels. None if the images don't match.
+    """
+
+    width, height, channels, scale, data = readPFM(filenameA)
+    widthB, heightB, channelsB, scaleB, dataB = readPFM(filenameB)
+    if (width, height, channels) != (widthB, heightB, channelsB):
+        return None
+
+    valuesA = _floatArray(data, scale < 0)
+    valuesB = _floatArray(dataB, scaleB < 0)
+
+    squaredDifference = 0.0
+    total = 0.0
+    for (a, b) in zip(valuesA, valuesB):
+        squaredDifference += (a - b)*(a - b)
+        total += a + b
+
+    count = float(max(1, len(valuesA)))
+
+    return (squaredDifference/count, total/(2.0*count))
+
+#
+# Portable Network Graphics
+#
+kPNGSignature = b'\x89PNG\r\n\x1a\n'
+
+# Channels per pixel, indexed by color type
+kPNGChannels = {
+    0 : 1, # Greyscale
+    2 : 3, # RGB
+    3 : 1, # Palette
+    4 : 2, # Greyscale + alpha
+    6 : 4, # RGBA
+}
+
+def _readPNGChunks(filename):
+    with open(filename, 'rb') as f:
+        if f.read(8) != kPNGSignature:
+            return None
+
+        chunks = []
+        while True:
+            lengthBytes = f.read(4)
+            if len(lengthBytes) < 4:
+                break
+            length = struct.unpack('>I', lengthBytes)[0]
+            chunkType = f.read(4)
+            chunkData = f.read(length)
+            f.read(4)
+            chunks.append((chunkType, chunkData))
+            if chunkType == b'IEND':
+                break
+
+    return chunks
+
+def _writePNGChunk(f, chunkType, chunkData):
+    f.write(struct.pack('>I', len(chunkData)))
+    f.write(chunkType)
+    f.write(chunkData)
+    f.write(struct.pack('>I', zlib.crc32(chunkType + chunkData) & 0xffffffff))
+
+def _unfilterPNGScanlines(data, width, height, bytesPerPixel):
+    stride = width*bytesPerPixel
+    rows = []
+    prior = bytearray(stride)
+    position = 0
+    for y in range(height):
+        filterType = data[position]
+        line = data[position+1:position+1+stride]
+        position += stride + 1
+
+        if filterType == 1:
+            for i in range(bytesPerPixel, stride):
+                line[i] = (line[i] + line[i-bytesPerPixel]) & 0xff
+        elif filterType == 2:
+            for i in range(stride):
+                line[i] = (line[i] + prior[i]) & 0xff
+        elif filterType == 3:
+            for i in range(stride):
+                a = line[i-bytesPerPixel] if i >= bytesPerPixel else 0
+                line[i] = (line[i] + ((a + prior[i]) >> 1)) & 0xff
+        elif filterType == 4:
+            for i in range(stride):
+                a = line[i-bytesPerPixel] if i >= bytesPerPixel else 0
+                b = prior[i]
+                c = prior[i-bytesPerPixel] if i >= bytesPerPixel else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    predictor = a
+                elif pb <= pc:
+                    predictor = b
+                else:
+                    predictor = c
+                line[i] = (line[i] + predictor) & 0xff
+
+        rows.append(line)
+        prior = line
+
+    return rows
+
+def readPNG(filename):
+    """
+    Decodes a non-interlaced PNG with 8 or 16 bits per channel.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the PNG file.
+
+    Returns
+    -------
+    tuple or None
+        The IHDR values, the ancillary chunks, the bytes per pixel and the
+        unfiltered scanlines. None if the file layout isn't supported.
+    """
+
+    chunks = _readPNGChunks(filename)
+    if not chunks or chunks[0][0] != b'IHDR':
+        return None
+
+    ihdr = struct.unpack('>IIBBBBB', chunks[0][1])
+    width, height, bitDepth, colorType, compressionMethod, filterMethod, interlace = ihdr
+
+    if bitDepth not in [8, 16] or colorType not in kPNGChannels or interlace != 0:
+        return None
+
+    bytesPerPixel = kPNGChannels[colorType]*bitDepth//8
+    compressed = b''.join([chunkData for (chunkType, chunkData) in chunks if chunkType == b'IDAT'])
+    rows = _unfilterPNGScanlines(bytearray(zlib.decompress(compressed)),
+        width, height, bytesPerPixel)
+
+    ancillary = [chunk for chunk in chunks[1:] if chunk[0] not in [b'IDAT', b'IEND']]
+
+    return ihdr, ancillary, bytesPerPixel, rows
+
+def writePNG(filename, ihdr, ancillary, rows):
+    """
+    Writes unfiltered scanlines as a PNG. Every scanline uses the 'None'
+    filter.
+    """
+
+    data = bytearray()
+    for row in rows:
+        data.append(0)
+        data.extend(row)
+
+    with open(filename, 'wb') as f:
+        f.write(kPNGSignature)
+        _writePNGChunk(f, b'IHDR', struct.pack('>IIBBBBB', *ihdr))
+        for chunkType, chunkData in ancillary:
+            _writePNGChunk(f, chunkType, chunkData)
+        _writePNGChunk(f, b'IDAT', zlib.compress(bytes(data)))
+        _writePNGChunk(f, b'IEND', b'')
+
+def _pasteRows(targetRows, sourceRows, left, top, bytesPerPixel):
+    for row in range(len(sourceRows)):
+        targetRow = top + row
+        if targetRow < 0 or targetRow >= len(targetRows):
+            continue
+        target = left*bytesPerPixel
+        source = sourceRows[row][:len(targetRows[targetRow]) - target]
+        targetRows[targetRow][target:target+len(source)] = source
+
+def padPNG(filename, width, height, left, top):
+    """
+    Pads a cropped PNG to the full frame, in memory. Only non-interlaced
+    images with 8 or 16 bits per channel are supported.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the PNG file.
+    width, height : int
+        Full frame resolution.
+    left, top : int
+        Position of the cropped image's top left pixel in the full frame.
+
+    Returns
+    -------
+    bool
+        True if the file was updated, False if the file layout isn't
+        supported.
+    """
+
+    image = readPNG(filename)
+    if not image:
+        return False
+
+    ihdr, ancillary, bytesPerPixel, rows = image
+
+    padded = [bytearray(width*bytesPerPixel) for row in range(height)]
+    _pasteRows(padded, rows, left, top, bytesPerPixel)
+
+    writePNG(filename, (width, height) + ihdr[2:], ancillary, padded)
+
+    return True
+
+def pastePNG(backgroundFilename, foregroundFilename, left, top, outputFilename):
+    """
+    Pastes one PNG over another, in memory. Both images must share their
+    pixel layout.
+
+    Returns
+    -------
+    bool
+        True if the output was written, False if the images aren't supported
+        or don't match.
+    """
+
+    background = readPNG(backgroundFilename)
+    foreground = readPNG(foregroundFilename)
+    if not background or not foreground:
+        return False
+
+    if background[0][2:] != foreground[0][2:]:
+        return False
+
+    ihdr, ancillary, bytesPerPixel, rows = background
+    _pasteRows(rows, foreground[3], left, top, bytesPerPixel)
+
+    writePNG(outputFilename, ihdr, ancillary, rows)
+
+    return True
+
+#
+# Dispatch
+#
+def getImageResolution(filename):
+    """
+    Returns the full frame resolution of an image, read from its header.
+
+    Returns
+    -------
+    tuple or None
+        width, height. None if the format isn't supported.
+    """
+
+    extension = os.path.splitext(filename)[-1].lower()
+
+    try:
+        if extension == ".exr":
+            header = readEXRHeader(filename)
+            if not header or 'displayWindow' not in header['attributes']:
+                return None
+            with open(filename, 'rb') as f:
+                xMin, yMin, xMax, yMax = _readEXRAttribute(f, header, 'displayWindow', '<4i')
+            return (xMax - xMin + 1, yMax - yMin + 1)
+
+        elif extension == ".pfm":
+            with open(filename, 'rb') as f:
+                tokens = []
+                while len(tokens) < 3:
+                    line = f.readline()
+                    if not line:
+                        return None
+                    tokens.extend(line.split())
+            return (int(tokens[1]), int(tokens[2]))
+
+        elif extension == ".png":
+            chunks = _readPNGChunks(filename)
+            if not chunks or chunks[0][0] != b'IHDR':
+                return None
+            return struct.unpack('>II', chunks[0][1][:8])
+
+        elif extension in [".jpg", ".jpeg"]:
+            with open(filename, 'rb') as f:
+                if f.read(2) != b'\xff\xd8':
+                    return None
+                while True:
+                    marker, segmentType, length = struct.unpack('>BBH', f.read(4))
+                    if marker != 0xff:
+                        return None
+                    # Start of frame segments, excluding DHT, JPG and DAC
+                    if 0xc0 <= segmentType <= 0xcf and segmentType not in [0xc4, 0xc8, 0xcc]:
+                        precision, height, width = struct.unpack('>BHH', f.read(5))
+                        return (width, height)
+                    f.seek(length - 2, os.SEEK_CUR)
+
+        elif extension in [".hdr", ".rgbe"]:
+            with open(filename, 'rb') as f:
+                for line in f:
+                    tokens = line.split()
+                    # Resolution line, ex. -Y 512 +X 768
+                    if len(tokens) == 4 and tokens[0] in [b'-Y', b'+Y'] and tokens[2] in [b'-X', b'+X']:
+                        return (int(tokens[3]), int(tokens[1]))
+                    if len(line) > 256:
+                        return None
+
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+    return None
+
+def pasteImage(backgroundFilename, foregroundFilename, left, top, outputFilename):
+    """
+    Pastes a cropped image over a full frame image of the same format, in
+    memory. PNG and PFM images are supported.
+
+    Returns
+    -------
+    bool
+        True if the output was written, False if the format isn't supported
+        and another tool has to be used.
+    """
+
+    extension = os.path.splitext(foregroundFilename)[-1].lower()
+    if os.path.splitext(backgroundFilename)[-1].lower() != extension:
+        return False
+
+    try:
+        if extension == ".pfm":
+            return pastePFM(backgroundFilename, foregroundFilename, left, top, outputFilename)
+
+        elif extension == ".png":
+            return pastePNG(backgroundFilename, foregroundFilename, left, top, outputFilename)
+
+    except (IOError, OSError, ValueError, struct.error, zlib.error):
+        return False
+
+    return False
+
+def resetDataWindow(filename, width, height, left, top):
+    """
+    Places a cropped image in the full frame. OpenEXR files only have their
+    header rewritten. PNG and PFM files are padded in memory.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the cropped image.
+    width, height : int
+        Full frame resolution.
+    left, top : int
+        Position of the cropped image's top left pixel in the full frame.
+
+    Returns
+    -------
+    bool
+        True if the image was handled, False if the format isn't supported and
+        another tool has to be used.
+    """
+
+    extension = os.path.splitext(filename)[-1].lower()
+
+    try:
+        if extension == ".exr":
+            header = readEXRHeader(filename)
+            if not header or 'dataWindow' not in header['attributes']:
+                return False
+            with open(filename, 'rb') as f:
+                xMin, yMin, xMax, yMax = _readEXRAttribute(f, header, 'dataWindow', '<4i')
+            dataWindow = (left, top, left + xMax - xMin, top + yMax - yMin)
+            displayWindow = (0, 0, width-1, height-1)
+            return setEXRWindows(filename, dataWindow, displayWindow)
+
+        elif extension == ".pfm":
+            return padPFM(filename, width, height, left, top)
+
+        elif extension == ".png":
+            return padPNG(filename, width, height, left, top)
+
+    except (IOError, OSError, ValueError, struct.error, zlib.error):
+        return False
+
+    return False
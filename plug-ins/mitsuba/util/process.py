@@ -14,8 +14,11 @@ import os
 import optparse
 import platform
 import sys
+import time
 import traceback
 
+import chrometrace
+
 try:
     import subprocess as sp
 except:
@@ -189,6 +192,9 @@ class Process:
         self.non_blocking = non_blocking
         self.finish_callback = None
 
+        self.pid = None
+        self.trace_start = None
+
     def get_elapsed_seconds(self):
         """
         Object description.
@@ -438,6 +444,7 @@ class Process:
         """
 
         self.start = datetime.datetime.now()
+        self.trace_start = time.time()
         self.log = []
 
         cmdargs = [self.cmd]
@@ -481,6 +488,7 @@ class Process:
 
                 stdout = process.stdout
                 stdin = process.stdin
+                self.pid = process.pid
 
                 #pid = process.pid
                 #self.log_line('process id %s\n' % pid)
@@ -509,6 +517,7 @@ class Process:
 
     def _processFinish(self, process_stdout, nbsr=None):
         self.end = datetime.datetime.now()
+        self._trace_lifetime()
         self._cleanupWrapper()
 
         if self.non_blocking and nbsr:
@@ -517,6 +526,22 @@ class Process:
         if self.finish_callback:
             self.finish_callback()
 
+    def _trace_lifetime(self):
+        """
+        Records the lifetime of the child process on a trace lane of its own.
+        """
+
+        if chrometrace.getTracer() is None or self.trace_start is None:
+            return
+
+        tid = self.pid if self.pid is not None else id(self)
+        chrometrace.nameThread(tid, '%s (pid %s)' % (self.description, self.pid))
+        chrometrace.recordSpan(self.description, 'process', self.trace_start,
+                               time.time(), tid,
+                               {'cmd': self.cmd,
+                                'args': ' '.join(self.args),
+                                'status': self.status})
+
     def _cleanupWrapper(self):
         if self.batch_wrapper and tmp_wrapper:
             try: